@@ -0,0 +1,301 @@
+import sys
+import json
+import time
+import functools
+import logging
+import statistics
+import subprocess
+
+from funding_bot.configs.base import Configuration
+from funding_bot.bot.account import Account
+from funding_bot.bot.codec import build_codec, get_available_codecs, get_codec
+from funding_bot.bot.funding import FundingBot
+from funding_bot.bot.signing import NonceGenerator, RequestSigner, encode_body
+from funding_bot.bot.tracker import Tracker, RateData
+from funding_bot.mock.server import MockOffer, get_offer_row, get_credit_row
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Each benchmark is timed over REPEATS rounds of at least MINIMUM_ROUND_TIME seconds
+REPEATS = 5
+# Starting an interpreter is noisier, its best time is taken over more rounds
+STARTUP_REPEATS = 20
+MINIMUM_ROUND_TIME = 0.1
+# A benchmark regresses when its best time is this much slower than the baseline
+DEFAULT_THRESHOLD = 0.1
+
+# Only imported by the commands that use them, never on CLI start
+LAZY_MODULES = [
+    "boto3",
+    "sentry_sdk",
+    "requests",
+    "tabulate",
+    "pkg_resources",
+    "numpy",
+    "websocket",
+    "funding_bot.bot.runner",
+]
+STARTUP_BENCHMARK = "cli_startup"
+
+# Rows in the wallet, offer and credit payloads, about what a busy account returns
+PAYLOAD_ROWS = 100
+
+
+class Benchmark(NamedTuple):
+    name: str
+    function: Callable[[], Any]
+    repeats: int = REPEATS
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    best: float
+    median: float
+    baseline: Optional[float]
+
+    def get_change(self) -> Optional[float]:
+        if not self.baseline:
+            return None
+        return self.best / self.baseline - 1
+
+    def is_regression(self, threshold: float) -> bool:
+        change = self.get_change()
+        return change is not None and change > threshold
+
+
+class BenchConfiguration(Configuration):
+    @classmethod
+    def get_api_key(cls) -> str:
+        return "bench"
+
+    @classmethod
+    def get_api_secret_key(cls) -> str:
+        return "bench"
+
+    @classmethod
+    def get_initial_balance(cls) -> Dict[str, float]:
+        return {"fUSD": 10000}
+
+    @classmethod
+    def get_minimum_lending_rate(cls) -> Dict[str, int]:
+        return {}
+
+    @classmethod
+    def get_maximum_lending_amount(cls) -> Dict[str, int]:
+        return {"fUSD": 20000}
+
+    @classmethod
+    def get_funding_currencies(cls) -> List[str]:
+        return ["fUSD"]
+
+
+def get_offers(count: int) -> List[MockOffer]:
+    return [
+        MockOffer(
+            id=100000 + index,
+            currency="fUSD",
+            amount=50.0 + index,
+            rate=0.0003,
+            period=2,
+            mts_created=1600000000000 + index,
+        )
+        for index in range(count)
+    ]
+
+
+def run_cli_help():
+    # A fresh interpreter, so the time includes every import the CLI makes on start
+    subprocess.run(
+        [sys.executable, "-m", "funding_bot.cli", "--help"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def get_eager_imports() -> List[str]:
+    # The LAZY_MODULES a fresh interpreter has loaded after importing the CLI
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, funding_bot.cli; print('\\n'.join(sys.modules))",
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout
+    modules = set(output.split())
+    return [module for module in LAZY_MODULES if module in modules]
+
+
+def get_benchmarks(logger: logging.Logger) -> List[Benchmark]:
+    signer = RequestSigner("bench", "bench" * 8, nonces=NonceGenerator())
+    offer_body = {
+        "type": "LIMIT",
+        "symbol": "fUSD",
+        "amount": "100.00000",
+        "rate": "0.0003",
+        "period": 2,
+        "flags": 0,
+    }
+    offer_request = encode_body(offer_body)
+
+    # Response bodies as the transport returns them, decoded with the configured codec
+    codec = get_codec()
+    offers = get_offers(PAYLOAD_ROWS)
+    wallet_payload = codec.dumps(
+        [["funding", f"C{index}", 1000.0, 0, 1000.0] for index in range(PAYLOAD_ROWS)]
+    )
+    offer_payload = codec.dumps(
+        [get_offer_row(offer, "ACTIVE", offer.mts_created) for offer in offers]
+    )
+    credit_payload = codec.dumps(
+        [get_credit_row(offer, offer.mts_created) for offer in offers]
+    )
+    credits = FundingBot.parse_active_funding_data(codec.loads(credit_payload))
+
+    tracker = Tracker("fUSD", logger)
+    rate_data = RateData(
+        flash_return_rate=0.0003,
+        bid=0.00029,
+        bid_period=30,
+        ask=0.00031,
+        ask_period=2,
+        last=0.0003,
+        high=0.00033,
+        low=0.00027,
+    )
+    tracker.add_rate_data(rate_data)
+
+    account = Account(BenchConfiguration(), logger)
+    account.update_available_funding("fUSD", 1000)
+
+    # Every installed codec decoding the same credit payload, to compare them
+    codec_benchmarks = [
+        Benchmark(
+            name=f"load_funding_credits_{name}",
+            function=functools.partial(build_codec(name).loads, credit_payload),
+        )
+        for name in get_available_codecs()
+    ]
+
+    return codec_benchmarks + [
+        Benchmark(
+            name="get_signature",
+            function=lambda: signer.get_signature(
+                "v2/auth/w/funding/offer/submit", "1", offer_request
+            ),
+        ),
+        Benchmark(
+            name="sign_request",
+            function=lambda: signer.build("v2/auth/w/funding/offer/submit", offer_body),
+        ),
+        Benchmark(
+            name="render_wallet_status",
+            function=lambda: FundingBot.format_wallet_status(
+                codec.loads(wallet_payload)
+            ),
+        ),
+        Benchmark(
+            name="decode_funding_offers",
+            function=lambda: FundingBot.parse_active_funding_offer_data(
+                codec.loads(offer_payload)
+            ),
+        ),
+        Benchmark(
+            name="decode_funding_credits",
+            function=lambda: FundingBot.parse_active_funding_data(
+                codec.loads(credit_payload)
+            ),
+        ),
+        Benchmark(
+            name="aggregate_rate_data",
+            function=lambda: (
+                tracker.add_rate_data(rate_data),
+                tracker.aggregate_rate_data(),
+            ),
+        ),
+        Benchmark(
+            name="apply_credit_snapshot",
+            function=lambda: account.update_current_active_funding(
+                credits, currency="fUSD"
+            ),
+        ),
+        Benchmark(
+            name="generate_lending_offer",
+            function=lambda: account.generate_lending_offer("fUSD", 0.0005),
+        ),
+        Benchmark(
+            name="render_order_report",
+            function=lambda: FundingBot.format_active_funding_data(credits),
+        ),
+        Benchmark(
+            name=STARTUP_BENCHMARK, function=run_cli_help, repeats=STARTUP_REPEATS
+        ),
+    ]
+
+
+def time_benchmark(
+    benchmark: Benchmark, baseline: Optional[float] = None
+) -> BenchmarkResult:
+    # Calls per round grow until a round takes MINIMUM_ROUND_TIME, like timeit
+    iterations = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            benchmark.function()
+        if time.perf_counter() - started_at >= MINIMUM_ROUND_TIME:
+            break
+        iterations *= 2
+
+    timings: List[float] = []
+    for _ in range(benchmark.repeats):
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            benchmark.function()
+        timings.append((time.perf_counter() - started_at) / iterations)
+
+    return BenchmarkResult(
+        name=benchmark.name,
+        iterations=iterations,
+        best=min(timings),
+        median=statistics.median(timings),
+        baseline=baseline,
+    )
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]):
+    # Best time per call of every benchmark, in seconds
+    with open(path, "w") as f:
+        json.dump({result.name: result.best for result in results}, f, indent=2)
+
+
+def run_benchmarks(
+    logger: logging.Logger,
+    pattern: Optional[str] = None,
+    baseline: Optional[Dict[str, float]] = None,
+) -> List[BenchmarkResult]:
+    baseline = baseline or {}
+    return [
+        time_benchmark(benchmark, baseline.get(benchmark.name))
+        for benchmark in get_benchmarks(logger)
+        if not pattern or pattern in benchmark.name
+    ]
+
+
+__all__ = [
+    "Benchmark",
+    "BenchmarkResult",
+    "DEFAULT_THRESHOLD",
+    "STARTUP_BENCHMARK",
+    "get_eager_imports",
+    "run_benchmarks",
+    "load_baseline",
+    "save_baseline",
+]
@@ -1,14 +1,14 @@
-import boto3
 import logging
 
 import datetime as dt
 
-from botocore.exceptions import ClientError, NoCredentialsError
+from funding_bot.bot.positions import PositionBook
 
 from typing import List, Dict, NamedTuple, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from funding_bot.configs.base import Configuration
+    from funding_bot.bot.balances import BalanceBackend
     from funding_bot.bot.funding import ActiveFundingData, ActiveFundingOfferData
 
 
@@ -36,57 +36,64 @@ MIN_FUNDING_AMOUNT = {
     "fBTC": 0.01,
 }
 
+# (Annual rate in percent the offer must exceed, lending period in days), highest first
+LENDING_PERIOD_TIERS = [
+    (30, 30),
+    (25, 20),
+    (20, 10),
+    (15, 5),
+]
+DEFAULT_LENDING_PERIOD = 2
 
-def get_initial_start_data(
-    currency: str, table_name: Optional[str], logger: logging.Logger
-) -> Optional[FundingData]:
-    if table_name:
-        aws_context = boto3.resource("dynamodb", region_name="ap-southeast-2")
-        try:
-            initial_balance_data = aws_context.Table(table_name).get_item(
-                Key={"Key": currency}
-            )
+# Below this annual rate in percent only the minimum amount is offered at a time
+FULL_AMOUNT_MINIMUM_RATE = 15
 
-            return FundingData(
-                date=dt.datetime.strptime(
-                    initial_balance_data["Item"]["Date"], "%m-%d-%Y"
-                ).date(),
-                initial_balance=float(initial_balance_data["Item"]["InitialBalance"]),
-            )
-        except ClientError as e:
-            logger.debug(f"Failed to fetch balance for {currency}")
-            return None
-        except NoCredentialsError:
-            logger.debug("No AWS Credential Setup")
-            return None
 
-    return None
+def get_lending_period(offer_rate: float) -> int:
+    for minimum_rate, days in LENDING_PERIOD_TIERS:
+        if offer_rate * 36500 > minimum_rate:
+            return days
+    return DEFAULT_LENDING_PERIOD
 
 
 class Account(object):
-    def __init__(self, configuration: "Configuration", logger: logging.Logger):
+    def __init__(
+        self,
+        configuration: "Configuration",
+        logger: logging.Logger,
+        balances: Optional["BalanceBackend"] = None,
+    ):
         self._maximum_lending_amount = configuration.get_maximum_lending_amount()
         self._minimum_lending_rate = {
             currency: round(rate / 36500, 7)
             for currency, rate in configuration.get_minimum_lending_rate().items()
         }
-        self._current_active_funding: List["ActiveFundingData"] = []
-        self._current_pending_funding: List["ActiveFundingOfferData"] = []
-
-        self._current_lend_amount: float = 0
-        self._current_pending_amount: float = 0
+        self._minimum_funding_amount: Dict[str, float] = {
+            **MIN_FUNDING_AMOUNT,
+            **configuration.get_minimum_funding_amount(),
+        }
+        # Lent and offered amounts by currency, the maximum lending amount of a
+        # currency is checked against its own positions only
+        self._active_funding: PositionBook["ActiveFundingData"] = PositionBook()
+        self._pending_funding: PositionBook["ActiveFundingOfferData"] = PositionBook()
         self._available_fundings: Dict[str, float] = dict()
+
+        # Every currency is loaded at once, the configured values fill in the missing ones
+        funding_currencies = configuration.get_funding_currencies()
+        states = balances.load(funding_currencies) if balances else {}
         self._initial_balance = {
-            currency: get_initial_start_data(
-                currency, configuration.get_dynamodb_table_name(), logger
+            currency: FundingData(
+                date=states[currency].date,
+                initial_balance=states[currency].initial_balance,
             )
-            or FundingData(
+            if currency in states
+            else FundingData(
                 date=configuration.get_funding_start_date()  # type: ignore
                 if configuration.get_funding_start_date() is not None
                 else dt.datetime.now().date(),
                 initial_balance=configuration.get_initial_balance()[currency],
             )
-            for currency in configuration.get_funding_currencies()
+            for currency in funding_currencies
         }
 
     def get_initial_balance(self, currency: str) -> FundingData:
@@ -95,36 +102,55 @@ class Account(object):
     def get_minimum_daily_lending_rate(self, currency: str) -> float:
         return self._minimum_lending_rate.get(currency, -1)
 
+    def get_minimum_funding_amount(self, currency: str) -> float:
+        return self._minimum_funding_amount[currency]
+
     def get_maximum_lending_amount(self, currency: str) -> float:
         return self._maximum_lending_amount.get(currency, -1)
 
-    def get_active_funding_data(self) -> List["ActiveFundingData"]:
-        return list(self._current_active_funding)
+    def get_active_funding_data(
+        self, currency: Optional[str] = None
+    ) -> List["ActiveFundingData"]:
+        return self._active_funding.get_positions(currency)
+
+    def get_pending_funding(
+        self, currency: Optional[str] = None
+    ) -> List["ActiveFundingOfferData"]:
+        return self._pending_funding.get_positions(currency)
+
+    def get_lent_amount(self, currency: str) -> float:
+        return self._active_funding.get_total(currency)
 
-    def get_pending_funding(self) -> List["ActiveFundingOfferData"]:
-        return list(self._current_pending_funding)
+    def get_pending_amount(self, currency: str) -> float:
+        return self._pending_funding.get_total(currency)
 
     def update_current_active_funding(
-        self, active_funding_data: List["ActiveFundingData"]
+        self,
+        active_funding_data: List["ActiveFundingData"],
+        currency: Optional[str] = None,
     ):
-        self._current_active_funding = active_funding_data
-        self._repopulate_lending_amount()
+        # A snapshot of the credits of currency, or of every currency
+        self._active_funding.replace(active_funding_data, currency=currency)
 
     def update_current_pending_offers(
-        self, active_offer_data: List["ActiveFundingOfferData"]
+        self,
+        active_offer_data: List["ActiveFundingOfferData"],
+        currency: Optional[str] = None,
     ):
-        self._current_pending_funding = active_offer_data
-        self._repopulate_pending_amount()
+        # A snapshot of the offers of currency, or of every currency
+        self._pending_funding.replace(active_offer_data, currency=currency)
 
-    def _repopulate_lending_amount(self):
-        self._current_lend_amount = sum(
-            [active_funding.amount for active_funding in self.get_active_funding_data()]
-        )
+    def update_active_funding(self, active_funding: "ActiveFundingData"):
+        self._active_funding.update(active_funding)
 
-    def _repopulate_pending_amount(self):
-        self._current_pending_amount = sum(
-            [pending_offer.amount for pending_offer in self.get_pending_funding()]
-        )
+    def remove_active_funding(self, currency: str, id_: str):
+        self._active_funding.remove(currency, id_)
+
+    def update_pending_offer(self, pending_offer: "ActiveFundingOfferData"):
+        self._pending_funding.update(pending_offer)
+
+    def remove_pending_offer(self, currency: str, id_: str):
+        self._pending_funding.remove(currency, id_)
 
     def get_available_fundings(self) -> Dict[str, float]:
         return dict(self._available_fundings)
@@ -137,35 +163,34 @@ class Account(object):
             available_funding = min(
                 available_funding,
                 maximum_lending_amount
-                - self._current_lend_amount
-                - self._current_pending_amount,
+                - self.get_lent_amount(currency)
+                - self.get_pending_amount(currency),
             )
             if available_funding < 0:
                 return 0
             return available_funding
         return available_funding
 
+    def get_available_funding(self, currency: str) -> float:
+        return self._available_fundings.get(currency, 0)
+
     def update_available_funding(self, currency: str, amount: float):
         self._available_fundings[currency] = amount
 
     def generate_lending_offer(
         self, currency: str, offer_rate: float
     ) -> Optional[LendingOffer]:
-        if self.get_funding_for_offer(currency) >= MIN_FUNDING_AMOUNT[currency]:
-            days = 2
-            if offer_rate * 36500 > 30:
-                days = 30
-            elif offer_rate * 36500 > 25:
-                days = 20
-            elif offer_rate * 36500 > 20:
-                days = 10
-            elif offer_rate * 36500 > 15:
-                days = 5
+        minimum_amount = self.get_minimum_funding_amount(currency)
+        if self.get_funding_for_offer(currency) >= minimum_amount:
+            days = get_lending_period(offer_rate)
 
             amount = self.get_funding_for_offer(currency)
 
-            if amount / MIN_FUNDING_AMOUNT[currency] > 2 and offer_rate * 36500 < 15:
-                amount = MIN_FUNDING_AMOUNT[currency]
+            if (
+                amount / minimum_amount > 2
+                and offer_rate * 36500 < FULL_AMOUNT_MINIMUM_RATE
+            ):
+                amount = minimum_amount
 
             amount_str = ("%.6f" % abs(amount))[
                 :-1
@@ -180,21 +205,17 @@ class Account(object):
     def regenerate_lending_offer(
         self, currency: str, offer_rate: float, funding_amount: str
     ) -> Optional[LendingOffer]:
-        if float(funding_amount) >= MIN_FUNDING_AMOUNT[currency]:
-            days = 2
-            if offer_rate * 36500 > 30:
-                days = 30
-            elif offer_rate * 36500 > 25:
-                days = 20
-            elif offer_rate * 36500 > 20:
-                days = 10
-            elif offer_rate * 36500 > 15:
-                days = 5
+        minimum_amount = self.get_minimum_funding_amount(currency)
+        if float(funding_amount) >= minimum_amount:
+            days = get_lending_period(offer_rate)
 
             amount = float(funding_amount)
 
-            if amount / MIN_FUNDING_AMOUNT[currency] > 2 and offer_rate * 36500 < 15:
-                amount = MIN_FUNDING_AMOUNT[currency]
+            if (
+                amount / minimum_amount > 2
+                and offer_rate * 36500 < FULL_AMOUNT_MINIMUM_RATE
+            ):
+                amount = minimum_amount
 
             amount_str = ("%.6f" % abs(amount))[
                 :-1
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from funding_bot.configs.base import Configuration
+from funding_bot.bot.cache import get_snapshot_cache
+from funding_bot.bot.notifier import get_notifier
+from funding_bot.bot.tracker import Tracker
+from funding_bot.bot.tracing import get_tracer
+from funding_bot.bot.ratelimit import PUBLIC_SCOPE
+from funding_bot.bot.transport import get_transport
+from funding_bot.bot.runner import (
+    MIN_LOOP_INTERVAL,
+    NOTIFIER_SHUTDOWN_TIMEOUT,
+    RunnerContext,
+    start_runner,
+    process_currency,
+    send_summary_report,
+)
+
+from typing import Any, Callable, Optional, Type
+
+# Seconds between two hourly summaries / funding reports
+REPORT_INTERVAL = 3600
+
+
+async def run_blocking(
+    executor: ThreadPoolExecutor, function: Callable[..., Any], *args: Any
+) -> Any:
+    # FundingBot and Tracker talk to the exchange through the pooled blocking
+    # transport, each call runs on its own worker so pipelines do not wait on each other
+    return await asyncio.get_event_loop().run_in_executor(executor, function, *args)
+
+
+def update_candles(rate_tracker: Tracker):
+    with get_tracer().trace("rate_update", currency=rate_tracker.get_currency()):
+        rate_tracker.update_candles()
+
+
+def get_pipeline_delay(*scopes: str) -> float:
+    # The pipelines share the budgets of their scopes and run out of step, so no
+    # pipeline restarts the tick. The delay keeps every request made since the runner
+    # started, by all pipelines together, within the budgets
+    scheduler = get_transport().get_scheduler()
+    return max(
+        scheduler.get_loop_delay(minimum=MIN_LOOP_INTERVAL, scope=scope)
+        for scope in scopes
+    )
+
+
+async def market_data_pipeline(context: RunnerContext, executor: ThreadPoolExecutor):
+    while True:
+        await run_blocking(executor, context.market_data.update_tickers)
+        await asyncio.sleep(get_pipeline_delay(PUBLIC_SCOPE))
+
+
+async def currency_pipeline(
+    context: RunnerContext, currency: str, executor: ThreadPoolExecutor, stream: bool
+):
+    rate_tracker = context.market_data.get_tracker(currency)
+
+    while True:
+        if not stream:
+            await run_blocking(executor, update_candles, rate_tracker)
+        # Each iteration of a pipeline is a tick of its own, it reads the balances and
+        # offers again even when another pipeline read them a moment ago
+        get_snapshot_cache().start_tick(context.credentials.api_key)
+        await run_blocking(executor, process_currency, context, currency)
+        await asyncio.sleep(
+            get_pipeline_delay(PUBLIC_SCOPE, context.credentials.api_key)
+        )
+
+
+async def summary_report_pipeline(context: RunnerContext, executor: ThreadPoolExecutor):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        await run_blocking(executor, send_summary_report, context)
+
+
+async def funding_report_pipeline(context: RunnerContext, executor: ThreadPoolExecutor):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        await run_blocking(
+            executor,
+            context.bot.generate_report,
+            context.credentials,
+            context.funding_currencies,
+            context.logger,
+        )
+
+
+async def run_pipelines(
+    context: RunnerContext, executor: ThreadPoolExecutor, stream: bool
+):
+    pipelines = [
+        summary_report_pipeline(context, executor),
+        funding_report_pipeline(context, executor),
+    ]
+    if not stream:
+        pipelines.append(market_data_pipeline(context, executor))
+
+    for currency in context.funding_currencies:
+        pipelines.append(currency_pipeline(context, currency, executor, stream))
+
+    await asyncio.gather(*pipelines)
+
+
+def async_runner(
+    logger: logging.Logger,
+    stream: bool = False,
+    configuration: Optional[Type[Configuration]] = None,
+    metrics_port: Optional[int] = None,
+    marketd: Optional[str] = None,
+):
+    context = start_runner(
+        logger,
+        stream=stream,
+        configuration=configuration,
+        metrics_port=metrics_port,
+        marketd=marketd,
+    )
+    # Rates streamed or sent by the market data daemon need no polling
+    pushed = stream or marketd is not None
+    get_transport().get_scheduler().start_tick()
+    executor = ThreadPoolExecutor(
+        max_workers=len(context.funding_currencies) + 3,
+        thread_name_prefix="FundingBot",
+    )
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(run_pipelines(context, executor, pushed))
+    finally:
+        executor.shutdown(wait=False)
+        loop.close()
+        get_notifier().close(timeout=NOTIFIER_SHUTDOWN_TIMEOUT)
+        context.market_data.close()
+
+
+__all__ = [
+    "async_runner",
+]
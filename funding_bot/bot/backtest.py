@@ -0,0 +1,227 @@
+import json
+import heapq
+import numpy as np
+
+from numpy.lib.stride_tricks import as_strided
+
+from funding_bot.bot.account import (
+    MIN_FUNDING_AMOUNT,
+    LENDING_PERIOD_TIERS,
+    DEFAULT_LENDING_PERIOD,
+    FULL_AMOUNT_MINIMUM_RATE,
+)
+from funding_bot.bot.tracker import (
+    CANDLE_PERIODS,
+    FIVE_MINUTE_PERIOD,
+    OFFER_RATE_FACTOR,
+    THIRTY_MINUTE_PERIOD,
+)
+
+from typing import List, NamedTuple, Tuple
+
+MINUTE = 60000
+
+# Durations of the candles the offer rates are taken from and the age at which the
+# runner cancels an offer and resubmits it at the 5 minutes rate, in minutes
+SUBMIT_WINDOW = CANDLE_PERIODS[THIRTY_MINUTE_PERIOD][0]
+RESUBMIT_WINDOW = CANDLE_PERIODS[FIVE_MINUTE_PERIOD][0]
+OFFER_EXPIRY = 60
+
+
+class BacktestResult(NamedTuple):
+    currency: str
+    minutes: int
+    offers_submitted: int
+    offers_filled: int
+    fill_rate: float
+    weighted_average_rate: float
+    idle_time: float
+    interest: float
+
+
+def load_candles(path: str) -> np.ndarray:
+    # 1 minute funding candles as exported from the candles/.../hist end point, either a
+    # JSON list or a CSV file of MTS, OPEN, CLOSE, HIGH, LOW, VOLUME rows
+    with open(path) as f:
+        if path.endswith(".json"):
+            candles = np.array(json.load(f), dtype=np.float64)
+        else:
+            lines = f.read().strip().splitlines()
+            if lines and not lines[0][:1].isdigit():
+                lines = lines[1:]  # Header row
+            candles = np.fromstring(",".join(lines), sep=",")
+
+    candles = candles.reshape(-1, 6)
+    return candles[np.argsort(candles[:, 0], kind="stable")]
+
+
+def get_minute_highs(candles: np.ndarray) -> np.ndarray:
+    # Candle highs on a continuous minute grid, minutes without trades are -inf
+    minutes = ((candles[:, 0] - candles[0, 0]) // MINUTE).astype(np.int64)
+    highs = np.full(minutes[-1] + 1, -np.inf)
+    highs[minutes] = candles[:, 3]
+    return highs
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    # Maximum of values[i - window + 1 : i + 1] for every i
+    padded = np.concatenate([np.full(window - 1, -np.inf), values])
+    view = as_strided(
+        padded, shape=(len(values), window), strides=(padded.strides[0],) * 2
+    )
+    return view.max(axis=1)
+
+
+def candle_high(highs: np.ndarray, first_minute: int, duration: int) -> np.ndarray:
+    # High of the candle the candles/trade:{duration}m/last end point returns at every
+    # minute: the latest clock aligned candle that has trades, up to that minute.
+    # first_minute is the minute since the epoch of highs[0]
+    offset = first_minute % duration
+    padding = -(offset + len(highs)) % duration
+    buckets = np.concatenate(
+        [np.full(offset, -np.inf), highs, np.full(padding, -np.inf)]
+    ).reshape(-1, duration)
+    # Running maximum that starts again at every candle boundary
+    running = np.maximum.accumulate(buckets, axis=1).ravel()[
+        offset : offset + len(highs)
+    ]
+
+    # Until the current candle has a trade, the previous candle with trades is returned
+    traded = np.where(np.isfinite(running), np.arange(len(running)), 0)
+    return running[np.maximum.accumulate(traded)]
+
+
+def get_offer_rates(candles: np.ndarray, duration: int) -> np.ndarray:
+    # Tracker.determine_offer_rate at every minute of the candles, from the candle of
+    # duration minutes
+    return (
+        candle_high(get_minute_highs(candles), int(candles[0, 0] // MINUTE), duration)
+        * OFFER_RATE_FACTOR
+    )
+
+
+def get_lending_periods(offer_rates: np.ndarray) -> np.ndarray:
+    # Vectorised Account.generate_lending_offer period tiers
+    annual_rates = offer_rates * 36500
+    return np.select(
+        [annual_rates > minimum_rate for minimum_rate, _ in LENDING_PERIOD_TIERS],
+        [days for _, days in LENDING_PERIOD_TIERS],
+        default=DEFAULT_LENDING_PERIOD,
+    )
+
+
+def run_backtest(
+    currency: str,
+    candles: np.ndarray,
+    balance: float,
+    minimum_lending_rate: float = 0,
+) -> BacktestResult:
+    highs = get_minute_highs(candles)
+    minutes = len(highs)
+
+    # Tracker.determine_offer_rate for every minute
+    submit_rates = get_offer_rates(candles, SUBMIT_WINDOW)
+    resubmit_rates = get_offer_rates(candles, RESUBMIT_WINDOW)
+    submit_periods = get_lending_periods(submit_rates)
+    resubmit_periods = get_lending_periods(resubmit_rates)
+
+    # Highest rate reached during the OFFER_EXPIRY minutes following every minute
+    future_highs = rolling_max(
+        np.concatenate([highs, np.full(OFFER_EXPIRY, -np.inf)]), OFFER_EXPIRY
+    )[OFFER_EXPIRY:]
+
+    minimum_amount = MIN_FUNDING_AMOUNT.get(currency, 0)
+    minimum_daily_rate = minimum_lending_rate / 36500
+
+    # Minutes at which submit_funding_offer accepts the offer rate
+    submit_minutes = np.flatnonzero(
+        np.isfinite(submit_rates) & (submit_rates >= minimum_daily_rate)
+    )
+
+    offers_submitted = 0
+    offers_filled = 0
+    lent_amount_minutes = 0.0
+    amount_days = 0.0
+    interest = 0.0
+
+    idle = balance
+    returns: List[Tuple[int, float]] = []
+    minute = SUBMIT_WINDOW
+
+    while minute < minutes:
+        while returns and returns[0][0] <= minute:
+            idle += heapq.heappop(returns)[1]
+
+        if idle < minimum_amount or idle <= 0:
+            minute = returns[0][0] if returns else minutes
+            continue
+
+        # Skip ahead to the next minute with an acceptable offer rate
+        index = np.searchsorted(submit_minutes, minute)
+        if index == len(submit_minutes):
+            break
+        if submit_minutes[index] != minute:
+            minute = int(submit_minutes[index])
+            continue
+
+        rate = submit_rates[minute]
+
+        amount = idle
+        if (
+            minimum_amount
+            and amount / minimum_amount > 2
+            and rate * 36500 < FULL_AMOUNT_MINIMUM_RATE
+        ):
+            amount = minimum_amount
+        idle -= amount
+
+        # Follow the offer until it fills, it is cancelled and resubmitted every hour
+        submitted_at = minute
+        period = int(submit_periods[minute])
+        while submitted_at < minutes:
+            offers_submitted += 1
+            if future_highs[submitted_at] >= rate:
+                window = highs[submitted_at + 1 : submitted_at + 1 + OFFER_EXPIRY]
+                filled_at = submitted_at + 1 + int(np.argmax(window >= rate))
+                returned_at = filled_at + period * 1440
+
+                offers_filled += 1
+                lent_amount_minutes += amount * (min(returned_at, minutes) - filled_at)
+                amount_days += amount * period
+                interest += rate * amount * period
+                heapq.heappush(returns, (returned_at, amount))
+                break
+
+            submitted_at += OFFER_EXPIRY
+            if submitted_at >= minutes:
+                break
+            rate = resubmit_rates[submitted_at]
+            period = int(resubmit_periods[submitted_at])
+            if not np.isfinite(rate) or rate < minimum_daily_rate:
+                # The runner gives up on the offer, funds are back to the wallet
+                heapq.heappush(returns, (submitted_at, amount))
+                break
+
+    simulated_minutes = max(1, minutes - SUBMIT_WINDOW)
+    return BacktestResult(
+        currency=currency,
+        minutes=minutes,
+        offers_submitted=offers_submitted,
+        offers_filled=offers_filled,
+        fill_rate=offers_filled / offers_submitted if offers_submitted else 0.0,
+        weighted_average_rate=float(interest / amount_days * 36500)
+        if amount_days
+        else 0.0,
+        idle_time=1 - lent_amount_minutes / (balance * simulated_minutes)
+        if balance
+        else 1.0,
+        interest=float(interest),
+    )
+
+
+__all__ = [
+    "BacktestResult",
+    "get_offer_rates",
+    "load_candles",
+    "run_backtest",
+]
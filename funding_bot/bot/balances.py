@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import boto3
+import sqlite3
+import logging
+import threading
+
+import datetime as dt
+
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from typing import Any, Dict, List, NamedTuple, Optional, Type, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from funding_bot.configs.base import Configuration
+
+# Dates are stored the way the DynamoDB table has always held them
+DATE_FORMAT = "%m-%d-%Y"
+
+# batch_get_item reads at most 100 keys per request
+BATCH_GET_LIMIT = 100
+# Attempts at reading the keys DynamoDB returns unprocessed, with a doubling delay
+BATCH_GET_ATTEMPTS = 4
+BATCH_GET_DELAY = 0.1
+
+DYNAMODB_CLIENT_CONFIG = Config(
+    connect_timeout=5, read_timeout=10, retries={"max_attempts": 5, "mode": "standard"}
+)
+
+BALANCE_TABLE = """
+CREATE TABLE IF NOT EXISTS balances (
+    currency TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    initial_balance REAL NOT NULL,
+    current_balance REAL,
+    updated_at REAL
+)
+"""
+
+
+class BalanceState(NamedTuple):
+    currency: str
+    date: dt.date
+    initial_balance: float
+    current_balance: Optional[float] = None
+    updated_at: Optional[float] = None
+
+
+def parse_date(value: str) -> dt.date:
+    return dt.datetime.strptime(value, DATE_FORMAT).date()
+
+
+def format_date(value: dt.date) -> str:
+    return value.strftime(DATE_FORMAT)
+
+
+def to_json(states: Dict[str, BalanceState]) -> Dict[str, Dict[str, Any]]:
+    return {
+        currency: {
+            "date": format_date(state.date),
+            "initial_balance": state.initial_balance,
+            "current_balance": state.current_balance,
+            "updated_at": state.updated_at,
+        }
+        for currency, state in states.items()
+    }
+
+
+def from_json(data: Dict[str, Dict[str, Any]]) -> Dict[str, BalanceState]:
+    return {
+        currency: BalanceState(
+            currency=currency,
+            date=parse_date(item["date"]),
+            initial_balance=float(item["initial_balance"]),
+            current_balance=item.get("current_balance"),
+            updated_at=item.get("updated_at"),
+        )
+        for currency, item in data.items()
+    }
+
+
+def read_json_file(path: str) -> Dict[str, BalanceState]:
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return from_json(json.load(f))
+
+
+def write_json_file(path: str, states: Dict[str, BalanceState]):
+    # Written to a temporary file first, a crash never leaves a truncated file behind
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(to_json(states), f, indent=2)
+    os.replace(temporary_path, path)
+
+
+class BalanceBackend(object):
+    # Where the initial balance and start date of every currency are kept, and the
+    # current balances of the hourly summary are written back to
+    def load(self, currencies: List[str]) -> Dict[str, BalanceState]:
+        raise NotImplementedError
+
+    def save_current_balances(
+        self, balances: Dict[str, float], now: Optional[float] = None
+    ):
+        raise NotImplementedError
+
+
+class JsonFileBackend(BalanceBackend):
+    # Local stand-in for the DynamoDB table, one JSON object per currency
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def load(self, currencies: List[str]) -> Dict[str, BalanceState]:
+        with self._lock:
+            states = read_json_file(self._path)
+        return {
+            currency: states[currency] for currency in currencies if currency in states
+        }
+
+    def save_current_balances(
+        self, balances: Dict[str, float], now: Optional[float] = None
+    ):
+        now = now or time.time()
+
+        with self._lock:
+            states = read_json_file(self._path)
+            for currency, balance in balances.items():
+                if currency in states:
+                    states[currency] = states[currency]._replace(
+                        current_balance=balance, updated_at=now
+                    )
+            write_json_file(self._path, states)
+
+
+class SQLiteBackend(BalanceBackend):
+    # Local stand-in for the DynamoDB table, in a SQLite file
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(BALANCE_TABLE)
+
+    def add(self, currency: str, date: dt.date, initial_balance: float):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO balances (currency, date, initial_balance) "
+                "VALUES (?, ?, ?)",
+                (currency, format_date(date), initial_balance),
+            )
+
+    def load(self, currencies: List[str]) -> Dict[str, BalanceState]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT currency, date, initial_balance, current_balance, updated_at "
+                f"FROM balances WHERE currency IN ({', '.join('?' * len(currencies))})",
+                currencies,
+            ).fetchall()
+
+        return {
+            row[0]: BalanceState(
+                currency=row[0],
+                date=parse_date(row[1]),
+                initial_balance=row[2],
+                current_balance=row[3],
+                updated_at=row[4],
+            )
+            for row in rows
+        }
+
+    def save_current_balances(
+        self, balances: Dict[str, float], now: Optional[float] = None
+    ):
+        now = now or time.time()
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE balances SET current_balance = ?, updated_at = ? "
+                "WHERE currency = ?",
+                [(balance, now, currency) for currency, balance in balances.items()],
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class DynamoDBBackend(BalanceBackend):
+    # The balance table, items keyed by currency under "Key" with a "Date" and an
+    # "InitialBalance". Every currency is read with one batch_get_item through a
+    # single client, and the last successful read is kept in a local cache file that
+    # is used instead when DynamoDB cannot be reached
+    def __init__(
+        self,
+        table_name: str,
+        region_name: str,
+        logger: logging.Logger,
+        cache_path: Optional[str] = None,
+    ):
+        self._table_name = table_name
+        self._region_name = region_name
+        self._logger = logger
+        self._cache_path = cache_path
+        self._client: Any = None
+        self._lock = threading.Lock()
+
+    def get_client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = boto3.client(
+                    "dynamodb",
+                    region_name=self._region_name,
+                    config=DYNAMODB_CLIENT_CONFIG,
+                )
+            return self._client
+
+    @classmethod
+    def get_attribute(cls, item: Dict[str, Dict[str, Any]], name: str) -> Any:
+        # Low level attribute values are typed, i.e. {"S": "01-31-2021"} or {"N": "1000"}
+        return next(iter(item[name].values()))
+
+    @classmethod
+    def parse_item(cls, item: Dict[str, Dict[str, Any]]) -> Optional[BalanceState]:
+        try:
+            current_balance = (
+                float(cls.get_attribute(item, "CurrentBalance"))
+                if "CurrentBalance" in item
+                else None
+            )
+            updated_at = (
+                float(cls.get_attribute(item, "UpdatedAt"))
+                if "UpdatedAt" in item
+                else None
+            )
+            return BalanceState(
+                currency=cls.get_attribute(item, "Key"),
+                date=parse_date(cls.get_attribute(item, "Date")),
+                initial_balance=float(cls.get_attribute(item, "InitialBalance")),
+                current_balance=current_balance,
+                updated_at=updated_at,
+            )
+        except (KeyError, ValueError, StopIteration):
+            return None
+
+    def _batch_get(self, currencies: List[str]) -> List[Dict[str, Any]]:
+        client = self.get_client()
+        items: List[Dict[str, Any]] = []
+
+        for index in range(0, len(currencies), BATCH_GET_LIMIT):
+            request: Dict[str, Any] = {
+                self._table_name: {
+                    "Keys": [
+                        {"Key": {"S": currency}}
+                        for currency in currencies[index : index + BATCH_GET_LIMIT]
+                    ]
+                }
+            }
+            for attempt in range(BATCH_GET_ATTEMPTS):
+                response = client.batch_get_item(RequestItems=request)
+                items.extend(response.get("Responses", {}).get(self._table_name, []))
+
+                request = response.get("UnprocessedKeys") or {}
+                if not request:
+                    break
+                time.sleep(BATCH_GET_DELAY * 2**attempt)
+            else:
+                self._logger.warning(
+                    f"DynamoDB left {len(request[self._table_name]['Keys'])} balances unread"
+                )
+
+        return items
+
+    def load(self, currencies: List[str]) -> Dict[str, BalanceState]:
+        if not currencies:
+            return dict()
+
+        try:
+            items = self._batch_get(currencies)
+        except (BotoCoreError, ClientError) as e:
+            # NoCredentialsError and connection errors are BotoCoreErrors
+            self._logger.warning(f"Failed to fetch balances from DynamoDB: {e}")
+            return self._load_cache(currencies)
+
+        states: Dict[str, BalanceState] = dict()
+        for item in items:
+            state = self.parse_item(item)
+            if state is None:
+                self._logger.warning(f"Invalid balance item in DynamoDB: {item}")
+            elif state.currency in currencies:
+                states[state.currency] = state
+
+        self._save_cache(states)
+        return states
+
+    def save_current_balances(
+        self, balances: Dict[str, float], now: Optional[float] = None
+    ):
+        now = now or time.time()
+        client = self.get_client()
+
+        for currency, balance in balances.items():
+            try:
+                client.update_item(
+                    TableName=self._table_name,
+                    Key={"Key": {"S": currency}},
+                    UpdateExpression="SET CurrentBalance = :balance, UpdatedAt = :now",
+                    # Only currencies with an initial balance, a partial item is never created
+                    ConditionExpression="attribute_exists(#key)",
+                    ExpressionAttributeNames={"#key": "Key"},
+                    ExpressionAttributeValues={
+                        ":balance": {"N": repr(float(balance))},
+                        ":now": {"N": repr(float(now))},
+                    },
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    self._logger.warning(f"Failed to save {currency} balance: {e}")
+            except BotoCoreError as e:
+                self._logger.warning(f"Failed to save {currency} balance: {e}")
+
+    def _load_cache(self, currencies: List[str]) -> Dict[str, BalanceState]:
+        if not self._cache_path:
+            return dict()
+
+        try:
+            states = read_json_file(self._cache_path)
+        except (OSError, ValueError, KeyError) as e:
+            self._logger.warning(f"Failed to read the balance cache: {e}")
+            return dict()
+
+        self._logger.info(f"Using the cached balances from {self._cache_path}")
+        return {
+            currency: states[currency] for currency in currencies if currency in states
+        }
+
+    def _save_cache(self, states: Dict[str, BalanceState]):
+        if not self._cache_path or not states:
+            return
+
+        try:
+            cached = read_json_file(self._cache_path)
+            cached.update(states)
+            write_json_file(self._cache_path, cached)
+        except (OSError, ValueError, KeyError) as e:
+            self._logger.warning(f"Failed to write the balance cache: {e}")
+
+
+def build_balance_backend(
+    configuration: Type["Configuration"], logger: logging.Logger
+) -> Optional[BalanceBackend]:
+    # A local balance file takes precedence over the DynamoDB table
+    path = configuration.get_balance_file_path()
+    if path:
+        if path.endswith(".json"):
+            return JsonFileBackend(path)
+        return SQLiteBackend(path)
+
+    table_name = configuration.get_dynamodb_table_name()
+    if table_name:
+        return DynamoDBBackend(
+            table_name,
+            configuration.get_dynamodb_region(),
+            logger,
+            cache_path=configuration.get_balance_cache_path(),
+        )
+    return None
+
+
+__all__ = [
+    "BalanceBackend",
+    "BalanceState",
+    "DynamoDBBackend",
+    "JsonFileBackend",
+    "SQLiteBackend",
+    "build_balance_backend",
+]
@@ -0,0 +1,72 @@
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+
+# API key, end point and the serialized request body
+SnapshotKey = Tuple[str, str, bytes]
+
+
+class SnapshotCache(object):
+    # Snapshots of authenticated read endpoints, keyed by API key, end point and
+    # request body, so repeated reads within a tick cost a single request. A tick never
+    # reuses the balances or offers read by the previous one, however short the loop
+    def __init__(self, enabled: bool = True):
+        self._enabled = enabled
+        self._snapshots: Dict[SnapshotKey, Any] = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def is_cacheable(cls, end_point: str) -> bool:
+        return end_point.startswith(("v2/auth/r/", "v2/auth/calc/"))
+
+    def get(self, key: SnapshotKey) -> Optional[Any]:
+        with self._lock:
+            return self._snapshots.get(key)
+
+    def set(self, key: SnapshotKey, data: Any):
+        if not self._enabled:
+            return
+
+        with self._lock:
+            self._snapshots[key] = data
+
+    def start_tick(self, api_key: Optional[str] = None):
+        # Called with the scheduler's start_tick, for the API key or every account
+        self.invalidate(api_key)
+
+    def invalidate(self, api_key: Optional[str] = None):
+        # Called after every successful write, the account state has changed
+        with self._lock:
+            if api_key is None:
+                self._snapshots = dict()
+            else:
+                self._snapshots = {
+                    key: snapshot
+                    for key, snapshot in self._snapshots.items()
+                    if key[0] != api_key
+                }
+
+
+_snapshot_cache: Optional[SnapshotCache] = None
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    global _snapshot_cache
+
+    if _snapshot_cache is None:
+        _snapshot_cache = SnapshotCache()
+    return _snapshot_cache
+
+
+def configure_snapshot_cache(enabled: bool) -> SnapshotCache:
+    global _snapshot_cache
+
+    _snapshot_cache = SnapshotCache(enabled=enabled)
+    return _snapshot_cache
+
+
+__all__ = [
+    "SnapshotCache",
+    "get_snapshot_cache",
+    "configure_snapshot_cache",
+]
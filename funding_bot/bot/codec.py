@@ -0,0 +1,160 @@
+import json
+import operator
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+)
+
+try:
+    import orjson
+except ImportError:  # Optional, install orjson for faster JSON decoding and encoding
+    orjson = None  # type: ignore
+
+JSON_CODEC = "json"
+ORJSON_CODEC = "orjson"
+
+Record = TypeVar("Record")
+
+
+class JsonCodec(object):
+    # Standard library codec. json.loads takes the response bytes as they are, without
+    # decoding them to a string first
+    name = JSON_CODEC
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value).encode("utf8")
+
+
+class OrjsonCodec(JsonCodec):
+    # Compact output, Bitfinex signs and parses whatever bytes are sent
+    name = ORJSON_CODEC
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+
+CODECS: Dict[str, Type[JsonCodec]] = {
+    JSON_CODEC: JsonCodec,
+    ORJSON_CODEC: OrjsonCodec,
+}
+
+
+def get_available_codecs() -> List[str]:
+    return [JSON_CODEC] + ([ORJSON_CODEC] if orjson is not None else [])
+
+
+def build_codec(name: Optional[str] = None) -> JsonCodec:
+    # The fastest installed codec when no name is given
+    if name is None:
+        name = get_available_codecs()[-1]
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec {name}, expected one of {list(CODECS)}")
+    if name not in get_available_codecs():
+        raise ValueError(f"JSON codec {name} is not installed")
+    return CODECS[name]()
+
+
+class RowSchema(Generic[Record]):
+    # Maps the positional arrays of the Bitfinex API to a NamedTuple, by the index of
+    # each of its fields in the row. Negative indices count from the end of the row.
+    # Rows shorter than minimum_length, by default the largest index, are skipped
+    def __init__(
+        self,
+        record_type: Type[Record],
+        indices: Dict[str, int],
+        converters: Optional[Dict[str, Callable[[Any], Any]]] = None,
+        minimum_length: int = 0,
+    ):
+        fields = getattr(record_type, "_fields")
+        missing = [field for field in fields if field not in indices]
+        if missing or len(indices) != len(fields) or len(fields) < 2:
+            raise ValueError(
+                f"Schema of {record_type.__name__} does not match {fields}"
+            )
+
+        self.record_type = record_type
+        self.indices = [indices[field] for field in fields]
+        self.minimum_length = max(
+            minimum_length,
+            max(index + 1 for index in self.indices),
+            max(-index for index in self.indices),
+        )
+        self._make = getattr(record_type, "_make")
+        self._get = operator.itemgetter(*self.indices)
+        self._converters = [
+            (position, converters[field])
+            for position, field in enumerate(fields)
+            if converters and field in converters
+        ]
+
+    def decode_row(self, row: List[Any]) -> Optional[Record]:
+        if len(row) < self.minimum_length:
+            return None
+
+        values = self._get(row)
+        if not self._converters:
+            return self._make(values)
+
+        values = list(values)
+        for position, converter in self._converters:
+            values[position] = converter(values[position])
+        return self._make(values)
+
+    def decode(self, rows: Iterable[List[Any]]) -> List[Record]:
+        minimum_length = self.minimum_length
+        make = self._make
+        get = self._get
+
+        if self._converters:
+            records = (self.decode_row(row) for row in rows)
+            return [record for record in records if record is not None]
+        return [make(get(row)) for row in rows if len(row) >= minimum_length]
+
+
+_codec = build_codec()
+
+
+def get_codec() -> JsonCodec:
+    return _codec
+
+
+def configure_codec(name: Optional[str] = None) -> JsonCodec:
+    global _codec
+
+    _codec = build_codec(name)
+    return _codec
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return _codec.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    return _codec.dumps(value)
+
+
+__all__ = [
+    "JsonCodec",
+    "OrjsonCodec",
+    "RowSchema",
+    "get_available_codecs",
+    "get_codec",
+    "configure_codec",
+    "loads",
+    "dumps",
+]
@@ -0,0 +1,31 @@
+from typing import NamedTuple
+
+DEFAULT_API_URL = "https://api.bitfinex.com/"
+DEFAULT_PUBLIC_API_URL = "https://api-pub.bitfinex.com/"
+
+
+class Endpoints(NamedTuple):
+    # Base URLs of the authenticated and the public REST API, with a trailing slash
+    api_url: str
+    public_api_url: str
+
+
+_endpoints = Endpoints(api_url=DEFAULT_API_URL, public_api_url=DEFAULT_PUBLIC_API_URL)
+
+
+def get_endpoints() -> Endpoints:
+    return _endpoints
+
+
+def configure_endpoints(api_url: str, public_api_url: str) -> Endpoints:
+    global _endpoints
+
+    _endpoints = Endpoints(api_url=api_url, public_api_url=public_api_url)
+    return _endpoints
+
+
+__all__ = [
+    "Endpoints",
+    "get_endpoints",
+    "configure_endpoints",
+]
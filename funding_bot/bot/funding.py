@@ -1,10 +1,14 @@
-import hmac
-import json
 import logging
-import hashlib
 import tabulate
 import requests
-import datetime as dt
+
+from funding_bot.bot.cache import get_snapshot_cache
+from funding_bot.bot.codec import RowSchema, loads
+from funding_bot.bot.endpoints import get_endpoints
+from funding_bot.bot.notifier import get_notifier
+from funding_bot.bot.transport import get_transport
+from funding_bot.bot.tracing import get_tracer
+from funding_bot.bot.signing import RequestSigner, encode_body, get_signer
 
 from typing import List, Dict, Any, Optional, NamedTuple, TYPE_CHECKING
 from typing_extensions import TypedDict
@@ -12,13 +16,6 @@ from typing_extensions import TypedDict
 if TYPE_CHECKING:
     from funding_bot.bot.account import LendingOffer
 
-Header = TypedDict(
-    "Header",
-    {"bfx-nonce": str, "bfx-apikey": str, "bfx-signature": str, "content-type": str},
-)
-
-message_queue: List[str] = []
-
 
 class Credentials(NamedTuple):
     api_key: str
@@ -45,6 +42,14 @@ class ActiveFundingData(NamedTuple):
     position_pair: str
 
 
+class FundingOfferHistoryData(NamedTuple):
+    id: str
+    currency: str
+    amount: float
+    status: str
+    mts_updated: int
+
+
 class ActiveFundingOfferData(NamedTuple):
     id: str
     currency: str
@@ -54,59 +59,78 @@ class ActiveFundingOfferData(NamedTuple):
     period: int
 
 
-class FundingBot(object):
-    @classmethod
-    def get_api_url(cls) -> str:
-        return "https://api.bitfinex.com/"
+# Positions of the fields in the funding/credits, funding/offers and
+# funding/offers/.../hist rows
+ACTIVE_FUNDING_SCHEMA: RowSchema[ActiveFundingData] = RowSchema(
+    ActiveFundingData,
+    {
+        "id": 0,
+        "currency": 1,
+        "amount": 5,
+        "status": 7,
+        "rate": 11,
+        "period": 12,
+        "position_pair": -1,
+    },
+)
+ACTIVE_FUNDING_OFFER_SCHEMA: RowSchema[ActiveFundingOfferData] = RowSchema(
+    ActiveFundingOfferData,
+    {"id": 0, "currency": 1, "amount": 5, "status": 10, "rate": 14, "period": 15},
+)
+FUNDING_OFFER_HISTORY_SCHEMA: RowSchema[FundingOfferHistoryData] = RowSchema(
+    FundingOfferHistoryData,
+    {"id": 0, "currency": 1, "amount": 5, "status": 10, "mts_updated": 3},
+    converters={"id": str},
+)
 
-    @classmethod
-    def generate_nonce(cls) -> str:
-        return str(int(dt.datetime.now().timestamp() * 1000000))
 
+class FundingBot(object):
     @classmethod
-    def generate_signature(
-        cls, credentials: Credentials, end_point: str, nonce: str, body: Dict[str, Any]
-    ) -> str:
-        signature = f"/api/{end_point}{nonce}{json.dumps(body)}"
-
-        return hmac.new(
-            key=credentials.api_secret_key.encode("utf8"),
-            msg=signature.encode("utf8"),
-            digestmod=hashlib.sha384,
-        ).hexdigest()
+    def get_api_url(cls) -> str:
+        return get_endpoints().api_url
 
     @classmethod
-    def generate_headers(
-        cls, credentials: Credentials, end_point: str, body: Dict[str, Any]
-    ) -> Header:
-        nonce = cls.generate_nonce()
-        return {
-            "bfx-nonce": nonce,
-            "bfx-apikey": credentials.api_key,
-            "bfx-signature": cls.generate_signature(
-                credentials, end_point, nonce, body
-            ),
-            "content-type": "application/json",
-        }
+    def get_signer(cls, credentials: Credentials) -> RequestSigner:
+        return get_signer(credentials.api_key, credentials.api_secret_key)
 
     @classmethod
     def send_api_request(
         cls,
+        credentials: Credentials,
         end_point: str,
-        header: Header,
         body: Dict[str, Any],
         logger: logging.Logger,
     ):
-        response = requests.post(
-            f"{cls.get_api_url()}{end_point}", headers=header, data=json.dumps(body)
-        )
+        # The body is serialized once, those bytes are both signed and sent
+        payload = encode_body(body)
+
+        snapshot_cache = get_snapshot_cache()
+        snapshot_key = (credentials.api_key, end_point, payload)
+        if snapshot_cache.is_cacheable(end_point):
+            data = snapshot_cache.get(snapshot_key)
+            if data is not None:
+                return data
+
+        signer = cls.get_signer(credentials)
+        try:
+            response = get_transport().post(
+                f"{cls.get_api_url()}{end_point}",
+                sign=lambda: signer.sign(end_point, payload),
+                scope=credentials.api_key,
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API Request to {cls.get_api_url()}{end_point} failed: {e}\n")
+            return None
 
         if response.status_code != 200:
             logger.error(
                 f"API Request to {cls.get_api_url()}{end_point} failed with {response.status_code}\n"
             )
         else:
-            return json.loads(response.content.decode())
+            data = loads(response.content)
+            if snapshot_cache.is_cacheable(end_point):
+                snapshot_cache.set(snapshot_key, data)
+            return data
 
     @classmethod
     def grab_current_wallet_status(
@@ -114,26 +138,29 @@ class FundingBot(object):
     ) -> Optional[str]:
         end_point = "v2/auth/r/wallets"
         body: Dict[str, Any] = {}
-        header: Header = cls.generate_headers(credentials, end_point, body)
 
-        data = cls.send_api_request(end_point, header, body, logger)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
         if data:
-            data = [row[:3] for row in data]
-            return tabulate.tabulate(data, headers=["Type", "Currency", "Amount"])
+            return cls.format_wallet_status(data)
         return None
 
+    @classmethod
+    def format_wallet_status(cls, data: List[List[Any]]) -> str:
+        return tabulate.tabulate(
+            [row[:3] for row in data], headers=["Type", "Currency", "Amount"]
+        )
+
     @classmethod
     def get_currency_balance(
         cls, credentials: Credentials, currency: str, logger: logging.Logger
     ) -> float:
         end_point = "v2/auth/r/wallets"
         body: Dict[str, Any] = {}
-        header: Header = cls.generate_headers(credentials, end_point, body)
 
-        data = cls.send_api_request(end_point, header, body, logger)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
-        for row in data:
+        for row in data or []:
             if row[0] == "funding" and row[1] == currency[1:]:
                 return float(row[2])
         return -1
@@ -147,9 +174,8 @@ class FundingBot(object):
             "symbol": currency,
             "type": "FUNDING",
         }
-        header: Header = cls.generate_headers(credentials, end_point, body)
 
-        data = cls.send_api_request(end_point, header, body, logger)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
         if data:
             # Somehow the return value is negative
@@ -164,9 +190,8 @@ class FundingBot(object):
         data_entry = []
         for currency in currencies:
             end_point = f"v2/auth/r/info/funding/{currency}"
-            header: Header = cls.generate_headers(credentials, end_point, {})
 
-            data = cls.send_api_request(end_point, header, {}, logger)
+            data = cls.send_api_request(credentials, end_point, {}, logger)
 
             if data:
                 rate = f"{round(data[2][1] * 36500, 4)}%"
@@ -187,9 +212,10 @@ class FundingBot(object):
         lending_data: "LendingOffer",
         minimum_lending_rate: float,
         logger: logging.Logger,
+        notify: bool = True,
     ) -> Optional[int]:
         end_point = "v2/auth/w/funding/offer/submit"
-        telegram_api_key = credentials.telegram_api
+        telegram_api_key = credentials.telegram_api if notify else None
         offer_rate = lending_data.rate
         days = lending_data.period
 
@@ -220,11 +246,10 @@ class FundingBot(object):
             "flags": 0,
         }
 
-        header: Header = cls.generate_headers(credentials, end_point, body)
-
-        data = cls.send_api_request(end_point, header, body, logger)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
         if data:
+            get_snapshot_cache().invalidate(credentials.api_key)
             logger.info(f"Order ID: {data[4][0]} {data[7]}")
             cls.send_telegram_notification(
                 telegram_api_key, f"Order ID: {data[4][0]} {data[7]}"
@@ -242,43 +267,44 @@ class FundingBot(object):
 
         body: Dict[str, Any] = {}
 
-        header: Header = cls.generate_headers(credentials, end_point, body)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
-        data = cls.send_api_request(end_point, header, body, logger)
+        return cls.parse_active_funding_data(data or [])
 
-        order_data: List[ActiveFundingData] = []
-
-        if data:
-            for order in data:
-                order_data.append(
-                    ActiveFundingData(
-                        id=order[0],
-                        currency=order[1],
-                        amount=order[5],
-                        status=order[7],
-                        rate=order[11],
-                        period=order[12],
-                        position_pair=order[-1],
-                    )
-                )
-
-        return order_data
+    @classmethod
+    def parse_active_funding_data(
+        cls, data: List[List[Any]]
+    ) -> List[ActiveFundingData]:
+        return ACTIVE_FUNDING_SCHEMA.decode(data)
 
     @classmethod
-    def get_funding_offer_history(
-        cls, credentials: Credentials, currency: str, logger: logging.Logger
-    ) -> Dict[str, str]:
+    def get_funding_offer_history_data(
+        cls,
+        credentials: Credentials,
+        currency: str,
+        logger: logging.Logger,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[List[FundingOfferHistoryData]]:
+        # Closed offers last updated between start and end (in milliseconds), newest
+        # first. None when the request failed
         end_point = f"v2/auth/r/funding/offers/{currency}/hist"
 
         body: Dict[str, Any] = {}
+        if start is not None:
+            body["start"] = start
+        if end is not None:
+            body["end"] = end
+        if limit is not None:
+            body["limit"] = limit
 
-        header: Header = cls.generate_headers(credentials, end_point, body)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
-        data = cls.send_api_request(end_point, header, body, logger)
+        if data is None:
+            return None
 
-        if data:
-            return {str(offer[0]): offer[10] for offer in data}
-        return dict()
+        return FUNDING_OFFER_HISTORY_SCHEMA.decode(data)
 
     @classmethod
     def get_active_funding_offer_data(
@@ -288,42 +314,34 @@ class FundingBot(object):
 
         body: Dict[str, Any] = {}
 
-        header: Header = cls.generate_headers(credentials, end_point, body)
-
-        data = cls.send_api_request(end_point, header, body, logger)
-
-        order_data: List[ActiveFundingOfferData] = []
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
-        if data:
-            for order in data:
-                order_data.append(
-                    ActiveFundingOfferData(
-                        id=order[0],
-                        currency=order[1],
-                        amount=order[5],
-                        status=order[10],
-                        rate=order[14],
-                        period=order[15],
-                    )
-                )
+        return cls.parse_active_funding_offer_data(data or [])
 
-        return order_data
+    @classmethod
+    def parse_active_funding_offer_data(
+        cls, data: List[List[Any]]
+    ) -> List[ActiveFundingOfferData]:
+        return ACTIVE_FUNDING_OFFER_SCHEMA.decode(data)
 
     @classmethod
     def cancel_funding_offer(
-        cls, credentials: Credentials, id_: str, logger: logging.Logger
+        cls,
+        credentials: Credentials,
+        id_: str,
+        logger: logging.Logger,
+        notify: bool = True,
     ) -> bool:
         end_point = f"v2/auth/w/funding/offer/cancel"
-        telegram_api_key = credentials.telegram_api
+        telegram_api_key = credentials.telegram_api if notify else None
 
         body: Dict[str, Any] = {"id": int(id_)}
 
-        header: Header = cls.generate_headers(credentials, end_point, body)
-
-        data = cls.send_api_request(end_point, header, body, logger)
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
         if data:
             if data[6] == "SUCCESS":
+                get_snapshot_cache().invalidate(credentials.api_key)
                 cls.send_telegram_notification(
                     telegram_api_key, f"Order id: {id_} cancel successfully"
                 )
@@ -339,24 +357,34 @@ class FundingBot(object):
         return False
 
     @classmethod
-    def send_telegram_notification(cls, telegram_api_key: Optional[str], msg: str):
-        if telegram_api_key:
-            try:
-                requests.get(f"{telegram_api_key}{msg}")
-            except requests.exceptions.ConnectionError:
-                global message_queue
-                message_queue.append(msg)
+    def cancel_all_funding_offers(
+        cls, credentials: Credentials, currency: str, logger: logging.Logger
+    ) -> bool:
+        # Cancels every funding offer of the currency in one request
+        end_point = "v2/auth/w/funding/offer/cancel/all"
 
-    @classmethod
-    def resend_any_failed_messaged(cls, telegram_api_key: Optional[str]):
-        if telegram_api_key:
-            global message_queue
+        body: Dict[str, Any] = {"currency": currency[1:]}
 
-            message_to_resend = [msg for msg in message_queue]
-            message_queue = []
+        data = cls.send_api_request(credentials, end_point, body, logger)
 
-            for msg in message_to_resend:
-                cls.send_telegram_notification(telegram_api_key, msg)
+        if data:
+            if data[6] == "SUCCESS":
+                get_snapshot_cache().invalidate(credentials.api_key)
+                logger.info(f"All {currency} offers cancel successfully")
+                return True
+            else:
+                logger.warning(
+                    f"Unexpected Response: {data[6]} cancelling all {currency} offers"
+                )
+
+        return False
+
+    @classmethod
+    def send_telegram_notification(cls, telegram_api_key: Optional[str], msg: str):
+        # Queued, the notifier sends it in the background
+        if telegram_api_key:
+            with get_tracer().span("notify"):
+                get_notifier().send(telegram_api_key, msg)
 
     @classmethod
     def generate_report(
@@ -382,6 +410,13 @@ class FundingBot(object):
         for currency in currencies:
             orders = orders + cls.get_active_funding_data(credentials, currency, logger)
 
+        order_data_msg = cls.format_active_funding_data(orders)
+
+        logger.info(order_data_msg)
+        cls.send_telegram_notification(telegram_api_key, order_data_msg)
+
+    @classmethod
+    def format_active_funding_data(cls, orders: List[ActiveFundingData]) -> str:
         order_data: List[Any] = []
         for order in orders:
             order_data.append(
@@ -395,16 +430,14 @@ class FundingBot(object):
                 ]
             )
 
-        order_data_msg = tabulate.tabulate(
+        return tabulate.tabulate(
             order_data,
             headers=["Currency", "ID", "Amount", "Rate", "Period", "PositionPair"],
         )
 
-        logger.info(order_data_msg)
-        cls.send_telegram_notification(telegram_api_key, order_data_msg)
-
 
 __all__ = [
     "FundingBot",
     "Credentials",
+    "FundingOfferHistoryData",
 ]
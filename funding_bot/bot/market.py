@@ -0,0 +1,113 @@
+import logging
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from funding_bot.bot.codec import loads
+from funding_bot.bot.endpoints import get_endpoints
+from funding_bot.bot.tracker import Tracker
+from funding_bot.bot.transport import get_transport
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from funding_bot.bot.store import TickRecorder
+
+
+class MarketDataHub(object):
+    # Shares one batched ticker download per tick between the trackers of every currency
+    def __init__(
+        self,
+        currencies: List[str],
+        logger: logging.Logger,
+        store: Optional["TickRecorder"] = None,
+    ):
+        self._logger = logger
+        self._store = store
+        self._trackers: Dict[str, Tracker] = {
+            currency: Tracker(currency=currency, logger=logger, store=store)
+            for currency in currencies
+        }
+
+    def get_api(self) -> str:
+        symbols = ",".join(self._trackers)
+        return f"{get_endpoints().public_api_url}v2/tickers?symbols={symbols}"
+
+    def get_tracker(self, currency: str) -> Tracker:
+        return self._trackers[currency]
+
+    def get_trackers(self) -> Dict[str, Tracker]:
+        return dict(self._trackers)
+
+    def add_currencies(self, currencies: List[str]) -> List[str]:
+        # Tracks more currencies, returns the ones not tracked before. Not thread safe
+        # against update_rates, call both from the same thread
+        added = [currency for currency in currencies if currency not in self._trackers]
+        for currency in added:
+            self._trackers[currency] = Tracker(
+                currency=currency, logger=self._logger, store=self._store
+            )
+        return added
+
+    def close(self):
+        # Writes the samples still queued for the tick store
+        if self._store is not None:
+            self._store.close()
+
+    def update_rates(self):
+        self.update_tickers()
+
+        for tracker in self._trackers.values():
+            tracker.update_candles()
+
+    def warm_start(self, currencies: Optional[List[str]] = None):
+        # Backfills every tracker, or the ones of the currencies, from its candle history
+        # concurrently, then takes the current rate data from one batched ticker
+        # download. Trackers whose history could not be downloaded fall back to polling
+        # the last candles
+        trackers = [
+            tracker
+            for currency, tracker in self._trackers.items()
+            if currencies is None or currency in currencies
+        ]
+        if not trackers:
+            return
+
+        with ThreadPoolExecutor(max_workers=len(trackers)) as executor:
+            warmed = list(executor.map(lambda tracker: tracker.warm_start(), trackers))
+
+        for tracker, warm in zip(trackers, warmed):
+            if not warm:
+                self._logger.warning(
+                    f"No candle history for {tracker.get_currency()}, polling the last candles"
+                )
+                tracker.update_candles()
+
+        self.update_tickers()
+        for tracker in trackers:
+            tracker.aggregate_rate_data()
+
+    def update_tickers(self):
+        if not self._trackers:
+            return
+
+        try:
+            response = get_transport().get(self.get_api())
+        except requests.exceptions.RequestException as e:
+            self._logger.error(f"Ticker request to {self.get_api()} failed: {e}")
+            return
+
+        if response.status_code != 200:
+            self._logger.error(
+                f"Ticker request to {self.get_api()} failed with {response.status_code}"
+            )
+            return
+
+        for ticker in loads(response.content):
+            tracker = self._trackers.get(ticker[0]) if ticker else None
+            if tracker:
+                tracker.add_ticker_data(ticker)
+
+
+__all__ = [
+    "MarketDataHub",
+]
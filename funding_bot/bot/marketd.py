@@ -0,0 +1,481 @@
+import os
+import time
+import queue
+import socket
+import logging
+import threading
+import socketserver
+
+from funding_bot.bot.codec import dumps, loads
+from funding_bot.bot.endpoints import DEFAULT_API_URL, configure_endpoints
+from funding_bot.bot.market import MarketDataHub
+from funding_bot.bot.metrics import start_metrics_server
+from funding_bot.bot.ratelimit import PUBLIC_SCOPE
+from funding_bot.bot.store import TickRecorder
+from funding_bot.bot.tracker import CANDLE_PERIODS, CandleData, RateData, Tracker
+from funding_bot.bot.transport import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TIMEOUT,
+    configure_transport,
+    get_transport,
+)
+
+from typing import Any, Dict, List, Optional, Set
+
+# Newline delimited JSON over a Unix domain socket. A client sends one subscribe
+# message, the daemon answers with a snapshot of every currency followed by every
+# rate and candle sample it collects, and a heartbeat when it has nothing to send
+SUBSCRIBE_EVENT = "subscribe"
+SNAPSHOT_EVENT = "snapshot"
+RATE_EVENT = "rate"
+CANDLE_EVENT = "candle"
+HEARTBEAT_EVENT = "hb"
+ERROR_EVENT = "error"
+
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = 30
+# Seconds a client is given to subscribe, and to take a message once connected
+HANDSHAKE_TIMEOUT = 10
+SEND_TIMEOUT = 10
+# Messages queued for a client that stopped reading before it is disconnected
+MAX_PENDING_MESSAGES = 10000
+
+# The same loop interval bounds as the runner
+MIN_LOOP_INTERVAL = 1
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return dumps(message) + b"\n"
+
+
+def get_snapshot(tracker: Tracker) -> Dict[str, Any]:
+    return {
+        "event": SNAPSHOT_EVENT,
+        "currency": tracker.get_currency(),
+        "history": tracker.get_rate_history(),
+        "rate": list(tracker.get_latest_rate_data()),
+        "candles": {
+            period_key: list(candle_data)
+            for period_key, candle_data in tracker.get_candle_data().items()
+        },
+    }
+
+
+class Subscriber(object):
+    # Messages for one client, queued so that collecting market data never waits on a
+    # client. A client whose queue fills up is disconnected
+    def __init__(self, currencies: Set[str]):
+        self.currencies = currencies
+        self._messages: "queue.Queue[Optional[bytes]]" = queue.Queue(
+            maxsize=MAX_PENDING_MESSAGES
+        )
+        self._closed = threading.Event()
+
+    def is_closed(self) -> bool:
+        return self._closed.is_set()
+
+    def publish(self, data: bytes):
+        if self._closed.is_set():
+            return
+        try:
+            self._messages.put_nowait(data)
+        except queue.Full:
+            self.close()
+
+    def get(self, timeout: float) -> Optional[bytes]:
+        # The next message, a heartbeat after timeout seconds without one, or None
+        # once closed
+        if self._closed.is_set():
+            return None
+        try:
+            return self._messages.get(timeout=timeout)
+        except queue.Empty:
+            return encode_message({"event": HEARTBEAT_EVENT})
+
+    def close(self):
+        self._closed.set()
+        try:
+            # Wakes the handler up
+            self._messages.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class MarketDataHandler(socketserver.StreamRequestHandler):
+    server: "MarketDataDaemon"
+
+    def handle(self):
+        self.connection.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            message = loads(self.rfile.readline())
+            if message.get("event") != SUBSCRIBE_EVENT:
+                raise ValueError(f"Expected a subscribe message, got {message}")
+            currencies = {str(currency) for currency in message["currencies"]}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send(encode_message({"event": ERROR_EVENT, "message": str(e)}))
+            return
+
+        self.connection.settimeout(SEND_TIMEOUT)
+        subscriber = self.server.subscribe(currencies)
+        try:
+            while True:
+                data = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+                if data is None or not self._send(data):
+                    break
+        finally:
+            self.server.unsubscribe(subscriber)
+
+    def _send(self, data: bytes) -> bool:
+        try:
+            self.wfile.write(data)
+            return True
+        except OSError:
+            return False
+
+
+class MarketDataPublisher(TickRecorder):
+    # Stands in for the tick store of the daemon's trackers, every sample recorded is
+    # sent to the clients subscribed to its currency
+    def __init__(self):
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def get_subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(
+        self, currencies: Set[str], trackers: Dict[str, Tracker]
+    ) -> Subscriber:
+        # Queues the snapshot of each tracked currency before any later sample
+        subscriber = Subscriber(currencies)
+
+        with self._lock:
+            self._subscribers.add(subscriber)
+            for currency in sorted(currencies):
+                if currency in trackers:
+                    subscriber.publish(encode_message(get_snapshot(trackers[currency])))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish_snapshots(self, trackers: List[Tracker]):
+        # Of currencies tracked since their clients subscribed
+        with self._lock:
+            for subscriber in self._subscribers:
+                for tracker in trackers:
+                    if tracker.get_currency() in subscriber.currencies:
+                        subscriber.publish(encode_message(get_snapshot(tracker)))
+
+    def close(self):
+        with self._lock:
+            for subscriber in self._subscribers:
+                subscriber.close()
+
+    def _publish(self, currency: str, message: Dict[str, Any]):
+        data = encode_message(message)
+        with self._lock:
+            for subscriber in self._subscribers:
+                if currency in subscriber.currencies:
+                    subscriber.publish(data)
+
+    def record_rate(
+        self, currency: str, rate_data: RateData, mts: Optional[int] = None
+    ):
+        self._publish(
+            currency,
+            {
+                "event": RATE_EVENT,
+                "currency": currency,
+                "timestamp": mts / 1000 if mts else time.time(),
+                "rate": list(rate_data),
+            },
+        )
+
+    def record_candle(
+        self,
+        currency: str,
+        period_key: str,
+        candle_data: CandleData,
+        mts: Optional[int] = None,
+    ):
+        self._publish(
+            currency,
+            {
+                "event": CANDLE_EVENT,
+                "currency": currency,
+                "period": period_key,
+                "candle": list(candle_data),
+            },
+        )
+
+
+class MarketDataDaemon(socketserver.ThreadingUnixStreamServer):
+    # Collects the public market data of every currency its clients subscribe to, once
+    # for the whole host, and publishes every sample to them
+    daemon_threads = True
+
+    def __init__(
+        self, path: str, logger: logging.Logger, currencies: Optional[List[str]] = None
+    ):
+        remove_stale_socket(path)
+        super().__init__(path, MarketDataHandler)
+        self.path = path
+        self._logger = logger
+        self._publisher = MarketDataPublisher()
+        self._market_data = MarketDataHub([], logger, store=self._publisher)
+        # Currencies subscribed to that are not tracked yet, added by the collecting loop
+        self._pending_currencies: List[str] = list(currencies or [])
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def get_currencies(self) -> List[str]:
+        return list(self._market_data.get_trackers())
+
+    def get_subscriber_count(self) -> int:
+        return self._publisher.get_subscriber_count()
+
+    def subscribe(self, currencies: Set[str]) -> Subscriber:
+        trackers = self._market_data.get_trackers()
+        subscriber = self._publisher.subscribe(currencies, trackers)
+
+        with self._lock:
+            for currency in sorted(currencies):
+                if (
+                    currency not in trackers
+                    and currency not in self._pending_currencies
+                ):
+                    self._pending_currencies.append(currency)
+
+        self._logger.info(f"Client subscribed to {', '.join(sorted(currencies))}")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._publisher.unsubscribe(subscriber)
+
+    def _add_pending_currencies(self):
+        with self._lock:
+            currencies, self._pending_currencies = self._pending_currencies, []
+
+        added = self._market_data.add_currencies(currencies)
+        if not added:
+            return
+
+        self._logger.info(f"Collecting market data of {', '.join(added)}")
+        self._market_data.warm_start(added)
+        self._publisher.publish_snapshots(
+            [self._market_data.get_tracker(currency) for currency in added]
+        )
+
+    def collect_forever(self, stopped: threading.Event):
+        # Polls the public API as fast as its budgets allow, however many clients there are
+        scheduler = get_transport().get_scheduler()
+
+        while not stopped.is_set():
+            scheduler.start_tick(PUBLIC_SCOPE)
+            try:
+                self._add_pending_currencies()
+                self._market_data.update_rates()
+            except Exception:
+                self._logger.exception("Market data update failed")
+
+            stopped.wait(
+                scheduler.get_loop_delay(minimum=MIN_LOOP_INTERVAL, scope=PUBLIC_SCOPE)
+            )
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="MarketDataDaemon", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._publisher.close()
+        if self._thread:
+            self._thread.join()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def remove_stale_socket(path: str):
+    # The socket file of a daemon that did not shut down cleanly, refuses to take over
+    # the one of a running daemon
+    if not os.path.exists(path):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A market data daemon is already listening on {path}")
+
+
+class MarketDataClient(object):
+    # Feeds the trackers from the `funding_bot marketd` daemon of the host instead of
+    # polling the public API, reconnecting and resubscribing whenever the daemon goes
+    # away or goes silent
+    def __init__(
+        self,
+        trackers: Dict[str, Tracker],
+        logger: logging.Logger,
+        path: str,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        self._trackers = trackers
+        self._logger = logger
+        self._path = path
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+
+        self._connection: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run_forever, name="MarketDataClient", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._close()
+
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def is_ready(self) -> bool:
+        return all(tracker.has_candle_data() for tracker in self._trackers.values())
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            if time.monotonic() > deadline or self._stopped.is_set():
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _run_forever(self):
+        delay = self._reconnect_delay
+
+        while not self._stopped.is_set():
+            try:
+                self._connect()
+                delay = self._reconnect_delay
+                self._receive_messages()
+            except (OSError, ValueError) as e:
+                if self._stopped.is_set():
+                    break
+                self._logger.warning(
+                    f"Market data daemon disconnected: {e}, reconnecting in {delay}s"
+                )
+            finally:
+                self._close()
+
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
+
+    def _connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(HEARTBEAT_TIMEOUT)
+        self._connection = connection
+        connection.connect(self._path)
+        connection.sendall(
+            encode_message(
+                {"event": SUBSCRIBE_EVENT, "currencies": list(self._trackers)}
+            )
+        )
+        self._logger.info(f"Market data daemon connected on {self._path}")
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def _receive_messages(self):
+        connection = self._connection
+        if connection is None:
+            return
+
+        with connection.makefile("rb") as messages:
+            while not self._stopped.is_set():
+                line = messages.readline()
+                if not line:
+                    raise ConnectionError("Connection closed by the daemon")
+                self._handle_message(loads(line))
+
+    def _handle_message(self, message: Dict[str, Any]):
+        event = message.get("event")
+        tracker = self._trackers.get(message.get("currency", ""))
+
+        if event == ERROR_EVENT:
+            self._logger.error(f"Market data daemon error: {message.get('message')}")
+        elif tracker is None:
+            return
+        elif event == RATE_EVENT:
+            tracker.add_rate_data(
+                RateData._make(message["rate"]), timestamp=message["timestamp"]
+            )
+        elif event == CANDLE_EVENT:
+            if message["period"] in CANDLE_PERIODS:
+                tracker.set_candle_data(
+                    message["period"], CandleData._make(message["candle"])
+                )
+        elif event == SNAPSHOT_EVENT:
+            tracker.seed_rate_history(
+                [(timestamp, rate) for timestamp, rate in message["history"]]
+            )
+            tracker.set_latest_rate_data(RateData._make(message["rate"]))
+            for period_key, candle in message["candles"].items():
+                if period_key in CANDLE_PERIODS:
+                    tracker.set_candle_data(period_key, CandleData._make(candle))
+
+
+def run_market_data_daemon(
+    logger: logging.Logger,
+    path: str,
+    public_api_url: str,
+    currencies: Optional[List[str]] = None,
+    metrics_port: Optional[int] = None,
+):
+    configure_endpoints(api_url=DEFAULT_API_URL, public_api_url=public_api_url)
+    configure_transport(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT)
+    if metrics_port:
+        start_metrics_server(metrics_port, logger=logger)
+
+    daemon = MarketDataDaemon(path, logger, currencies=currencies)
+    daemon.start()
+    logger.info(f"Publishing market data on {path}")
+
+    stopped = threading.Event()
+    try:
+        daemon.collect_forever(stopped)
+    finally:
+        stopped.set()
+        daemon.stop()
+
+
+__all__ = [
+    "MarketDataClient",
+    "MarketDataDaemon",
+    "MarketDataPublisher",
+    "run_market_data_daemon",
+]
@@ -0,0 +1,277 @@
+import re
+import bisect
+import logging
+import threading
+import socketserver
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Latency buckets in seconds, from a cached local call to a request timing out
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+# The Telegram API path carries the bot token, it is never exported
+TELEGRAM_TOKEN = re.compile(r"^bot[^/]+/")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricDefinition(NamedTuple):
+    name: str
+    type: str
+    help: str
+
+
+HTTP_REQUEST_DURATION = MetricDefinition(
+    "funding_bot_http_request_duration_seconds",
+    HISTOGRAM,
+    "Time from sending a request to receiving its response, by endpoint",
+)
+HTTP_RATE_LIMIT_WAIT = MetricDefinition(
+    "funding_bot_http_rate_limit_wait_seconds",
+    HISTOGRAM,
+    "Time a request waited on the endpoint budget before it was sent",
+)
+HTTP_RESPONSES = MetricDefinition(
+    "funding_bot_http_responses_total",
+    COUNTER,
+    "Responses received, by endpoint and status code",
+)
+HTTP_ERRORS = MetricDefinition(
+    "funding_bot_http_errors_total",
+    COUNTER,
+    "Requests that failed without a response (connection errors and timeouts)",
+)
+TELEGRAM_RETRIES = MetricDefinition(
+    "funding_bot_telegram_retries_total",
+    COUNTER,
+    "Telegram messages resent from the outbox",
+)
+LOOP_DURATION = MetricDefinition(
+    "funding_bot_loop_duration_seconds",
+    HISTOGRAM,
+    "Duration of one iteration of the trading loop, by account",
+)
+CURRENCY_DURATION = MetricDefinition(
+    "funding_bot_currency_duration_seconds",
+    HISTOGRAM,
+    "Time spent processing one currency in a loop, by account and currency",
+)
+TIME_TO_SUBMIT = MetricDefinition(
+    "funding_bot_time_to_submit_seconds",
+    HISTOGRAM,
+    "Time from the start of a currency's loop to its offer being accepted, by account",
+)
+OFFERS_SUBMITTED = MetricDefinition(
+    "funding_bot_offers_submitted_total",
+    COUNTER,
+    "Funding offers placed, by account and currency",
+)
+OFFERS_FAILED = MetricDefinition(
+    "funding_bot_offers_failed_total",
+    COUNTER,
+    "Funding offers the exchange did not accept, by account and currency",
+)
+OFFERS_CANCELLED = MetricDefinition(
+    "funding_bot_offers_cancelled_total",
+    COUNTER,
+    "Expired funding offers cancelled, by account and currency",
+)
+
+ACCOUNT_FAILURES = MetricDefinition(
+    "funding_bot_account_failures_total",
+    COUNTER,
+    "Loop iterations of an account that failed with an exception, by account",
+)
+
+
+def get_endpoint_label(path: str) -> str:
+    return TELEGRAM_TOKEN.sub("bot/", path.lstrip("/"))
+
+
+def get_label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    values = ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in items
+    )
+    return f"{{{values}}}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram(object):
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # Observations per bucket, the last one counts the values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> List[Tuple[float, int]]:
+        cumulative = 0
+        counts: List[Tuple[float, int]] = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            counts.append((bound, cumulative))
+        return counts
+
+
+class MetricsRegistry(object):
+    # Counters and latency histograms in memory, by metric and label values, rendered
+    # in the Prometheus text format. Updated from the runner, its executor workers
+    # and the notifier thread, every access holds the lock
+    def __init__(self):
+        self._definitions: Dict[str, MetricDefinition] = dict()
+        self._counters: Dict[str, Dict[LabelKey, float]] = dict()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = dict()
+        self._lock = threading.Lock()
+
+    def increment(self, metric: MetricDefinition, value: float = 1, **labels: str):
+        key = get_label_key(labels)
+
+        with self._lock:
+            self._definitions[metric.name] = metric
+            counters = self._counters.setdefault(metric.name, dict())
+            counters[key] = counters.get(key, 0) + value
+
+    def observe(self, metric: MetricDefinition, value: float, **labels: str):
+        key = get_label_key(labels)
+
+        with self._lock:
+            self._definitions[metric.name] = metric
+            histograms = self._histograms.setdefault(metric.name, dict())
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def get_counter(self, metric: MetricDefinition, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(metric.name, {}).get(get_label_key(labels), 0)
+
+    def get_histogram(
+        self, metric: MetricDefinition, **labels: str
+    ) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(metric.name, {}).get(get_label_key(labels))
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        with self._lock:
+            for name in sorted(self._definitions):
+                metric = self._definitions[name]
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.type}")
+
+                for key, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{format_labels(key)} {format_value(value)}")
+
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in histogram.get_cumulative_counts():
+                        labels = format_labels(key, ("le", format_value(bound)))
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    labels = format_labels(key)
+                    lines.append(f"{name}_sum{labels} {format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{labels} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server: "MetricsServer"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        content = self.server.registry.render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    # Serves the registry on GET /metrics for Prometheus to scrape
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+        self._thread: Optional[threading.Thread] = None
+
+    def get_url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="MetricsServer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+_metrics: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    global _metrics
+
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
+
+
+def start_metrics_server(
+    port: int, host: str = "127.0.0.1", logger: Optional[logging.Logger] = None
+) -> MetricsServer:
+    server = MetricsServer(get_metrics(), host, port)
+    server.start()
+    if logger:
+        logger.info(f"Serving metrics on {server.get_url()}")
+    return server
+
+
+__all__ = [
+    "MetricsRegistry",
+    "MetricsServer",
+    "Histogram",
+    "get_metrics",
+    "get_endpoint_label",
+    "start_metrics_server",
+]
@@ -0,0 +1,243 @@
+import time
+import logging
+import threading
+
+import datetime as dt
+
+from funding_bot.configs.base import Configuration
+from funding_bot.bot.cache import get_snapshot_cache
+from funding_bot.bot.market import MarketDataHub
+from funding_bot.bot.metrics import ACCOUNT_FAILURES, LOOP_DURATION, get_metrics
+from funding_bot.bot.notifier import get_notifier
+from funding_bot.bot.ratelimit import PUBLIC_SCOPE
+from funding_bot.bot.tracing import get_tracer
+from funding_bot.bot.transport import get_transport
+from funding_bot.bot.runner import (
+    MIN_LOOP_INTERVAL,
+    NOTIFIER_SHUTDOWN_TIMEOUT,
+    RunnerContext,
+    build_market_data,
+    configure_process,
+    process_currency,
+    send_summary_report,
+    start_account,
+    start_market_data,
+)
+
+from typing import List, NamedTuple, Optional, Type
+
+
+class MultiAccountContext(NamedTuple):
+    accounts: List[RunnerContext]
+    # Trackers of every currency of every account, updated once per tick
+    market_data: MarketDataHub
+    logger: logging.Logger
+    start_time: float
+
+
+def get_account_configurations() -> List[Type[Configuration]]:
+    # ACCOUNT_CONFIGURATIONS of myconfig.py, or its AccountConfiguration alone
+    from funding_bot.configs import myconfig
+
+    return list(
+        getattr(myconfig, "ACCOUNT_CONFIGURATIONS", [myconfig.AccountConfiguration])
+    )
+
+
+def check_configurations(configurations: List[Type[Configuration]]):
+    # Nonces and rate limit budgets are per API key, an account per key
+    if not configurations:
+        raise ValueError("No account configuration")
+
+    names = [configuration.get_account_name() for configuration in configurations]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Account names must be unique: {names}")
+
+    api_keys = [configuration.get_api_key() for configuration in configurations]
+    if len(set(api_keys)) != len(api_keys):
+        raise ValueError("Accounts must use distinct API keys")
+
+    # The balances of the accounts are kept apart, a shared cache would mix them up
+    cache_paths = [
+        configuration.get_balance_cache_path()
+        for configuration in configurations
+        if configuration.get_dynamodb_table_name()
+        and configuration.get_balance_cache_path()
+    ]
+    if len(set(cache_paths)) != len(cache_paths):
+        raise ValueError("Accounts must use distinct balance cache paths")
+
+
+def get_currencies(configurations: List[Type[Configuration]]) -> List[str]:
+    currencies: List[str] = []
+    for configuration in configurations:
+        for currency in configuration.get_funding_currencies():
+            if currency not in currencies:
+                currencies.append(currency)
+    return currencies
+
+
+def start_multi_account_runner(
+    logger: logging.Logger,
+    stream: bool = False,
+    configurations: Optional[List[Type[Configuration]]] = None,
+    metrics_port: Optional[int] = None,
+    marketd: Optional[str] = None,
+) -> MultiAccountContext:
+    # The endpoints, HTTP, notification, tracing and market data settings of the
+    # first account apply to every account
+    configurations = configurations or get_account_configurations()
+    check_configurations(configurations)
+
+    configure_process(configurations[0], logger, metrics_port=metrics_port)
+    start_time = dt.datetime.now().timestamp()
+
+    market_data = build_market_data(
+        configurations[0], get_currencies(configurations), logger
+    )
+
+    accounts: List[RunnerContext] = []
+    for configuration in configurations:
+        name = configuration.get_account_name()
+        try:
+            accounts.append(
+                start_account(
+                    configuration, market_data, logger.getChild(name), start_time
+                )
+            )
+        except Exception:
+            logger.exception(f"Failed to start account {name}, running without it")
+    if not accounts:
+        raise RuntimeError("No account could be started")
+
+    start_market_data(
+        configurations[0], market_data, logger, stream=stream, marketd=marketd
+    )
+
+    return MultiAccountContext(
+        accounts=accounts, market_data=market_data, logger=logger, start_time=start_time
+    )
+
+
+def run_account_tick(context: RunnerContext) -> bool:
+    # Processes every currency of the account from the shared trackers. An exception
+    # fails this iteration of the account only
+    started_at = time.perf_counter()
+
+    try:
+        with get_tracer().trace(
+            "loop", account=context.name, currencies=len(context.funding_currencies)
+        ):
+            for currency in context.funding_currencies:
+                process_currency(context, currency)
+    except Exception:
+        context.logger.exception(f"Loop of account {context.name} failed")
+        get_metrics().increment(ACCOUNT_FAILURES, account=context.name)
+        return False
+
+    get_metrics().observe(
+        LOOP_DURATION, time.perf_counter() - started_at, account=context.name
+    )
+    return True
+
+
+def send_reports(context: RunnerContext):
+    try:
+        send_summary_report(context)
+        context.bot.generate_report(
+            context.credentials, context.funding_currencies, context.logger
+        )
+    except Exception:
+        context.logger.exception(f"Reports of account {context.name} failed")
+        get_metrics().increment(ACCOUNT_FAILURES, account=context.name)
+
+
+def account_loop(context: RunnerContext, stopped: threading.Event):
+    # Paced by the budgets of the account's own API key, an account waiting on its
+    # budgets or backing off does not hold up the others
+    scheduler = get_transport().get_scheduler()
+    scope = context.credentials.api_key
+    run_hours = 0
+
+    while not stopped.is_set():
+        scheduler.start_tick(scope)
+        get_snapshot_cache().start_tick(scope)
+        run_account_tick(context)
+
+        current_hours = int((dt.datetime.now().timestamp() - context.start_time) / 3600)
+        if current_hours != run_hours:
+            run_hours = current_hours
+            send_reports(context)
+
+        stopped.wait(scheduler.get_loop_delay(minimum=MIN_LOOP_INTERVAL, scope=scope))
+
+
+def market_data_loop(
+    context: MultiAccountContext, stopped: threading.Event, pushed: bool
+):
+    # One batched ticker download and the candles of every currency per tick, however
+    # many accounts use them. Pushed rates are kept current in the background
+    if pushed:
+        stopped.wait()
+        return
+
+    scheduler = get_transport().get_scheduler()
+    while not stopped.is_set():
+        scheduler.start_tick(PUBLIC_SCOPE)
+        try:
+            with get_tracer().trace("rate_update"):
+                context.market_data.update_rates()
+        except Exception:
+            context.logger.exception("Market data update failed")
+
+        stopped.wait(
+            scheduler.get_loop_delay(minimum=MIN_LOOP_INTERVAL, scope=PUBLIC_SCOPE)
+        )
+
+
+def multi_account_runner(
+    logger: logging.Logger,
+    stream: bool = False,
+    configurations: Optional[List[Type[Configuration]]] = None,
+    metrics_port: Optional[int] = None,
+    marketd: Optional[str] = None,
+):
+    context = start_multi_account_runner(
+        logger,
+        stream=stream,
+        configurations=configurations,
+        metrics_port=metrics_port,
+        marketd=marketd,
+    )
+    stopped = threading.Event()
+    threads = [
+        threading.Thread(
+            target=account_loop,
+            args=(account, stopped),
+            name=f"Account-{account.name}",
+            daemon=True,
+        )
+        for account in context.accounts
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        # Rates streamed or sent by the market data daemon need no polling
+        market_data_loop(context, stopped, stream or marketd is not None)
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join(timeout=get_transport().get_timeout())
+        # Deliver the notifications and write the ticks still queued before exiting
+        get_notifier().close(timeout=NOTIFIER_SHUTDOWN_TIMEOUT)
+        context.market_data.close()
+
+
+__all__ = [
+    "MultiAccountContext",
+    "multi_account_runner",
+    "start_multi_account_runner",
+    "run_account_tick",
+    "get_account_configurations",
+]
@@ -0,0 +1,347 @@
+import time
+import logging
+import requests
+import threading
+
+from urllib.parse import quote
+
+from funding_bot.bot.outbox import NotificationOutbox, OutboxMessage
+from funding_bot.bot.metrics import TELEGRAM_RETRIES, get_metrics
+from funding_bot.bot.ratelimit import TokenBucket, parse_retry_after
+from funding_bot.bot.transport import get_transport
+
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_COALESCE_WINDOW = 1.0
+# Telegram allows about one message per second in a chat and 20 per minute in a group
+DEFAULT_MESSAGES_PER_MINUTE = 20
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+
+class TelegramNotifier(object):
+    # Sends Telegram messages from a background thread so the trading loop never waits
+    # on the Telegram API. Messages to the same chat that arrive within the coalesce
+    # window are merged into one, and each chat is kept under its rate limit. Messages
+    # that fail to send are retried from the outbox, between new messages
+    def __init__(
+        self,
+        logger: logging.Logger,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+        messages_per_minute: int = DEFAULT_MESSAGES_PER_MINUTE,
+        outbox: Optional[NotificationOutbox] = None,
+    ):
+        self._logger = logger
+        self._outbox = outbox or NotificationOutbox()
+        self._max_pending = max_pending
+        self._coalesce_window = coalesce_window
+        self._messages_per_minute = messages_per_minute
+
+        # Pending messages and the time the oldest of them was queued, by chat
+        # (the telegram API url of the chat)
+        self._pending: Dict[str, List[str]] = dict()
+        self._queued_at: Dict[str, float] = dict()
+        self._pending_count = 0
+        self._buckets: Dict[str, TokenBucket] = dict()
+        self._dropped = 0
+        self._sending = 0
+        self._flushing = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+
+        self._sender = threading.Thread(
+            target=self._send_forever, name="TelegramNotifier", daemon=True
+        )
+        self._sender.start()
+
+    def send(self, telegram_api: str, msg: str):
+        with self._condition:
+            if self._stopped or self._pending_count >= self._max_pending:
+                self._dropped += 1
+                return
+
+            if telegram_api not in self._pending:
+                self._pending[telegram_api] = []
+                self._queued_at[telegram_api] = time.monotonic()
+            self._pending[telegram_api].append(msg)
+            self._pending_count += 1
+            self._condition.notify_all()
+
+    def requeue_failed(self, telegram_api: Optional[str] = None):
+        # Retries the messages waiting in the outbox without waiting for their back off
+        self._outbox.retry_now(telegram_api)
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_pending_count(self) -> int:
+        return self._pending_count
+
+    def get_failed_count(self) -> int:
+        return self._outbox.get_count()
+
+    def get_outbox(self) -> NotificationOutbox:
+        return self._outbox
+
+    def get_dropped_count(self) -> int:
+        return self._dropped
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Sends every queued message without waiting for the coalesce window, still
+        # within the rate limits. Returns False when the timeout expires first
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(
+                    lambda: not self._pending_count and not self._sending, timeout
+                )
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._stopped = True
+            # Messages not sent in time are retried from the outbox after a restart
+            self._save_pending()
+            self._condition.notify_all()
+
+        # A message being sent goes to the outbox when it fails, which takes up to
+        # the transport timeout
+        self._sender.join(timeout=get_transport().get_timeout() + 1)
+        if self._sender.is_alive():
+            self._logger.warning("Telegram notifier did not stop, outbox left open")
+        else:
+            self._outbox.close()
+        return flushed
+
+    def _save_pending(self):
+        # Held under the condition
+        for telegram_api, messages in self._pending.items():
+            for message in messages:
+                self._outbox.add(telegram_api, message)
+        self._pending.clear()
+        self._queued_at.clear()
+        self._pending_count = 0
+
+    def _get_bucket(self, telegram_api: str) -> TokenBucket:
+        bucket = self._buckets.get(telegram_api)
+        if bucket is None:
+            bucket = TokenBucket(self._messages_per_minute)
+            # A burst would go over the per second chat limit
+            bucket.capacity = 1.0
+            bucket.tokens = 1.0
+            self._buckets[telegram_api] = bucket
+        return bucket
+
+    def _next_ready(self, now: float) -> Tuple[Optional[str], Optional[float]]:
+        # The chat to send to next and takes its token, otherwise the seconds until one
+        # is ready
+        delay: Optional[float] = None
+
+        for telegram_api, queued_at in self._queued_at.items():
+            ready_at = now if self._flushing else queued_at + self._coalesce_window
+            if ready_at <= now:
+                wait = self._get_bucket(telegram_api).reserve(now)
+                if wait <= 0:
+                    return telegram_api, None
+            else:
+                wait = ready_at - now
+            delay = wait if delay is None else min(delay, wait)
+
+        return None, delay
+
+    def _next_retry(
+        self, now: float, due: List[OutboxMessage], next_attempt_at: Optional[float]
+    ) -> Tuple[Optional[str], List[int], List[str], Optional[float]]:
+        # The due outbox messages to retry next, merged by chat like new messages, and
+        # takes the chat's token. Otherwise the seconds until a retry is due
+        chats: Dict[str, Tuple[List[int], List[str]]] = dict()
+        for message in due:
+            chats.setdefault(message.chat, ([], []))
+            chats[message.chat][0].append(message.id)
+            chats[message.chat][1].append(message.message)
+
+        delay: Optional[float] = None
+        for telegram_api, (ids, messages) in chats.items():
+            wait = self._get_bucket(telegram_api).reserve(now)
+            if wait <= 0:
+                count = len(self._get_batch(messages))
+                return telegram_api, ids[:count], messages[:count], None
+            delay = wait if delay is None else min(delay, wait)
+
+        if delay is None and next_attempt_at is not None:
+            delay = max(0.0, next_attempt_at - time.time())
+        return None, [], [], delay
+
+    @classmethod
+    def _get_batch(cls, messages: List[str]) -> List[str]:
+        # As many messages as fit in a single Telegram message
+        length = len(messages[0])
+        count = 1
+        while (
+            count < len(messages)
+            and length + len(MESSAGE_SEPARATOR) + len(messages[count])
+            <= MAX_MESSAGE_LENGTH
+        ):
+            length += len(MESSAGE_SEPARATOR) + len(messages[count])
+            count += 1
+        return messages[:count]
+
+    def _take_batch(self, telegram_api: str) -> List[str]:
+        messages = self._pending[telegram_api]
+        batch = self._get_batch(messages)
+
+        if len(batch) == len(messages):
+            del self._pending[telegram_api]
+            del self._queued_at[telegram_api]
+        else:
+            self._pending[telegram_api] = messages[len(batch) :]
+        self._pending_count -= len(batch)
+        return batch
+
+    def _take_next(self) -> Optional[Tuple[str, List[str]]]:
+        # A batch of new messages ready to send, held under the condition
+        now = time.monotonic()
+        telegram_api, _ = self._next_ready(now)
+        if telegram_api is None:
+            return None
+        self._sending += 1
+        return telegram_api, self._take_batch(telegram_api)
+
+    def _send_forever(self):
+        while True:
+            outbox_ids: List[int] = []
+
+            with self._condition:
+                ready = self._take_next()
+                # Failed messages stay in the outbox on shutdown
+                if ready is None and self._stopped:
+                    return
+
+            if ready is None:
+                # The outbox is read without holding the condition, send() never waits
+                # on disk I/O
+                due = self._outbox.get_due()
+                next_attempt_at = self._outbox.get_next_attempt_at()
+
+                with self._condition:
+                    # New messages go first, including the ones queued meanwhile
+                    ready = self._take_next()
+                    if ready is None:
+                        if self._stopped:
+                            return
+
+                        now = time.monotonic()
+                        _, delay = self._next_ready(now)
+                        telegram_api, outbox_ids, batch, retry_delay = self._next_retry(
+                            now, due, next_attempt_at
+                        )
+                        if telegram_api is None:
+                            if delay is None or (
+                                retry_delay is not None and retry_delay < delay
+                            ):
+                                delay = retry_delay
+                            self._condition.wait(delay)
+                            continue
+                        self._sending += 1
+                        ready = (telegram_api, batch)
+
+            telegram_api, batch = ready
+            try:
+                self._deliver(telegram_api, batch, outbox_ids)
+            finally:
+                with self._condition:
+                    self._sending -= 1
+                    self._condition.notify_all()
+
+    def _deliver(self, telegram_api: str, batch: List[str], outbox_ids: List[int]):
+        # New messages that fail go to the outbox, retried ones are backed off there
+        msg = MESSAGE_SEPARATOR.join(batch)
+        if outbox_ids:
+            get_metrics().increment(TELEGRAM_RETRIES, len(outbox_ids))
+
+        try:
+            response = get_transport().get(f"{telegram_api}{quote(msg)}")
+            status_code = response.status_code
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Telegram notification failed: {e}")
+            status_code = None
+
+        if status_code == 200:
+            if outbox_ids:
+                self._outbox.remove(outbox_ids)
+            return
+
+        if status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            with self._condition:
+                self._get_bucket(telegram_api).back_off(
+                    time.monotonic(), parse_retry_after(retry_after)
+                )
+            if not outbox_ids:
+                # Back in front of the queue, sent once the chat is allowed again.
+                # Once closing, it goes to the outbox instead
+                with self._condition:
+                    requeued = not self._stopped
+                    if requeued:
+                        self._pending[telegram_api] = batch + self._pending.get(
+                            telegram_api, []
+                        )
+                        self._queued_at.setdefault(telegram_api, time.monotonic())
+                        self._pending_count += len(batch)
+                if requeued:
+                    return
+        elif status_code is not None and status_code < 500:
+            # Rejected by Telegram, sending it again would fail the same way
+            self._logger.warning(f"Telegram notification failed with {status_code}")
+            if outbox_ids:
+                self._outbox.remove(outbox_ids)
+            return
+        elif status_code is not None:
+            self._logger.warning(f"Telegram notification failed with {status_code}")
+
+        if outbox_ids:
+            self._outbox.retry_later(outbox_ids)
+        else:
+            for message in batch:
+                self._outbox.add(telegram_api, message)
+
+
+_notifier: Optional[TelegramNotifier] = None
+
+
+def get_notifier() -> TelegramNotifier:
+    global _notifier
+
+    if _notifier is None:
+        _notifier = TelegramNotifier(logging.getLogger("FundingBot"))
+    return _notifier
+
+
+def configure_notifier(
+    logger: logging.Logger,
+    coalesce_window: float,
+    messages_per_minute: int,
+    outbox: Optional[NotificationOutbox] = None,
+) -> TelegramNotifier:
+    global _notifier
+
+    if _notifier is not None:
+        _notifier.close(timeout=10)
+    _notifier = TelegramNotifier(
+        logger,
+        coalesce_window=coalesce_window,
+        messages_per_minute=messages_per_minute,
+        outbox=outbox,
+    )
+    return _notifier
+
+
+__all__ = [
+    "TelegramNotifier",
+    "get_notifier",
+    "configure_notifier",
+]
@@ -0,0 +1,128 @@
+import time
+import logging
+import datetime as dt
+
+from funding_bot.bot.funding import FundingBot, Credentials
+
+from typing import Dict, List, NamedTuple, Optional
+
+ACTIVE = "ACTIVE"
+
+# Rows per funding/offers/{currency}/hist request, the API returns at most 500
+HISTORY_LIMIT = 100
+# Each sync reads this far back before the cursor, in milliseconds, so an offer the
+# exchange records late is not missed
+HISTORY_OVERLAP = 60000
+
+
+class OfferState(NamedTuple):
+    id: str
+    currency: str
+    amount: str
+    submitted_at: dt.datetime
+    status: str
+
+
+def get_timestamp() -> int:
+    return int(time.time() * 1000)
+
+
+class OrderTracker(object):
+    # Local index of the offers submitted by the runner, by currency and offer id.
+    # Offers are closed from the funding offer history, read from a cursor so every
+    # sync only downloads the rows updated since the previous one
+    def __init__(self, currencies: List[str]):
+        self._offers: Dict[str, Dict[str, OfferState]] = {
+            currency: dict() for currency in currencies
+        }
+        started_at = get_timestamp()
+        self._cursors: Dict[str, int] = {
+            currency: started_at for currency in currencies
+        }
+
+    def add(
+        self,
+        currency: str,
+        id_: str,
+        amount: str,
+        submitted_at: Optional[dt.datetime] = None,
+    ) -> OfferState:
+        offer = OfferState(
+            id=id_,
+            currency=currency,
+            amount=amount,
+            submitted_at=submitted_at or dt.datetime.now(),
+            status=ACTIVE,
+        )
+        self._offers[currency][id_] = offer
+        return offer
+
+    def remove(self, currency: str, id_: str) -> Optional[OfferState]:
+        return self._offers[currency].pop(id_, None)
+
+    def get(self, currency: str, id_: str) -> Optional[OfferState]:
+        return self._offers[currency].get(id_)
+
+    def has_active(self, currency: str) -> bool:
+        return bool(self._offers[currency])
+
+    def get_active(self, currency: str) -> List[OfferState]:
+        return list(self._offers[currency].values())
+
+    def get_expired(self, currency: str, age: dt.timedelta) -> List[OfferState]:
+        # Active offers submitted more than age ago
+        now = dt.datetime.now()
+        return [
+            offer
+            for offer in self._offers[currency].values()
+            if now - offer.submitted_at > age
+        ]
+
+    def get_cursor(self, currency: str) -> int:
+        return self._cursors[currency]
+
+    def sync(
+        self, credentials: Credentials, currency: str, logger: logging.Logger
+    ) -> List[OfferState]:
+        # Reads the history rows updated since the last sync, newest first page by
+        # page, and returns the tracked offers they close with their final status
+        offers = self._offers[currency]
+        if not offers:
+            return []
+
+        start = self._cursors[currency] - HISTORY_OVERLAP
+        end: Optional[int] = None
+        cursor = self._cursors[currency]
+        closed: Dict[str, OfferState] = dict()
+
+        while True:
+            rows = FundingBot.get_funding_offer_history_data(
+                credentials, currency, logger, start=start, end=end, limit=HISTORY_LIMIT
+            )
+            if rows is None:
+                # Synced again from the same cursor on the next call
+                return []
+
+            for row in rows:
+                cursor = max(cursor, row.mts_updated)
+                offer = offers.get(row.id)
+                if offer and row.id not in closed:
+                    closed[row.id] = offer._replace(status=row.status)
+
+            if len(rows) < HISTORY_LIMIT:
+                break
+            end = min(row.mts_updated for row in rows) - 1
+            if end < start:
+                break
+
+        for id_ in closed:
+            del offers[id_]
+        self._cursors[currency] = cursor
+        return list(closed.values())
+
+
+__all__ = [
+    "OrderTracker",
+    "OfferState",
+    "ACTIVE",
+]
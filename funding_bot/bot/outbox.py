@@ -0,0 +1,200 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+from typing import List, NamedTuple, Optional
+
+OUTBOX_TABLE = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    message TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    UNIQUE (chat, digest)
+)
+"""
+
+OUTBOX_INDEX = (
+    "CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt_at)"
+)
+
+DEFAULT_MAX_MESSAGES = 500
+# Messages older than this are stale and dropped instead of being replayed, in seconds
+DEFAULT_MAX_AGE = 3600.0
+DEFAULT_MAX_ATTEMPTS = 10
+# Retry delays double from RETRY_DELAY seconds after every failed attempt
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 600.0
+
+
+class OutboxMessage(NamedTuple):
+    id: int
+    chat: str
+    message: str
+    queued_at: float
+    attempts: int
+
+
+class NotificationOutbox(object):
+    # SQLite journal of the notifications that could not be delivered, kept across
+    # restarts when a path is configured. Holds at most max_messages, identical
+    # messages to a chat are only kept once, and messages are dropped once they are
+    # older than max_age or failed max_attempts times
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+        max_age: float = DEFAULT_MAX_AGE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self._max_messages = max_messages
+        self._max_age = max_age
+        self._max_attempts = max_attempts
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+        # Shared by the notifier thread and the runner, every access holds the lock
+        self._connection = sqlite3.connect(
+            path or ":memory:", timeout=30, check_same_thread=False
+        )
+        if path:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            self._connection.execute(OUTBOX_TABLE)
+            self._connection.execute(OUTBOX_INDEX)
+
+    @classmethod
+    def get_digest(cls, message: str) -> str:
+        return hashlib.sha1(message.encode("utf8")).hexdigest()
+
+    @classmethod
+    def get_retry_delay(cls, attempts: int) -> float:
+        return min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** max(0, attempts - 1))
+
+    def add(self, chat: str, message: str, now: Optional[float] = None) -> bool:
+        # Returns False when the same message to the chat is already waiting
+        now = now or time.time()
+
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(chat, digest, message, queued_at, attempts, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (
+                    chat,
+                    self.get_digest(message),
+                    message,
+                    now,
+                    now + self.get_retry_delay(1),
+                ),
+            )
+            if not cursor.rowcount:
+                return False
+
+            # Full, the oldest messages are dropped first
+            overflow = self._count() - self._max_messages
+            if overflow > 0:
+                self._connection.execute(
+                    "DELETE FROM outbox WHERE id IN "
+                    "(SELECT id FROM outbox ORDER BY queued_at, id LIMIT ?)",
+                    (overflow,),
+                )
+                self._dropped += overflow
+            return True
+
+    def get_due(
+        self, now: Optional[float] = None, limit: int = 100
+    ) -> List[OutboxMessage]:
+        # Messages whose retry delay is over, oldest first. Stale ones are dropped
+        now = now or time.time()
+
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM outbox WHERE queued_at < ?", (now - self._max_age,)
+            )
+            self._dropped += max(0, cursor.rowcount)
+
+            rows = self._connection.execute(
+                "SELECT id, chat, message, queued_at, attempts FROM outbox "
+                "WHERE next_attempt_at <= ? ORDER BY queued_at, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+
+        return [
+            OutboxMessage(
+                id=row[0],
+                chat=row[1],
+                message=row[2],
+                queued_at=row[3],
+                attempts=row[4],
+            )
+            for row in rows
+        ]
+
+    def get_next_attempt_at(self) -> Optional[float]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox"
+            ).fetchone()
+        return row[0] if row else None
+
+    def remove(self, ids: List[int]):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM outbox WHERE id = ?", [(id_,) for id_ in ids]
+            )
+
+    def retry_later(self, ids: List[int], now: Optional[float] = None):
+        # Backs off every message of a failed attempt, dropping the ones out of attempts
+        now = now or time.time()
+
+        with self._lock, self._connection:
+            for id_ in ids:
+                row = self._connection.execute(
+                    "SELECT attempts FROM outbox WHERE id = ?", (id_,)
+                ).fetchone()
+                if row is None:
+                    continue
+
+                attempts = row[0] + 1
+                if attempts > self._max_attempts:
+                    self._connection.execute("DELETE FROM outbox WHERE id = ?", (id_,))
+                    self._dropped += 1
+                else:
+                    self._connection.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                        (attempts, now + self.get_retry_delay(attempts), id_),
+                    )
+
+    def retry_now(self, chat: Optional[str] = None):
+        with self._lock, self._connection:
+            if chat is None:
+                self._connection.execute("UPDATE outbox SET next_attempt_at = 0")
+            else:
+                self._connection.execute(
+                    "UPDATE outbox SET next_attempt_at = 0 WHERE chat = ?", (chat,)
+                )
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def get_count(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def get_dropped_count(self) -> int:
+        return self._dropped
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+__all__ = [
+    "NotificationOutbox",
+    "OutboxMessage",
+]
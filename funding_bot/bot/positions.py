@@ -0,0 +1,121 @@
+import threading
+
+from typing import Dict, Generic, Iterable, List, Optional, TypeVar
+
+from typing_extensions import Protocol
+
+
+class Position(Protocol):
+    # ActiveFundingData and ActiveFundingOfferData
+    @property
+    def id(self) -> str:
+        ...
+
+    @property
+    def currency(self) -> str:
+        ...
+
+    @property
+    def amount(self) -> float:
+        ...
+
+
+PositionType = TypeVar("PositionType", bound=Position)
+
+
+class PositionBook(Generic[PositionType]):
+    # Credits or offers indexed by currency and id, with the total amount of each
+    # currency kept up to date on every insert, update and removal. A snapshot is
+    # applied as the difference with the positions already known
+    def __init__(self):
+        self._positions: Dict[str, Dict[str, PositionType]] = dict()
+        self._totals: Dict[str, float] = dict()
+        self._lock = threading.Lock()
+
+    def get_total(self, currency: str) -> float:
+        return self._totals.get(currency, 0)
+
+    def get_count(self, currency: str) -> int:
+        return len(self._positions.get(currency, ()))
+
+    def get(self, currency: str, id_: str) -> Optional[PositionType]:
+        return self._positions.get(currency, {}).get(id_)
+
+    def get_positions(self, currency: Optional[str] = None) -> List[PositionType]:
+        with self._lock:
+            if currency is not None:
+                return list(self._positions.get(currency, {}).values())
+            return [
+                position
+                for positions in self._positions.values()
+                for position in positions.values()
+            ]
+
+    def update(self, position: PositionType):
+        with self._lock:
+            self._update(position)
+
+    def remove(self, currency: str, id_: str) -> Optional[PositionType]:
+        with self._lock:
+            return self._remove(currency, id_)
+
+    def replace(
+        self, positions: Iterable[PositionType], currency: Optional[str] = None
+    ):
+        # The positions of one currency, or of every currency when none is given
+        with self._lock:
+            snapshot: Dict[str, Dict[str, PositionType]] = dict()
+            for position in positions:
+                if currency is None or position.currency == currency:
+                    snapshot.setdefault(position.currency, dict())[
+                        str(position.id)
+                    ] = position
+
+            currencies = [currency] if currency is not None else list(self._positions)
+            for key in currencies:
+                current = self._positions.get(key, {})
+                kept = snapshot.get(key, {})
+                for id_ in [id_ for id_ in current if id_ not in kept]:
+                    self._remove(key, id_)
+
+            for positions_by_id in snapshot.values():
+                for position in positions_by_id.values():
+                    self._update(position)
+
+    def _update(self, position: PositionType):
+        id_ = str(position.id)
+        positions = self._positions.setdefault(position.currency, dict())
+        previous = positions.get(id_)
+        if previous is not None and previous.amount == position.amount:
+            positions[id_] = position
+            return
+
+        positions[id_] = position
+        self._totals[position.currency] = (
+            self._totals.get(position.currency, 0)
+            + position.amount
+            - (previous.amount if previous is not None else 0)
+        )
+
+    def _remove(self, currency: str, id_: str) -> Optional[PositionType]:
+        positions = self._positions.get(currency)
+        if not positions:
+            return None
+
+        position = positions.pop(str(id_), None)
+        if position is None:
+            return None
+
+        if positions:
+            self._totals[currency] -= position.amount
+        else:
+            # No rounding error left behind by the additions and subtractions
+            del self._positions[currency]
+            self._totals.pop(currency, None)
+        return position
+
+
+__all__ = [
+    "Position",
+    "PositionBook",
+]
@@ -0,0 +1,259 @@
+import math
+import time
+import threading
+import datetime as dt
+
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+MAX_BACKOFF = 60.0
+
+# Scope of the requests made without an API key, the public market data
+PUBLIC_SCOPE = ""
+
+# Scope and end point, or budget prefix when it is shared
+BucketKey = Tuple[str, str]
+
+
+class EndpointBudget(NamedTuple):
+    prefix: str
+    requests_per_minute: int
+    # All end points under the prefix count against one budget, otherwise each has its own
+    shared: bool
+    # Each API key has its own budget, otherwise every request counts against one
+    per_key: bool = False
+
+
+# Bitfinex REST limits, matched against the request path by longest prefix
+DEFAULT_BUDGETS: List[EndpointBudget] = [
+    EndpointBudget(prefix="v2/tickers", requests_per_minute=30, shared=True),
+    EndpointBudget(prefix="v2/candles/", requests_per_minute=30, shared=True),
+    EndpointBudget(
+        prefix="v2/auth/w/", requests_per_minute=90, shared=False, per_key=True
+    ),
+    EndpointBudget(
+        prefix="v2/auth/", requests_per_minute=90, shared=False, per_key=True
+    ),
+]
+
+
+def build_budgets(requests_per_minute: Dict[str, int]) -> List[EndpointBudget]:
+    # Overrides the default budgets by prefix, unknown prefixes get their own budget
+    budgets = [
+        budget._replace(
+            requests_per_minute=requests_per_minute.get(
+                budget.prefix, budget.requests_per_minute
+            )
+        )
+        for budget in DEFAULT_BUDGETS
+    ]
+    known_prefixes = {budget.prefix for budget in DEFAULT_BUDGETS}
+
+    for prefix, limit in requests_per_minute.items():
+        if prefix not in known_prefixes:
+            budgets.append(
+                EndpointBudget(
+                    prefix=prefix,
+                    requests_per_minute=limit,
+                    shared=False,
+                    per_key=prefix.startswith("v2/auth/"),
+                )
+            )
+    return budgets
+
+
+def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    # Seconds to wait from a Retry-After header, either seconds or an HTTP date.
+    # None when it is missing or cannot be parsed, the exponential back off applies
+    if not retry_after:
+        return None
+
+    try:
+        seconds = float(retry_after)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=dt.timezone.utc)
+        seconds = (date - dt.datetime.now(dt.timezone.utc)).total_seconds()
+
+    if not math.isfinite(seconds):
+        return None
+    return max(0.0, seconds)
+
+
+class TokenBucket(object):
+    def __init__(self, requests_per_minute: int):
+        self.rate = requests_per_minute / 60
+        # Allow bursts of up to 10 seconds worth of requests
+        self.capacity = max(1.0, self.rate * 10)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_rate_limits = 0
+
+    def reserve(self, now: float) -> float:
+        # Takes a token and returns 0, or returns the seconds until one is available
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def back_off(self, now: float, retry_after: Optional[float]):
+        self.consecutive_rate_limits += 1
+        delay = retry_after or min(MAX_BACKOFF, 2.0 ** self.consecutive_rate_limits)
+        self.blocked_until = max(self.blocked_until, now + delay)
+        # A single request is let through to probe the limit once the back off is over
+        self.tokens = 1
+        self.updated_at = self.blocked_until
+
+
+class RequestScheduler(object):
+    # Token bucket per end point budget, and per API key (the request scope) for the
+    # authenticated ones. Writes (offer submit / cancel) take priority, reads of the
+    # same API key, and public reads, wait while a write is queued so order placement
+    # is never starved. An account backing off never delays the others
+    def __init__(self, budgets: Optional[List[EndpointBudget]] = None):
+        self._budgets = sorted(
+            budgets if budgets is not None else DEFAULT_BUDGETS,
+            key=lambda budget: len(budget.prefix),
+            reverse=True,
+        )
+        self._buckets: Dict[BucketKey, TokenBucket] = dict()
+        self._bucket_rates: Dict[BucketKey, int] = dict()
+        self._pending_writes: Dict[str, int] = dict()
+        self._condition = threading.Condition()
+
+        # Ticks are timed per scope, None for every request
+        self._tick_started_at: Dict[Optional[str], float] = {None: time.monotonic()}
+        self._tick_requests: Dict[BucketKey, int] = dict()
+
+    @classmethod
+    def is_write(cls, path: str) -> bool:
+        return path.startswith("v2/auth/w/")
+
+    def _get_bucket_key(self, path: str, scope: Optional[str]) -> Optional[BucketKey]:
+        for budget in self._budgets:
+            if path.startswith(budget.prefix):
+                key = (
+                    (scope or PUBLIC_SCOPE) if budget.per_key else PUBLIC_SCOPE,
+                    budget.prefix if budget.shared else path,
+                )
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(budget.requests_per_minute)
+                    self._bucket_rates[key] = budget.requests_per_minute
+                return key
+        return None
+
+    def _is_write_pending(self, scope: str) -> bool:
+        if scope == PUBLIC_SCOPE:
+            return any(self._pending_writes.values())
+        return self._pending_writes.get(scope, 0) > 0
+
+    def acquire(self, path: str, scope: Optional[str] = None):
+        write = self.is_write(path)
+
+        with self._condition:
+            key = self._get_bucket_key(path, scope)
+            if key is None:
+                return
+
+            scope = key[0]
+            if write:
+                self._pending_writes[scope] = self._pending_writes.get(scope, 0) + 1
+            try:
+                while True:
+                    if not write and self._is_write_pending(scope):
+                        self._condition.wait(1)
+                        continue
+
+                    delay = self._buckets[key].reserve(time.monotonic())
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+            finally:
+                if write:
+                    self._pending_writes[scope] -= 1
+                    self._condition.notify_all()
+
+            self._tick_requests[key] = self._tick_requests.get(key, 0) + 1
+
+    def record_response(
+        self,
+        path: str,
+        status_code: int,
+        retry_after: Optional[str] = None,
+        scope: Optional[str] = None,
+    ):
+        with self._condition:
+            key = self._get_bucket_key(path, scope)
+            if key is None:
+                return
+
+            bucket = self._buckets[key]
+            if status_code == 429:
+                bucket.back_off(time.monotonic(), parse_retry_after(retry_after))
+            elif status_code < 400:
+                bucket.consecutive_rate_limits = 0
+
+    def start_tick(self, scope: Optional[str] = None):
+        # Starts the tick of the requests of one API key, or PUBLIC_SCOPE, or of every
+        # request when no scope is given
+        with self._condition:
+            now = time.monotonic()
+            if scope is None:
+                self._tick_started_at = {None: now}
+                self._tick_requests = dict()
+                return
+
+            self._tick_started_at[scope] = now
+            self._tick_requests = {
+                key: count
+                for key, count in self._tick_requests.items()
+                if key[0] != scope
+            }
+
+    def get_loop_delay(
+        self, minimum: float, maximum: float = MAX_BACKOFF, scope: Optional[str] = None
+    ) -> float:
+        # Seconds to wait before the next loop so that repeating the requests made
+        # during this one, in the scope when one is given, stays within every budget
+        with self._condition:
+            now = time.monotonic()
+            elapsed = now - self._tick_started_at.get(
+                scope, self._tick_started_at[None]
+            )
+            delay = minimum
+
+            for key, count in self._tick_requests.items():
+                if scope is not None and key[0] != scope:
+                    continue
+
+                bucket = self._buckets[key]
+                delay = max(
+                    delay,
+                    count * 60 / self._bucket_rates[key] - elapsed,
+                    bucket.blocked_until - now,
+                )
+
+            return min(delay, maximum)
+
+
+__all__ = [
+    "PUBLIC_SCOPE",
+    "EndpointBudget",
+    "RequestScheduler",
+    "DEFAULT_BUDGETS",
+    "build_budgets",
+    "parse_retry_after",
+]
@@ -0,0 +1,160 @@
+import math
+
+from array import array
+
+from typing import List, NamedTuple, Tuple
+
+
+class WindowStatistics(NamedTuple):
+    samples: int
+    last: float
+    mean: float
+    ema: float
+    variance: float
+    min: float
+    max: float
+
+
+class MonotonicQueue(object):
+    # Fixed size ring of sample sequence numbers whose values are kept monotonic,
+    # the head is always the minimum (or maximum) of the samples still in the window
+    def __init__(self, capacity: int, values: "array[float]", keep_minimum: bool):
+        self._sequences = array("q", [0] * capacity)
+        self._capacity = capacity
+        self._values = values
+        self._keep_minimum = keep_minimum
+        self._head = 0
+        self._size = 0
+
+    def push(self, sequence: int, value: float):
+        capacity = self._capacity
+        while self._size:
+            tail = self._sequences[(self._head + self._size - 1) % capacity]
+            tail_value = self._values[tail % capacity]
+            if (tail_value < value) if self._keep_minimum else (tail_value > value):
+                break
+            self._size -= 1
+
+        self._sequences[(self._head + self._size) % capacity] = sequence
+        self._size += 1
+
+    def evict_before(self, sequence: int):
+        while self._size and self._sequences[self._head] < sequence:
+            self._head = (self._head + 1) % self._capacity
+            self._size -= 1
+
+    def peek(self) -> float:
+        if not self._size:
+            return 0.0
+        return self._values[self._sequences[self._head] % self._capacity]
+
+
+class RollingWindow(object):
+    # Statistics over the samples of the last `duration` seconds, updated in O(1) per
+    # sample on preallocated arrays. Holds at most `capacity` samples, the oldest one
+    # is dropped early when the window is full
+    def __init__(self, duration: float, capacity: int):
+        self._duration = duration
+        self._capacity = capacity
+        self._values = array("d", [0.0] * capacity)
+        self._timestamps = array("d", [0.0] * capacity)
+        self._minimum = MonotonicQueue(capacity, self._values, keep_minimum=True)
+        self._maximum = MonotonicQueue(capacity, self._values, keep_minimum=False)
+
+        # Sequence numbers of the oldest and the next sample
+        self._start = 0
+        self._end = 0
+
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._ema = 0.0
+        self._last = 0.0
+        self._last_timestamp = 0.0
+
+    def get_duration(self) -> float:
+        return self._duration
+
+    def get_last_timestamp(self) -> float:
+        return self._last_timestamp
+
+    def get_samples(self, timestamp: float) -> List[Tuple[float, float]]:
+        # (timestamp, value) of every sample in the window, oldest first
+        self._evict(timestamp - self._duration)
+        return [
+            (
+                self._timestamps[sequence % self._capacity],
+                self._values[sequence % self._capacity],
+            )
+            for sequence in range(self._start, self._end)
+        ]
+
+    def add(self, value: float, timestamp: float):
+        self._evict(timestamp - self._duration)
+        if self._end - self._start == self._capacity:
+            self._remove_oldest()
+
+        index = self._end % self._capacity
+        self._values[index] = value
+        self._timestamps[index] = timestamp
+        self._minimum.push(self._end, value)
+        self._maximum.push(self._end, value)
+        self._end += 1
+
+        # Welford's online mean and variance
+        count = self._end - self._start
+        delta = value - self._mean
+        self._mean += delta / count
+        self._m2 += delta * (value - self._mean)
+
+        # Time weighted EMA, so irregular sampling does not skew it
+        if self._end == 1:
+            self._ema = value
+        else:
+            elapsed = max(0.0, timestamp - self._last_timestamp)
+            alpha = 1 - math.exp(-elapsed / self._duration)
+            self._ema += alpha * (value - self._ema)
+
+        self._last = value
+        self._last_timestamp = timestamp
+
+    def _evict(self, cutoff: float):
+        while (
+            self._start < self._end
+            and self._timestamps[self._start % self._capacity] < cutoff
+        ):
+            self._remove_oldest()
+
+    def _remove_oldest(self):
+        value = self._values[self._start % self._capacity]
+        self._start += 1
+        self._minimum.evict_before(self._start)
+        self._maximum.evict_before(self._start)
+
+        count = self._end - self._start
+        if count == 0:
+            self._mean = 0.0
+            self._m2 = 0.0
+        else:
+            delta = value - self._mean
+            self._mean -= delta / count
+            self._m2 = max(0.0, self._m2 - delta * (value - self._mean))
+
+    def get_statistics(self, timestamp: float) -> WindowStatistics:
+        self._evict(timestamp - self._duration)
+        count = self._end - self._start
+
+        return WindowStatistics(
+            samples=count,
+            last=self._last,
+            mean=self._mean,
+            ema=self._ema,
+            variance=self._m2 / count if count else 0.0,
+            min=self._minimum.peek(),
+            max=self._maximum.peek(),
+        )
+
+
+__all__ = [
+    "RollingWindow",
+    "WindowStatistics",
+]
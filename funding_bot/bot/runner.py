@@ -4,14 +4,50 @@ import sentry_sdk
 
 import datetime as dt
 
-from collections import defaultdict
-
-from funding_bot.configs.myconfig import AccountConfiguration
+from funding_bot.configs.base import Configuration
 from funding_bot.bot.funding import FundingBot, Credentials
 from funding_bot.bot.tracker import Tracker
+from funding_bot.bot.market import MarketDataHub
+from funding_bot.bot.store import TickStore
+from funding_bot.bot.stream import MarketDataStream
+from funding_bot.bot.marketd import MarketDataClient
+from funding_bot.bot.cache import configure_snapshot_cache, get_snapshot_cache
+from funding_bot.bot.codec import configure_codec
+from funding_bot.bot.endpoints import configure_endpoints
+from funding_bot.bot.metrics import (
+    CURRENCY_DURATION,
+    LOOP_DURATION,
+    OFFERS_CANCELLED,
+    OFFERS_FAILED,
+    OFFERS_SUBMITTED,
+    TIME_TO_SUBMIT,
+    get_metrics,
+    start_metrics_server,
+)
+from funding_bot.bot.notifier import configure_notifier, get_notifier
+from funding_bot.bot.tracing import (
+    JsonLinesExporter,
+    SentryExporter,
+    SpanExporter,
+    configure_tracer,
+    get_tracer,
+)
+from funding_bot.bot.outbox import NotificationOutbox
+from funding_bot.bot.ratelimit import build_budgets
+from funding_bot.bot.transport import configure_transport, get_transport
 from funding_bot.bot.account import Account, FundingData
+from funding_bot.bot.balances import BalanceBackend, build_balance_backend
+from funding_bot.bot.orders import OrderTracker, OfferState
+
+from typing import Dict, List, NamedTuple, Optional, Type
 
-from typing import Dict, List, Tuple
+# Seconds between two iterations of the trading loop, at least MIN_LOOP_INTERVAL and
+# as long as the API rate limits require
+MIN_LOOP_INTERVAL = 1
+# Seconds to wait for queued notifications to be delivered on shutdown
+NOTIFIER_SHUTDOWN_TIMEOUT = 10
+# Offers still open after this long are cancelled and resubmitted at the 5 minutes rate
+OFFER_EXPIRY = dt.timedelta(hours=1)
 
 
 def get_runtime(start_time: float) -> str:
@@ -21,208 +57,541 @@ def get_runtime(start_time: float) -> str:
     return str(dt.timedelta(hours=hours, minutes=minutes, seconds=seconds))
 
 
-def start_sentry_integration():
-    if AccountConfiguration.get_sentry_dsn():
-        sentry_sdk.init(AccountConfiguration.get_sentry_dsn(), traces_sample_rate=1.0)
+class RunnerContext(NamedTuple):
+    # Configuration.get_account_name, the account label of the metrics
+    name: str
+    bot: Type[FundingBot]
+    credentials: Credentials
+    account: Account
+    funding_currencies: List[str]
+    market_data: MarketDataHub
+    orders: OrderTracker
+    balances: Optional[BalanceBackend]
+    logger: logging.Logger
+    start_time: float
+
+
+def get_account_configuration() -> Type[Configuration]:
+    # Imported on start, so the runner can be driven by another configuration (i.e. the
+    # load harness) without a myconfig.py
+    from funding_bot.configs.myconfig import AccountConfiguration
+
+    return AccountConfiguration
+
+
+def start_sentry_integration(configuration: Type[Configuration]):
+    if configuration.get_sentry_dsn():
+        # Traces are sampled by the tracer, the ones it exports are always kept
+        sentry_sdk.init(
+            configuration.get_sentry_dsn(),
+            traces_sample_rate=configuration.get_trace_sample_rate(),
+        )
+
+
+def build_span_exporter(configuration: Type[Configuration]) -> Optional[SpanExporter]:
+    trace_file_path = configuration.get_trace_file_path()
+    if trace_file_path:
+        return JsonLinesExporter(trace_file_path)
+    if configuration.get_sentry_dsn():
+        return SentryExporter()
+    return None
+
+
+def configure_process(
+    configuration: Type[Configuration],
+    logger: logging.Logger,
+    metrics_port: Optional[int] = None,
+):
+    # Settings shared by every account of the process
+    start_sentry_integration(configuration)
+    configure_tracer(
+        sample_rate=configuration.get_trace_sample_rate(),
+        exporter=build_span_exporter(configuration),
+        logger=logger,
+    )
+    metrics_port = metrics_port or configuration.get_metrics_port()
+    if metrics_port:
+        start_metrics_server(
+            metrics_port, host=configuration.get_metrics_host(), logger=logger
+        )
+    configure_endpoints(
+        api_url=configuration.get_api_url(),
+        public_api_url=configuration.get_public_api_url(),
+    )
+    configure_transport(
+        pool_size=configuration.get_http_pool_size(),
+        timeout=configuration.get_http_timeout(),
+        budgets=build_budgets(configuration.get_rate_limits()),
+    )
+    configure_snapshot_cache(enabled=configuration.get_snapshot_cache_enabled())
+    configure_codec(configuration.get_json_codec())
+    configure_notifier(
+        logger,
+        coalesce_window=configuration.get_telegram_coalesce_window(),
+        messages_per_minute=configuration.get_telegram_rate_limit(),
+        outbox=NotificationOutbox(
+            configuration.get_notification_outbox_path(),
+            max_age=configuration.get_notification_max_age(),
+        ),
+    )
 
 
-def runner(logger: logging.Logger):
-    start_sentry_integration()
-    start_time = dt.datetime.now().timestamp()
-    run_hours = 0
+def build_market_data(
+    configuration: Type[Configuration], currencies: List[str], logger: logging.Logger
+) -> MarketDataHub:
+    tick_store_path = configuration.get_tick_store_path()
+    return MarketDataHub(
+        currencies,
+        logger,
+        store=TickStore(tick_store_path, logger) if tick_store_path else None,
+    )
+
+
+def start_market_data(
+    configuration: Type[Configuration],
+    market_data: MarketDataHub,
+    logger: logging.Logger,
+    stream: bool = False,
+    marketd: Optional[str] = None,
+):
+    if marketd:
+        # The daemon sends the history it collected, no warm start needed
+        market_data_client = MarketDataClient(
+            market_data.get_trackers(), logger, path=marketd
+        )
+        market_data_client.start()
+        if not market_data_client.wait_until_ready(timeout=60):
+            logger.warning("Market data daemon is not ready, starting without it")
+        return
+
+    market_data.warm_start()
+
+    if stream:
+        market_data_stream = MarketDataStream(
+            market_data.get_trackers(),
+            logger,
+            url=configuration.get_public_websocket_url(),
+        )
+        market_data_stream.start()
+        if not market_data_stream.wait_until_ready(timeout=60):
+            logger.warning("Market data stream is not ready, starting without it")
+
+
+def start_account(
+    configuration: Type[Configuration],
+    market_data: MarketDataHub,
+    logger: logging.Logger,
+    start_time: float,
+) -> RunnerContext:
     bot = FundingBot
 
-    telegram_api_key = AccountConfiguration.get_telegram_api()
+    telegram_api_key = configuration.get_telegram_api()
     bot.send_telegram_notification(telegram_api_key, "Funding Bot Starting...")
 
-    funding_data_tracker = Account(AccountConfiguration(), logger)
+    balances = build_balance_backend(configuration, logger)
+    funding_data_tracker = Account(configuration(), logger, balances=balances)
     credentials = Credentials(
-        api_key=AccountConfiguration.get_api_key(),
-        api_secret_key=AccountConfiguration.get_api_secret_key(),
-        telegram_api=AccountConfiguration.get_telegram_api(),
+        api_key=configuration.get_api_key(),
+        api_secret_key=configuration.get_api_secret_key(),
+        telegram_api=configuration.get_telegram_api(),
     )
 
-    rate_trackers: Dict[str, Tracker] = dict()
-    submitted_orders: Dict[str, Dict[str, Tuple[dt.datetime, str]]] = defaultdict(dict)
-
-    funding_currencies = AccountConfiguration.get_funding_currencies()
+    funding_currencies = configuration.get_funding_currencies()
 
     initial_balance_message = f"Initial Balance: \n"
     for currency in funding_currencies:
-        rate_trackers[currency] = Tracker(currency=currency, logger=logger)
         initial_balance_message += f"{currency}: {funding_data_tracker.get_initial_balance(currency).initial_balance}\n"
 
     bot.send_telegram_notification(telegram_api_key, initial_balance_message)
 
-    for i in range(20):
-        # Need initial value
-        for currency in funding_currencies:
-            # Rate Tracker Update Rate
-            rate_tracker = rate_trackers[currency]
-            rate_tracker.update_rates()
-
-    while True:
-        for currency in funding_currencies:
-            # Rate Tracker Update Rate
-            rate_tracker = rate_trackers[currency]
-            rate_tracker.update_rates()
-
-            # Check balance
-            funding_data_tracker.update_available_funding(
+    return RunnerContext(
+        name=configuration.get_account_name(),
+        bot=bot,
+        credentials=credentials,
+        account=funding_data_tracker,
+        funding_currencies=funding_currencies,
+        market_data=market_data,
+        orders=OrderTracker(funding_currencies),
+        balances=balances,
+        logger=logger,
+        start_time=start_time,
+    )
+
+
+def start_runner(
+    logger: logging.Logger,
+    stream: bool = False,
+    configuration: Optional[Type[Configuration]] = None,
+    metrics_port: Optional[int] = None,
+    marketd: Optional[str] = None,
+) -> RunnerContext:
+    configuration = configuration or get_account_configuration()
+
+    configure_process(configuration, logger, metrics_port=metrics_port)
+    start_time = dt.datetime.now().timestamp()
+
+    market_data = build_market_data(
+        configuration, configuration.get_funding_currencies(), logger
+    )
+    context = start_account(configuration, market_data, logger, start_time)
+    start_market_data(
+        configuration, market_data, logger, stream=stream, marketd=marketd
+    )
+    return context
+
+
+def process_currency(context: RunnerContext, currency: str):
+    started_at = time.perf_counter()
+
+    with get_tracer().trace("currency", account=context.name, currency=currency):
+        submit_available_funding(context, currency, started_at)
+        sync_submitted_offers(context, currency)
+        reprice_expired_offers(context, currency)
+
+    get_metrics().observe(
+        CURRENCY_DURATION,
+        time.perf_counter() - started_at,
+        account=context.name,
+        currency=currency,
+    )
+
+
+def submit_available_funding(
+    context: RunnerContext, currency: str, started_at: float
+):
+    bot = context.bot
+    credentials = context.credentials
+    funding_data_tracker = context.account
+    orders = context.orders
+    telegram_api_key = credentials.telegram_api
+    logger = context.logger
+    rate_tracker = context.market_data.get_tracker(currency)
+    tracer = get_tracer()
+
+    # Check balance
+    with tracer.span("balance"):
+        funding_data_tracker.update_available_funding(
+            currency=currency,
+            amount=bot.grab_available_funding(
+                credentials=credentials, currency=currency, logger=logger,
+            ),
+        )
+    if funding_data_tracker.get_maximum_lending_amount(currency) > 0:
+        # The maximum lending amount counts what the currency has lent and offered
+        with tracer.span("positions"):
+            sync_positions(context, currency)
+    funding_offer = funding_data_tracker.generate_lending_offer(
+        currency, rate_tracker.determine_offer_rate(period=30)
+    )
+    if funding_offer:
+        bot.send_telegram_notification(
+            telegram_api_key,
+            f"{currency} Available Funding for offer: {funding_offer.amount}",
+        )
+        logger.info(f"{currency} Available Funding for offer: {funding_offer.amount}")
+
+        with tracer.span("submit", amount=funding_offer.amount):
+            order = bot.submit_funding_offer(
+                credentials,
+                currency,
+                funding_offer,
+                funding_data_tracker.get_minimum_daily_lending_rate(currency),
+                logger,
+            )
+
+        if order:
+            get_metrics().observe(
+                TIME_TO_SUBMIT,
+                time.perf_counter() - started_at,
+                account=context.name,
                 currency=currency,
-                amount=bot.grab_available_funding(
-                    credentials=credentials, currency=currency, logger=logger,
-                ),
             )
-            funding_offer = funding_data_tracker.generate_lending_offer(
-                currency, rate_tracker.determine_offer_rate(period=30)
+            get_metrics().increment(
+                OFFERS_SUBMITTED, account=context.name, currency=currency
+            )
+            orders.add(currency, str(order), funding_offer.amount)
+        else:
+            get_metrics().increment(
+                OFFERS_FAILED, account=context.name, currency=currency
+            )
+            bot.send_telegram_notification(
+                telegram_api_key,
+                f"Failed to submit {currency} order for {funding_offer.amount}",
             )
-            if funding_offer:
-                bot.send_telegram_notification(
-                    telegram_api_key,
-                    f"{currency} Available Funding for offer: {funding_offer.amount}",
-                )
-                logger.info(
-                    f"{currency} Available Funding for offer: {funding_offer.amount}"
-                )
 
-                order = bot.submit_funding_offer(
-                    credentials,
-                    currency,
-                    funding_offer,
-                    funding_data_tracker.get_minimum_daily_lending_rate(currency),
-                    logger,
-                )
 
-                if order:
-                    submitted_orders[currency][str(order)] = (
-                        dt.datetime.now(),
-                        funding_offer.amount,
-                    )
-                else:
-                    bot.send_telegram_notification(
-                        telegram_api_key,
-                        f"Failed to submit {currency} order for {funding_offer.amount}",
-                    )
-
-            order_successfully_executed: List[str] = []
-            if submitted_orders[currency]:
-                historic_offer = bot.get_funding_offer_history(
-                    credentials, currency, logger
-                )
+def sync_positions(context: RunnerContext, currency: str):
+    # Snapshots of the currency's credits and offers, applied to the position book of
+    # the account as the positions opened, changed and closed since the last one
+    bot = context.bot
+    credentials = context.credentials
+    logger = context.logger
 
-                for order_id in submitted_orders[currency]:
-                    order_status = historic_offer.get(order_id, None)
-                    if order_status:
-                        message = f"Order: {order_id} {order_status}"
-                        bot.send_telegram_notification(telegram_api_key, message)
-                        logger.info(message)
-                        order_successfully_executed.append(order_id)
-
-            for order_id in order_successfully_executed:
-                del submitted_orders[currency][order_id]
-
-            order_successfully_deleted = []
-            order_successfully_resubmitted = []
-            for (submitted_order_id, submitted_data,) in submitted_orders[
-                currency
-            ].items():
-                submitted_time, submitted_amount = submitted_data
-                if dt.datetime.now() - submitted_time > dt.timedelta(hours=1):
-                    message = f"Order: {submitted_order_id} yet to be executed"
-                    bot.send_telegram_notification(telegram_api_key, message)
-                    logger.info(message)
-
-                    if bot.cancel_funding_offer(
-                        credentials, submitted_order_id, logger
-                    ):
-                        order_successfully_deleted.append(submitted_order_id)
-
-                        funding_offer = funding_data_tracker.regenerate_lending_offer(
-                            currency,
-                            rate_tracker.determine_offer_rate(period=5),
-                            submitted_amount,
-                        )
-                        if funding_offer:
-                            bot.send_telegram_notification(
-                                telegram_api_key,
-                                f"{currency} Resubmit offer: {funding_offer.amount}",
-                            )
-                            logger.info(
-                                f"{currency} Resubmit offer: {funding_offer.amount}"
-                            )
-
-                            order = bot.submit_funding_offer(
-                                credentials,
-                                currency,
-                                funding_offer,
-                                funding_data_tracker.get_minimum_daily_lending_rate(
-                                    currency
-                                ),
-                                logger,
-                            )
-
-                            if order:
-                                order_successfully_resubmitted.append(
-                                    (
-                                        str(order),
-                                        (dt.datetime.now(), funding_offer.amount),
-                                    )
-                                )
-                            else:
-                                bot.send_telegram_notification(
-                                    telegram_api_key,
-                                    f"Failed to submit {currency} order for {funding_offer.amount}",
-                                )
-
-            for order_id in order_successfully_deleted:
-                del submitted_orders[currency][order_id]
-
-            for order_id, order_data in order_successfully_resubmitted:
-                submitted_orders[currency][order_id] = order_data
-
-        if int((dt.datetime.now().timestamp() - start_time) / 3600) != run_hours:
-            bot.resend_any_failed_messaged(telegram_api_key)
-            run_hours = int((dt.datetime.now().timestamp() - start_time) / 3600)
-            message = (
-                f"Summary Report @ {dt.datetime.now().date()}\n"
-                f"Runtime: {get_runtime(start_time)}\n"
+    context.account.update_current_active_funding(
+        bot.get_active_funding_data(credentials, currency, logger), currency=currency
+    )
+    context.account.update_current_pending_offers(
+        bot.get_active_funding_offer_data(credentials, currency, logger),
+        currency=currency,
+    )
+
+
+def sync_submitted_offers(context: RunnerContext, currency: str):
+    bot = context.bot
+    credentials = context.credentials
+    logger = context.logger
+
+    # Only the history rows updated since the last poll are downloaded
+    with get_tracer().span("history_sync") as span:
+        closed = context.orders.sync(credentials, currency, logger)
+        if span:
+            span.set_tag("closed", len(closed))
+
+    for offer in closed:
+        message = f"Order: {offer.id} {offer.status}"
+        bot.send_telegram_notification(credentials.telegram_api, message)
+        logger.info(message)
+
+
+def cancel_expired_offers(
+    context: RunnerContext, currency: str, expired: List[OfferState]
+) -> List[OfferState]:
+    # Cancels the expired offers with as few requests as possible and returns the
+    # ones cancelled. cancel/all cancels every offer of the currency, it is only used
+    # when the expired offers are all the currency's active offers
+    bot = context.bot
+    credentials = context.credentials
+    logger = context.logger
+
+    if len(expired) > 1:
+        expired_ids = {offer.id for offer in expired}
+        active_ids = {
+            str(offer.id)
+            for offer in bot.get_active_funding_offer_data(
+                credentials, currency, logger
             )
+        }
+        if (
+            active_ids
+            and active_ids <= expired_ids
+            and bot.cancel_all_funding_offers(credentials, currency, logger)
+        ):
+            # The others are closed already, the order history sync reports them
+            return [offer for offer in expired if offer.id in active_ids]
+
+    return [
+        offer
+        for offer in expired
+        if bot.cancel_funding_offer(credentials, offer.id, logger, notify=False)
+    ]
+
+
+def reprice_expired_offers(context: RunnerContext, currency: str):
+    # Cancels every offer still open after OFFER_EXPIRY and offers the freed amount
+    # again at the 5 minutes rate, merged into as few offers as possible
+    bot = context.bot
+    credentials = context.credentials
+    funding_data_tracker = context.account
+    orders = context.orders
+    logger = context.logger
+
+    expired = orders.get_expired(currency, OFFER_EXPIRY)
+    if not expired:
+        return
+
+    with get_tracer().span("cancel", expired=len(expired)):
+        cancelled = cancel_expired_offers(context, currency, expired)
+    get_metrics().increment(
+        OFFERS_CANCELLED, len(cancelled), account=context.name, currency=currency
+    )
+    for offer in cancelled:
+        orders.remove(currency, offer.id)
 
-            for currency in funding_currencies:
-                current_balance: float = bot.get_currency_balance(
-                    credentials, currency, logger
-                )
-                roi: float = 0
-                gain: float = 0
-                initial_balance_data: FundingData = funding_data_tracker.get_initial_balance(
-                    currency
-                )
-                if current_balance != -1:
-                    gain = current_balance - initial_balance_data.initial_balance
-                    roi = (
-                        365
-                        * gain
-                        / (dt.datetime.now().date() - initial_balance_data.date).days
-                        / initial_balance_data.initial_balance
-                    )
+    message = (
+        f"{currency} {len(expired)} orders yet to be executed, "
+        f"{len(cancelled)} cancelled: {', '.join(offer.id for offer in cancelled)}\n"
+    )
 
-                message += f"\n{currency[1:]}: \n"
-                message += f"Initial Balance: {initial_balance_data.initial_balance}\n"
-                message += f"Start Date: {initial_balance_data.date}\n"
-                message += f"Current Balance: {current_balance}\n"
-                message += f"Gain: {gain} {currency[1:]}\n"
-                message += f"ROI: {round(gain / initial_balance_data.initial_balance * 100, 2)} %\n"
-                message += f"Annualised ROI: {round(roi * 100, 2)} %\n"
+    # No more offers than were cancelled, the regenerated offer can be capped below
+    # the freed amount at low rates
+    remaining = sum(float(offer.amount) for offer in cancelled)
+    offer_rate = context.market_data.get_tracker(currency).determine_offer_rate(
+        period=5
+    )
+    for _ in cancelled:
+        funding_offer = funding_data_tracker.regenerate_lending_offer(
+            currency, offer_rate, str(remaining)
+        )
+        if not funding_offer:
+            break
+
+        with get_tracer().span("submit", amount=funding_offer.amount):
+            order = bot.submit_funding_offer(
+                credentials,
+                currency,
+                funding_offer,
+                funding_data_tracker.get_minimum_daily_lending_rate(currency),
+                logger,
+                notify=False,
+            )
+        if not order:
+            get_metrics().increment(
+                OFFERS_FAILED, account=context.name, currency=currency
+            )
+            message += (
+                f"Failed to resubmit {currency} order for {funding_offer.amount}\n"
+            )
+            break
+
+        get_metrics().increment(
+            OFFERS_SUBMITTED, account=context.name, currency=currency
+        )
+        orders.add(currency, str(order), funding_offer.amount)
+        remaining -= float(funding_offer.amount)
+        message += (
+            f"Resubmit offer: {order} {funding_offer.amount} at "
+            f"{round(funding_offer.rate * 36500, 4)}% for {funding_offer.period} days\n"
+        )
+
+    message = message.rstrip()
+    logger.info(message)
+    bot.send_telegram_notification(credentials.telegram_api, message)
+
+
+def send_summary_report(context: RunnerContext):
+    bot = context.bot
+    credentials = context.credentials
+    funding_data_tracker = context.account
+    funding_currencies = context.funding_currencies
+    telegram_api_key = credentials.telegram_api
+    logger = context.logger
+    start_time = context.start_time
+
+    message = (
+        f"Summary Report @ {dt.datetime.now().date()}\n"
+        f"Runtime: {get_runtime(start_time)}\n"
+    )
+    current_balances: Dict[str, float] = dict()
 
-            bot.send_telegram_notification(telegram_api_key, message)
-            logger.info(message)
+    for currency in funding_currencies:
+        current_balance: float = bot.get_currency_balance(credentials, currency, logger)
+        roi: float = 0
+        gain: float = 0
+        initial_balance_data: FundingData = funding_data_tracker.get_initial_balance(
+            currency
+        )
+        if current_balance != -1:
+            current_balances[currency] = current_balance
+            gain = current_balance - initial_balance_data.initial_balance
+            roi = (
+                365
+                * gain
+                / (dt.datetime.now().date() - initial_balance_data.date).days
+                / initial_balance_data.initial_balance
+            )
+
+        message += f"\n{currency[1:]}: \n"
+        message += f"Initial Balance: {initial_balance_data.initial_balance}\n"
+        message += f"Start Date: {initial_balance_data.date}\n"
+        message += f"Current Balance: {current_balance}\n"
+        message += f"Gain: {gain} {currency[1:]}\n"
+        message += f"ROI: {round(gain / initial_balance_data.initial_balance * 100, 2)} %\n"
+        message += f"Annualised ROI: {round(roi * 100, 2)} %\n"
+
+    bot.send_telegram_notification(telegram_api_key, message)
+    logger.info(message)
+
+    if context.balances and current_balances:
+        context.balances.save_current_balances(current_balances)
+
+    for stats in get_transport().get_stats():
+        logger.info(
+            f"HTTP {stats.host}: {stats.requests} requests over "
+            f"{stats.connections} connections ({stats.reused} reused)"
+        )
+
+    notifier = get_notifier()
+    logger.info(
+        f"Telegram: {notifier.get_failed_count()} messages waiting to be resent, "
+        f"{notifier.get_dropped_count() + notifier.get_outbox().get_dropped_count()} dropped"
+    )
+
+
+def run_tick(context: RunnerContext, stream: bool = False):
+    started_at = time.perf_counter()
+    tracer = get_tracer()
+
+    with tracer.trace("loop", currencies=len(context.funding_currencies)):
+        if not stream:
+            # One batched ticker download for all currencies, streamed rates are kept
+            # current in the background
+            with tracer.span("rate_update"):
+                context.market_data.update_rates()
+
+        for currency in context.funding_currencies:
+            process_currency(context, currency)
+
+    get_metrics().observe(
+        LOOP_DURATION, time.perf_counter() - started_at, account=context.name
+    )
+
+
+def runner(
+    logger: logging.Logger,
+    stream: bool = False,
+    configuration: Optional[Type[Configuration]] = None,
+    metrics_port: Optional[int] = None,
+    marketd: Optional[str] = None,
+):
+    context = start_runner(
+        logger,
+        stream=stream,
+        configuration=configuration,
+        metrics_port=metrics_port,
+        marketd=marketd,
+    )
+    # Rates streamed or sent by the market data daemon need no polling
+    pushed = stream or marketd is not None
+    scheduler = get_transport().get_scheduler()
+    run_hours = 0
+
+    try:
+        while True:
+            scheduler.start_tick()
+            get_snapshot_cache().start_tick()
+            run_tick(context, stream=pushed)
 
-            bot.generate_report(credentials, funding_currencies, logger)
+            current_hours = int(
+                (dt.datetime.now().timestamp() - context.start_time) / 3600
+            )
+            if current_hours != run_hours:
+                run_hours = current_hours
+                send_summary_report(context)
+                context.bot.generate_report(
+                    context.credentials, context.funding_currencies, logger
+                )
 
-        time.sleep(5)  # RESTful API has connection limits, consider switch to Websocket
+            # RESTful API has connection limits, poll as fast as they allow
+            time.sleep(scheduler.get_loop_delay(minimum=MIN_LOOP_INTERVAL))
+    finally:
+        # Deliver the notifications and write the ticks still queued before exiting
+        get_notifier().close(timeout=NOTIFIER_SHUTDOWN_TIMEOUT)
+        context.market_data.close()
 
 
 __all__ = [
     "runner",
+    "start_runner",
+    "configure_process",
+    "build_market_data",
+    "start_market_data",
+    "start_account",
+    "run_tick",
+    "process_currency",
+    "submit_available_funding",
+    "sync_positions",
+    "sync_submitted_offers",
+    "reprice_expired_offers",
+    "send_summary_report",
+    "RunnerContext",
 ]
@@ -0,0 +1,106 @@
+import hmac
+import time
+import hashlib
+import threading
+
+from funding_bot.bot.codec import dumps
+
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from typing_extensions import TypedDict
+
+Header = TypedDict(
+    "Header",
+    {"bfx-nonce": str, "bfx-apikey": str, "bfx-signature": str, "content-type": str},
+)
+
+
+class NonceGenerator(object):
+    # Microsecond timestamps, strictly increasing across every thread and task even
+    # when several requests are signed within the same microsecond or the clock is
+    # set back
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        now = int(time.time() * 1000000)
+        with self._lock:
+            self._last = max(self._last + 1, now)
+            return str(self._last)
+
+
+class SignedRequest(NamedTuple):
+    end_point: str
+    # The exact bytes that were signed, sent as the request body
+    payload: bytes
+    headers: Header
+
+
+def encode_body(body: Dict[str, Any]) -> bytes:
+    return dumps(body)
+
+
+class RequestSigner(object):
+    # Signs authenticated requests of one API key. The HMAC-SHA384 object is keyed
+    # once with the secret and copied for every signature
+    def __init__(
+        self,
+        api_key: str,
+        api_secret_key: str,
+        nonces: Optional[NonceGenerator] = None,
+    ):
+        self._api_key = api_key
+        self._hmac = hmac.new(api_secret_key.encode("utf8"), digestmod=hashlib.sha384)
+        self._nonces = nonces or get_nonce_generator()
+
+    def get_signature(self, end_point: str, nonce: str, payload: bytes) -> str:
+        signature = self._hmac.copy()
+        signature.update(f"/api/{end_point}{nonce}".encode("utf8"))
+        signature.update(payload)
+        return signature.hexdigest()
+
+    def sign(self, end_point: str, payload: bytes) -> SignedRequest:
+        nonce = self._nonces.next()
+        return SignedRequest(
+            end_point=end_point,
+            payload=payload,
+            headers={
+                "bfx-nonce": nonce,
+                "bfx-apikey": self._api_key,
+                "bfx-signature": self.get_signature(end_point, nonce, payload),
+                "content-type": "application/json",
+            },
+        )
+
+    def build(self, end_point: str, body: Dict[str, Any]) -> SignedRequest:
+        return self.sign(end_point, encode_body(body))
+
+
+_nonce_generator = NonceGenerator()
+_signers: Dict[Tuple[str, str], RequestSigner] = dict()
+_signers_lock = threading.Lock()
+
+
+def get_nonce_generator() -> NonceGenerator:
+    return _nonce_generator
+
+
+def get_signer(api_key: str, api_secret_key: str) -> RequestSigner:
+    key = (api_key, api_secret_key)
+
+    with _signers_lock:
+        signer = _signers.get(key)
+        if signer is None:
+            signer = _signers[key] = RequestSigner(api_key, api_secret_key)
+        return signer
+
+
+__all__ = [
+    "Header",
+    "NonceGenerator",
+    "RequestSigner",
+    "SignedRequest",
+    "encode_body",
+    "get_nonce_generator",
+    "get_signer",
+]
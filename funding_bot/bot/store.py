@@ -0,0 +1,279 @@
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+from funding_bot.bot.tracker import RateData, CandleData
+
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+RATE_TABLE = """
+CREATE TABLE IF NOT EXISTS rates (
+    currency TEXT NOT NULL,
+    mts INTEGER NOT NULL,
+    flash_return_rate REAL,
+    bid REAL,
+    bid_period INTEGER,
+    ask REAL,
+    ask_period INTEGER,
+    last REAL,
+    high REAL,
+    low REAL
+)
+"""
+
+CANDLE_TABLE = """
+CREATE TABLE IF NOT EXISTS candles (
+    currency TEXT NOT NULL,
+    period_key TEXT NOT NULL,
+    mts INTEGER NOT NULL,
+    open REAL,
+    close REAL,
+    high REAL,
+    low REAL
+)
+"""
+
+# Seconds close() waits for the queued samples to be written
+DEFAULT_CLOSE_TIMEOUT = 10.0
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS rates_currency_mts ON rates (currency, mts)",
+    "CREATE INDEX IF NOT EXISTS candles_currency_mts ON candles (currency, period_key, mts)",
+]
+
+
+class RateSample(NamedTuple):
+    mts: int
+    rate_data: RateData
+
+
+class CandleSample(NamedTuple):
+    mts: int
+    candle_data: CandleData
+
+
+def get_timestamp() -> int:
+    return int(time.time() * 1000)
+
+
+class TickRecorder(object):
+    # Receives every rate and candle sample of the trackers it is given to
+    def record_rate(
+        self, currency: str, rate_data: RateData, mts: Optional[int] = None
+    ):
+        raise NotImplementedError
+
+    def record_candle(
+        self,
+        currency: str,
+        period_key: str,
+        candle_data: CandleData,
+        mts: Optional[int] = None,
+    ):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TickStore(TickRecorder):
+    # Append only SQLite (WAL mode) history of every rate and candle sample. Samples are
+    # queued and written in batches by a background thread, so recording never blocks
+    # the trackers on disk I/O
+    def __init__(
+        self,
+        path: str,
+        logger: logging.Logger,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 100000,
+    ):
+        self._path = path
+        self._logger = logger
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending: "queue.Queue[Tuple[str, Tuple[Any, ...]]]" = queue.Queue(
+            maxsize=max_pending
+        )
+        self._dropped = 0
+        # Samples queued and not yet written or given up on
+        self._unwritten = 0
+        self._condition = threading.Condition()
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(RATE_TABLE)
+        connection.execute(CANDLE_TABLE)
+        for index in INDEXES:
+            connection.execute(index)
+        connection.commit()
+        connection.close()
+
+        self._stopped = threading.Event()
+        self._writer = threading.Thread(
+            target=self._write_forever, name="TickStore", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _enqueue(self, table: str, row: Tuple[Any, ...]):
+        with self._condition:
+            try:
+                self._pending.put_nowait((table, row))
+            except queue.Full:
+                self._dropped += 1
+                return
+            self._unwritten += 1
+
+    def record_rate(
+        self, currency: str, rate_data: RateData, mts: Optional[int] = None
+    ):
+        self._enqueue("rates", (currency, mts or get_timestamp()) + tuple(rate_data))
+
+    def record_candle(
+        self,
+        currency: str,
+        period_key: str,
+        candle_data: CandleData,
+        mts: Optional[int] = None,
+    ):
+        self._enqueue(
+            "candles",
+            (
+                currency,
+                period_key,
+                mts or get_timestamp(),
+                candle_data.open,
+                candle_data.close,
+                candle_data.high,
+                candle_data.low,
+            ),
+        )
+
+    def get_dropped_count(self) -> int:
+        return self._dropped
+
+    def query_rates(
+        self, currency: str, start: int, end: Optional[int] = None
+    ) -> List[RateSample]:
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT mts, flash_return_rate, bid, bid_period, ask, ask_period, last, "
+                "high, low FROM rates WHERE currency = ? AND mts >= ? AND mts <= ? "
+                "ORDER BY mts",
+                (currency, start, end or get_timestamp()),
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return [
+            RateSample(
+                mts=row[0],
+                rate_data=RateData(
+                    flash_return_rate=row[1],
+                    bid=row[2],
+                    bid_period=row[3],
+                    ask=row[4],
+                    ask_period=row[5],
+                    last=row[6],
+                    high=row[7],
+                    low=row[8],
+                ),
+            )
+            for row in rows
+        ]
+
+    def query_candles(
+        self, currency: str, period_key: str, start: int, end: Optional[int] = None
+    ) -> List[CandleSample]:
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT mts, open, close, high, low FROM candles "
+                "WHERE currency = ? AND period_key = ? AND mts >= ? AND mts <= ? "
+                "ORDER BY mts",
+                (currency, period_key, start, end or get_timestamp()),
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return [
+            CandleSample(
+                mts=row[0],
+                candle_data=CandleData(
+                    open=row[1], close=row[2], high=row[3], low=row[4]
+                ),
+            )
+            for row in rows
+        ]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Blocks until every sample recorded so far is written. Returns False when the
+        # timeout expires first
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._unwritten, timeout)
+
+    def close(self, timeout: float = DEFAULT_CLOSE_TIMEOUT):
+        if not self.flush(timeout):
+            self._logger.warning(
+                f"Tick store closed with {self._unwritten} samples not written"
+            )
+        self._stopped.set()
+        self._writer.join(timeout=5)
+
+    def _write_forever(self):
+        connection: Optional[sqlite3.Connection] = None
+
+        while not self._stopped.is_set():
+            try:
+                batch = [self._pending.get(timeout=self._flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                # Connecting is tried again on the next batch when it fails
+                if connection is None:
+                    connection = self._connect()
+                rates = [row for table, row in batch if table == "rates"]
+                candles = [row for table, row in batch if table == "candles"]
+                with connection:
+                    if rates:
+                        connection.executemany(
+                            "INSERT INTO rates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            rates,
+                        )
+                    if candles:
+                        connection.executemany(
+                            "INSERT INTO candles VALUES (?, ?, ?, ?, ?, ?, ?)", candles
+                        )
+            except Exception as e:
+                # The batch is given up on, the writer carries on with the next one
+                self._logger.error(f"Failed to write {len(batch)} samples: {e}")
+            finally:
+                with self._condition:
+                    self._unwritten -= len(batch)
+                    self._condition.notify_all()
+
+        if connection is not None:
+            connection.close()
+
+
+__all__ = [
+    "TickRecorder",
+    "TickStore",
+    "RateSample",
+    "CandleSample",
+]
@@ -0,0 +1,215 @@
+import json
+import time
+import logging
+import threading
+
+from funding_bot.bot.codec import RowSchema, loads
+from funding_bot.bot.tracker import Tracker, RateData, CandleData, CANDLE_PERIODS
+
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import websocket
+except ImportError:  # Streaming is optional, install websocket-client to enable it
+    websocket = None  # type: ignore
+
+PUBLIC_WEBSOCKET_URL = "wss://api-pub.bitfinex.com/ws/2"
+
+# Bitfinex sends a heartbeat on every channel every 15 seconds
+HEARTBEAT_TIMEOUT = 30
+RECONNECT_EVENT_CODE = 20051
+
+# Ticker and candle payloads of the feed, the ticker has no symbol unlike the REST rows
+STREAM_TICKER_SCHEMA: RowSchema[RateData] = RowSchema(
+    RateData,
+    {
+        "flash_return_rate": 0,
+        "bid": 1,
+        "bid_period": 2,
+        "ask": 4,
+        "ask_period": 5,
+        "last": 9,
+        "high": 11,
+        "low": 12,
+    },
+)
+STREAM_CANDLE_SCHEMA: RowSchema[CandleData] = RowSchema(
+    CandleData, {"open": 1, "close": 2, "high": 3, "low": 4}
+)
+
+
+class MarketDataStream(object):
+    # Pushes ticker and candle updates from the Bitfinex public WebSocket feed into
+    # the trackers, reconnecting and resubscribing whenever the feed drops or goes silent
+    def __init__(
+        self,
+        trackers: Dict[str, Tracker],
+        logger: logging.Logger,
+        url: str = PUBLIC_WEBSOCKET_URL,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        self._trackers = trackers
+        self._logger = logger
+        self._url = url
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+
+        # chanId -> (currency, candle period key or None for the ticker channel)
+        self._channels: Dict[int, Tuple[str, Optional[str]]] = dict()
+        self._candle_timestamps: Dict[int, float] = dict()
+
+        self._connection: Any = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_candle_key(cls, currency: str, period_key: str) -> str:
+        duration, period = CANDLE_PERIODS[period_key]
+        return f"trade:{duration}m:{currency}:p{period}"
+
+    def start(self):
+        if websocket is None:
+            raise RuntimeError(
+                "Market data streaming requires websocket-client, "
+                "install it with `pip install funding-bot[stream]`"
+            )
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run_forever, name="MarketDataStream", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._close()
+
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def is_ready(self) -> bool:
+        return all(tracker.has_candle_data() for tracker in self._trackers.values())
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            if time.monotonic() > deadline or self._stopped.is_set():
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _run_forever(self):
+        delay = self._reconnect_delay
+
+        while not self._stopped.is_set():
+            try:
+                self._connect()
+                delay = self._reconnect_delay
+                self._receive_messages()
+            except (websocket.WebSocketException, OSError, ValueError) as e:
+                if self._stopped.is_set():
+                    break
+                self._logger.warning(
+                    f"Market data stream disconnected: {e}, reconnecting in {delay}s"
+                )
+            finally:
+                self._close()
+
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
+
+    def _connect(self):
+        self._channels = dict()
+        self._candle_timestamps = dict()
+        self._connection = websocket.create_connection(
+            self._url, timeout=HEARTBEAT_TIMEOUT
+        )
+        self._logger.info(f"Market data stream connected to {self._url}")
+
+        for currency in self._trackers:
+            self._send({"event": "subscribe", "channel": "ticker", "symbol": currency})
+            for period_key in CANDLE_PERIODS:
+                self._send(
+                    {
+                        "event": "subscribe",
+                        "channel": "candles",
+                        "key": self.get_candle_key(currency, period_key),
+                    }
+                )
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except (websocket.WebSocketException, OSError):
+                pass
+
+    def _send(self, message: Dict[str, Any]):
+        self._connection.send(json.dumps(message))
+
+    def _receive_messages(self):
+        while not self._stopped.is_set():
+            message = self._connection.recv()
+            if not message:
+                raise websocket.WebSocketConnectionClosedException(
+                    "Connection closed by server"
+                )
+
+            data = loads(message)
+            if isinstance(data, dict):
+                self._handle_event(data)
+            elif isinstance(data, list) and len(data) > 1:
+                self._handle_channel_data(data[0], data[1])
+
+    def _handle_event(self, event: Dict[str, Any]):
+        event_type = event.get("event")
+
+        if event_type == "subscribed":
+            if event["channel"] == "ticker":
+                self._channels[event["chanId"]] = (event["symbol"], None)
+            elif event["channel"] == "candles":
+                for currency in self._trackers:
+                    for period_key in CANDLE_PERIODS:
+                        if event["key"] == self.get_candle_key(currency, period_key):
+                            self._channels[event["chanId"]] = (currency, period_key)
+        elif event_type == "info" and event.get("code") == RECONNECT_EVENT_CODE:
+            raise websocket.WebSocketConnectionClosedException(
+                "Server requested reconnect"
+            )
+        elif event_type == "error":
+            self._logger.error(f"Market data stream error: {event}")
+
+    def _handle_channel_data(self, channel_id: int, payload: Any):
+        if payload == "hb" or channel_id not in self._channels:
+            return
+
+        currency, period_key = self._channels[channel_id]
+        tracker = self._trackers[currency]
+
+        if period_key is None:
+            rate_data = STREAM_TICKER_SCHEMA.decode_row(payload)
+            if rate_data:
+                tracker.add_rate_data(rate_data)
+        else:
+            # Snapshots are a list of candles, updates are a single candle
+            candles: List[List[float]] = (
+                payload if payload and isinstance(payload[0], list) else [payload]
+            )
+            latest = max(candles, key=lambda candle: candle[0], default=None)
+
+            candle_data = STREAM_CANDLE_SCHEMA.decode_row(latest) if latest else None
+            if latest and candle_data:
+                if latest[0] < self._candle_timestamps.get(channel_id, 0):
+                    return
+
+                self._candle_timestamps[channel_id] = latest[0]
+                tracker.set_candle_data(period_key, candle_data)
+
+
+__all__ = [
+    "MarketDataStream",
+    "PUBLIC_WEBSOCKET_URL",
+]
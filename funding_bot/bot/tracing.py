@@ -0,0 +1,244 @@
+import json
+import time
+import random
+import logging
+import threading
+import sentry_sdk
+
+from contextlib import contextmanager
+
+from typing import Any, ContextManager, Dict, Iterator, List, NamedTuple, Optional
+
+
+class SpanRecord(NamedTuple):
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    # Wall clock start, in seconds since the epoch
+    started_at: float
+    duration: float
+    tags: Dict[str, Any]
+    error: Optional[str]
+
+
+class Span(object):
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str]):
+        self.trace = trace
+        self.name = name
+        self.span_id = trace.new_span_id()
+        self.parent_id = parent_id
+        self.tags: Dict[str, Any] = dict()
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def set_tag(self, key: str, value: Any):
+        self.tags[key] = value
+
+    def finish(self):
+        self.trace.records.append(
+            SpanRecord(
+                trace_id=self.trace.trace_id,
+                span_id=self.span_id,
+                parent_id=self.parent_id,
+                name=self.name,
+                started_at=self.started_at,
+                duration=time.perf_counter() - self._started,
+                tags=self.tags,
+                error=self.error,
+            )
+        )
+
+
+class Trace(object):
+    # The spans of one root span and its children, exported together once the root
+    # finishes. An unsampled trace records nothing
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.trace_id = "%032x" % random.getrandbits(128)
+        self.records: List[SpanRecord] = []
+        self.stack: List[Span] = []
+
+    def new_span_id(self) -> str:
+        return "%016x" % random.getrandbits(64)
+
+
+class SpanExporter(object):
+    def export(self, records: List[SpanRecord]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    # One JSON object per span appended to a local file, for offline analysis
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def export(self, records: List[SpanRecord]):
+        lines = "".join(json.dumps(record._asdict()) + "\n" for record in records)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SentryExporter(SpanExporter):
+    # Replays a finished trace as a Sentry transaction, the root span is the
+    # transaction and every other span its child
+    def export(self, records: List[SpanRecord]):
+        root = records[-1]
+        transaction = sentry_sdk.start_transaction(
+            name=root.name,
+            op=root.name,
+            trace_id=root.trace_id,
+            span_id=root.span_id,
+            sampled=True,
+            start_timestamp=root.started_at,
+        )
+        self._set_tags(transaction, root)
+
+        spans: Dict[str, Any] = {root.span_id: transaction}
+        # Children finish before their parents, so parents come later in the records
+        for record in sorted(records[:-1], key=lambda record: record.started_at):
+            parent = spans.get(record.parent_id or "", transaction)
+            span = parent.start_child(
+                op=record.name,
+                description=record.name,
+                span_id=record.span_id,
+                start_timestamp=record.started_at,
+            )
+            self._set_tags(span, record)
+            spans[record.span_id] = span
+
+        for record in records:
+            spans[record.span_id].finish(
+                end_timestamp=record.started_at + record.duration
+            )
+
+    @classmethod
+    def _set_tags(cls, span: Any, record: SpanRecord):
+        for key, value in record.tags.items():
+            span.set_tag(key, value)
+        if record.error:
+            span.set_status("internal_error")
+            span.set_tag("error", record.error)
+
+
+class Tracer(object):
+    # Spans are nested per thread. A trace starts with the loop, or a pipeline stage
+    # of the async runner, and is sampled with the probability sample_rate. Spans of
+    # an unsampled trace, or with no exporter configured, cost a thread local lookup
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        exporter: Optional[SpanExporter] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self._sample_rate = sample_rate if exporter else 0.0
+        self._exporter = exporter
+        self._logger = logger or logging.getLogger(__name__)
+        self._local = threading.local()
+
+    def get_sample_rate(self) -> float:
+        return self._sample_rate
+
+    def get_current_span(self) -> Optional[Span]:
+        trace: Optional[Trace] = getattr(self._local, "trace", None)
+        if trace is None or not trace.stack:
+            return None
+        return trace.stack[-1]
+
+    def trace(self, name: str, **tags: Any) -> ContextManager[Optional[Span]]:
+        # A span that starts a new trace when no span is active on the thread
+        return self._span(name, tags, start_trace=True)
+
+    def span(self, name: str, **tags: Any) -> ContextManager[Optional[Span]]:
+        # A child of the active span, nothing is recorded outside of a trace
+        return self._span(name, tags, start_trace=False)
+
+    @contextmanager
+    def _span(
+        self, name: str, tags: Dict[str, Any], start_trace: bool
+    ) -> Iterator[Optional[Span]]:
+        trace: Optional[Trace] = getattr(self._local, "trace", None)
+        root = trace is None
+        if trace is None:
+            trace = Trace(
+                sampled=start_trace
+                and self._sample_rate > 0
+                and random.random() < self._sample_rate
+            )
+            self._local.trace = trace
+
+        if not trace.sampled:
+            try:
+                yield None
+            finally:
+                if root:
+                    self._local.trace = None
+            return
+
+        span = Span(trace, name, trace.stack[-1].span_id if trace.stack else None)
+        span.tags.update(tags)
+        trace.stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            trace.stack.pop()
+            span.finish()
+            if root:
+                self._local.trace = None
+                self._export(trace.records)
+
+    def _export(self, records: List[SpanRecord]):
+        if self._exporter is None:
+            return
+        try:
+            self._exporter.export(records)
+        except Exception as e:
+            self._logger.warning(f"Failed to export trace: {e}")
+
+    def close(self):
+        if self._exporter:
+            self._exporter.close()
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure_tracer(
+    sample_rate: float,
+    exporter: Optional[SpanExporter],
+    logger: Optional[logging.Logger] = None,
+) -> Tracer:
+    global _tracer
+
+    _tracer.close()
+    _tracer = Tracer(sample_rate=sample_rate, exporter=exporter, logger=logger)
+    return _tracer
+
+
+__all__ = [
+    "Tracer",
+    "Span",
+    "SpanRecord",
+    "SpanExporter",
+    "JsonLinesExporter",
+    "SentryExporter",
+    "get_tracer",
+    "configure_tracer",
+]
@@ -1,12 +1,48 @@
-import json
+import time
 import logging
 import requests
+import threading
 
-from typing import Dict, List, NamedTuple
+from funding_bot.bot.codec import RowSchema, loads
+from funding_bot.bot.endpoints import get_endpoints
+from funding_bot.bot.rolling import RollingWindow, WindowStatistics
+from funding_bot.bot.transport import get_transport
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from funding_bot.bot.store import TickRecorder
 
 FIVE_MINUTE_PERIOD = "5mins"
 THIRTY_MINUTE_PERIOD = "30mins"
 
+# Candle (duration in minutes, funding period in days) tracked for each period key
+CANDLE_PERIODS: Dict[str, Tuple[int, int]] = {
+    FIVE_MINUTE_PERIOD: (5, 2),
+    THIRTY_MINUTE_PERIOD: (30, 2),
+}
+
+# Rolling windows kept over the last rate, in seconds. Each holds up to one sample per
+# second, faster feeds shorten the window to its most recent samples
+RATE_WINDOWS: Dict[str, int] = {
+    "1m": 60,
+    "5m": 300,
+    "30m": 1800,
+    "4h": 14400,
+}
+
+# Number of rate samples aggregated into the current rate data
+RATE_DATA_SAMPLES = 15
+
+# Candle history backfilled on a warm start, 1 minute candles covering the longest
+# rate window. The candles/.../hist end point returns at most MAX_CANDLE_HISTORY rows
+WARM_START_DURATION = 1
+WARM_START_PERIOD = 2
+MAX_CANDLE_HISTORY = 10000
+
+# Offers are placed just below the high of the candle period
+OFFER_RATE_FACTOR = 0.99
+
 
 class RateData(NamedTuple):
     flash_return_rate: float
@@ -26,11 +62,45 @@ class CandleData(NamedTuple):
     close: float
 
 
+# Positions of the fields in the tickers rows, the first entry is the symbol, and in
+# the candles rows, MTS first
+TICKER_SCHEMA: RowSchema[RateData] = RowSchema(
+    RateData,
+    {
+        "flash_return_rate": 1,
+        "bid": 2,
+        "bid_period": 3,
+        "ask": 5,
+        "ask_period": 6,
+        "last": 10,
+        "high": 12,
+        "low": 13,
+    },
+    minimum_length=15,
+)
+CANDLE_SCHEMA: RowSchema[CandleData] = RowSchema(
+    CandleData, {"open": 1, "close": 2, "high": 3, "low": 4}, minimum_length=6
+)
+
+
 class Tracker(object):
-    def __init__(self, currency: str, logger: logging.Logger):
+    def __init__(
+        self,
+        currency: str,
+        logger: logging.Logger,
+        store: Optional["TickRecorder"] = None,
+    ):
         self._logger = logger
         self._currency = currency
-        self._rate_data: List[RateData] = []
+        self._store = store
+        self._rate_data_count = 0
+        self._rate_data_high = float("inf")
+        self._rate_data_low = float("-inf")
+        self._last_rate_data: Optional[RateData] = None
+        self._rate_windows: Dict[str, RollingWindow] = {
+            window: RollingWindow(duration=duration, capacity=duration)
+            for window, duration in RATE_WINDOWS.items()
+        }
         self._current_rate_data: RateData = RateData(
             flash_return_rate=0.0,
             bid=0.0,
@@ -45,37 +115,186 @@ class Tracker(object):
             FIVE_MINUTE_PERIOD: CandleData(high=0, low=0, open=0, close=0),
             THIRTY_MINUTE_PERIOD: CandleData(high=0, low=0, open=0, close=0),
         }
+        # Rates can be pushed from the market data stream thread
+        self._lock = threading.Lock()
+
+    def get_currency(self) -> str:
+        return self._currency
 
     def get_api(self) -> str:
-        return f"https://api-pub.bitfinex.com/v2/tickers?symbols={self._currency}"
+        return f"{get_endpoints().public_api_url}v2/tickers?symbols={self._currency}"
 
     def get_candle_api(self, period: int, duration: int) -> str:
-        return f"https://api-pub.bitfinex.com/v2/candles/trade:{duration}m:{self._currency}:p{period}/last"
+        return f"{get_endpoints().public_api_url}v2/candles/trade:{duration}m:{self._currency}:p{period}/last"
+
+    def get_candle_history_api(
+        self, period: int, duration: int, start: int, limit: int
+    ) -> str:
+        return (
+            f"{get_endpoints().public_api_url}v2/candles/trade:{duration}m:{self._currency}:p{period}/hist"
+            f"?start={start}&limit={limit}&sort=1"
+        )
 
     def update_rates(self):
-        self._update_rates(duration=5, period=2, period_key=FIVE_MINUTE_PERIOD)
-        self._update_rates(duration=30, period=2, period_key=THIRTY_MINUTE_PERIOD)
+        self.update_ticker()
+        self.update_candles()
+
+    def update_ticker(self):
+        value = self._get_public_data(self.get_api())
+
+        if value:
+            self.add_ticker_data(value[0])
+
+    def update_candles(self):
+        for period_key, (duration, period) in CANDLE_PERIODS.items():
+            self._update_candle_data(
+                duration=duration, period=period, period_key=period_key
+            )
+
+    def get_candle_history(
+        self, duration: int, period: int, start: int
+    ) -> List[List[Any]]:
+        # Candles since start (in milliseconds), oldest first
+        candles: List[List[Any]] = []
+
+        while True:
+            value = self._get_public_data(
+                self.get_candle_history_api(
+                    duration=duration,
+                    period=period,
+                    start=start,
+                    limit=MAX_CANDLE_HISTORY,
+                )
+            )
+            if not value:
+                break
+
+            candles.extend(candle for candle in value if len(candle) > 5)
+            if len(value) < MAX_CANDLE_HISTORY:
+                break
+            start = value[-1][0] + 1
+
+        return candles
+
+    def warm_start(self) -> bool:
+        # Seeds the rate windows and the candle of every period from the 1 minute candle
+        # history instead of polling the ticker and the candles repeatedly. One download
+        # per funding period, a single one with the default candle periods
+        start = int((time.time() - max(RATE_WINDOWS.values())) * 1000)
+        periods = {WARM_START_PERIOD} | {
+            period for _, period in CANDLE_PERIODS.values()
+        }
+        histories = {
+            period: self.get_candle_history(
+                duration=WARM_START_DURATION, period=period, start=start
+            )
+            for period in periods
+        }
+        if not all(histories.values()):
+            return False
+
+        self.seed_rate_history(
+            [(candle[0] / 1000, candle[2]) for candle in histories[WARM_START_PERIOD]]
+        )
+
+        # Like the candles/.../last end point, the candle of each period is the latest
+        # one that has trades
+        for period_key, (duration, period) in CANDLE_PERIODS.items():
+            history = histories[period]
+            last_mts = history[-1][0]
+            period_start = last_mts - last_mts % (duration * 60000)
+            candles = [candle for candle in history if candle[0] >= period_start]
+            self.set_candle_data(
+                period_key,
+                CandleData(
+                    open=candles[0][1],
+                    close=candles[-1][2],
+                    high=max(candle[3] for candle in candles),
+                    low=min(candle[4] for candle in candles),
+                ),
+            )
+
+        return True
 
     def get_latest_rate_data(self) -> RateData:
         return self._current_rate_data
 
+    def set_latest_rate_data(self, rate_data: RateData):
+        # Taken over from another tracker, i.e. the one of the market data daemon
+        with self._lock:
+            self._current_rate_data = rate_data
+
+    def get_rate_history(self) -> List[Tuple[float, float]]:
+        # (timestamp, last rate) samples of the longest rate window, oldest first
+        with self._lock:
+            longest = max(
+                self._rate_windows.values(), key=lambda window: window.get_duration()
+            )
+            return longest.get_samples(time.time())
+
+    def seed_rate_history(self, samples: List[Tuple[float, float]]):
+        # Adds (timestamp, last rate) samples, oldest first, to the rate windows without
+        # aggregating them. Samples not newer than the ones held are skipped
+        with self._lock:
+            for rate_window in self._rate_windows.values():
+                last_timestamp = rate_window.get_last_timestamp()
+                for timestamp, rate in samples:
+                    if timestamp > last_timestamp:
+                        rate_window.add(rate, timestamp)
+
     def get_candle_data(self) -> Dict[str, CandleData]:
         return self._candle_data
 
+    def has_candle_data(self) -> bool:
+        return all(candle.high > 0 for candle in self._candle_data.values())
+
+    def get_rate_statistics(self, window: str) -> WindowStatistics:
+        # Statistics of the last rate over one of RATE_WINDOWS
+        with self._lock:
+            return self._rate_windows[window].get_statistics(time.time())
+
+    def add_rate_data(self, rate_data: RateData, timestamp: Optional[float] = None):
+        if self._store:
+            self._store.record_rate(self._currency, rate_data)
+
+        with self._lock:
+            now = timestamp or time.time()
+            for rate_window in self._rate_windows.values():
+                rate_window.add(rate_data.last, now)
+
+            self._rate_data_count += 1
+            self._rate_data_high = min(self._rate_data_high, rate_data.high)
+            self._rate_data_low = max(self._rate_data_low, rate_data.low)
+            self._last_rate_data = rate_data
+
+            if self._rate_data_count == RATE_DATA_SAMPLES:
+                self.aggregate_rate_data()
+
+    def set_candle_data(self, period_key: str, candle_data: CandleData):
+        if self._store:
+            self._store.record_candle(self._currency, period_key, candle_data)
+
+        self._candle_data[period_key] = candle_data
+
     def aggregate_rate_data(self):
-        # TODO need to store data in db
+        # Every sample is recorded in the tick store when one is configured
+        if self._last_rate_data is None:
+            return
+
         self._current_rate_data = RateData(
-            flash_return_rate=self._rate_data[-1].flash_return_rate,
-            bid=self._rate_data[-1].bid,
-            bid_period=self._rate_data[-1].bid_period,
-            ask=self._rate_data[-1].ask,
-            ask_period=self._rate_data[-1].ask_period,
-            last=self._rate_data[-1].last,
-            high=min([data.high for data in self._rate_data]),
-            low=max([data.low for data in self._rate_data]),
+            flash_return_rate=self._last_rate_data.flash_return_rate,
+            bid=self._last_rate_data.bid,
+            bid_period=self._last_rate_data.bid_period,
+            ask=self._last_rate_data.ask,
+            ask_period=self._last_rate_data.ask_period,
+            last=self._last_rate_data.last,
+            high=self._rate_data_high,
+            low=self._rate_data_low,
         )
 
-        self._rate_data = []
+        self._rate_data_count = 0
+        self._rate_data_high = float("inf")
+        self._rate_data_low = float("-inf")
 
         self._logger.info(
             f"Current Rate Data:\n"
@@ -94,42 +313,35 @@ class Tracker(object):
 
         if period == 5:
             return (
-                candle_data[FIVE_MINUTE_PERIOD].high * 0.99
+                candle_data[FIVE_MINUTE_PERIOD].high * OFFER_RATE_FACTOR
             )  # Return the high in the 5 minutes
         else:
             return (
-                candle_data[THIRTY_MINUTE_PERIOD].high * 0.99
+                candle_data[THIRTY_MINUTE_PERIOD].high * OFFER_RATE_FACTOR
             )  # Return the high in the 30 minutes
 
-    def _update_rates(self, duration: int, period: int, period_key: str):
-        response = requests.get(self.get_api())
-        if response.status_code == 200:
-            value = json.loads(response.content.decode())
-
-            if len(value) and len(value[0]) > 14:
-                self._rate_data.append(
-                    RateData(
-                        flash_return_rate=value[0][1],
-                        bid=value[0][2],
-                        bid_period=value[0][3],
-                        ask=value[0][5],
-                        ask_period=value[0][6],
-                        last=value[0][10],
-                        high=value[0][12],
-                        low=value[0][13],
-                    )
-                )
+    def add_ticker_data(self, ticker: List[Any]):
+        # Ticker row as returned from the REST API
+        rate_data = TICKER_SCHEMA.decode_row(ticker)
+        if rate_data:
+            self.add_rate_data(rate_data)
 
-            if len(self._rate_data) == 15:
-                self.aggregate_rate_data()
+    def _get_public_data(self, url: str) -> Optional[Any]:
+        try:
+            response = get_transport().get(url)
+        except requests.exceptions.RequestException as e:
+            self._logger.warning(f"Request to {url} failed: {e}")
+            return None
 
-        # Update candle data
-        response = requests.get(self.get_candle_api(duration=duration, period=period))
         if response.status_code == 200:
-            value = json.loads(response.content.decode())
+            return loads(response.content)
+        return None
 
-            if value and len(value) > 5:
-                candle_data = CandleData(
-                    open=value[1], close=value[2], high=value[3], low=value[4],
-                )
-                self._candle_data[period_key] = candle_data
+    def _update_candle_data(self, duration: int, period: int, period_key: str):
+        value = self._get_public_data(
+            self.get_candle_api(duration=duration, period=period)
+        )
+
+        candle_data = CANDLE_SCHEMA.decode_row(value) if value else None
+        if candle_data:
+            self.set_candle_data(period_key, candle_data)
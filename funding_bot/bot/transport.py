@@ -0,0 +1,206 @@
+import time
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+from funding_bot.bot.ratelimit import EndpointBudget, RequestScheduler
+from funding_bot.bot.signing import SignedRequest
+from funding_bot.bot.metrics import (
+    HTTP_ERRORS,
+    HTTP_RATE_LIMIT_WAIT,
+    HTTP_REQUEST_DURATION,
+    HTTP_RESPONSES,
+    get_endpoint_label,
+    get_metrics,
+)
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10.0
+
+
+class TransportStats(NamedTuple):
+    host: str
+    requests: int
+    connections: int
+    reused: int
+
+
+class Transport(object):
+    # Keep-alive HTTP sessions, one pooled session per host so every request to
+    # api.bitfinex.com, api-pub.bitfinex.com and api.telegram.org reuses a connection
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._scheduler = scheduler or RequestScheduler()
+        self._sessions: Dict[str, requests.Session] = dict()
+        self._adapters: Dict[str, HTTPAdapter] = dict()
+        self._signing_locks: Dict[str, threading.Lock] = dict()
+        self._lock = threading.Lock()
+
+    def get_timeout(self) -> float:
+        return self._timeout
+
+    def get_scheduler(self) -> RequestScheduler:
+        return self._scheduler
+
+    def get_session(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self._pool_size, max_retries=0
+                )
+                session = requests.Session()
+                session.mount(f"{host}/", adapter)
+                self._sessions[host] = session
+                self._adapters[host] = adapter
+            return session
+
+    def get_signing_lock(self, scope: str) -> threading.Lock:
+        with self._lock:
+            lock = self._signing_locks.get(scope)
+            if lock is None:
+                lock = self._signing_locks[scope] = threading.Lock()
+            return lock
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        sign: Optional[Callable[[], SignedRequest]] = None,
+        scope: Optional[str] = None,
+        **kwargs: Any
+    ) -> requests.Response:
+        # scope is the API key of an authenticated request, it has its own budgets
+        kwargs.setdefault("timeout", self._timeout)
+        path = urlsplit(url).path.lstrip("/")
+
+        metrics = get_metrics()
+        endpoint = get_endpoint_label(path)
+
+        started_at = time.perf_counter()
+        self._scheduler.acquire(path, scope=scope)
+        if not sign:
+            response = self._send(method, url, endpoint, started_at, **kwargs)
+        else:
+            # The exchange rejects a nonce not larger than every one it has received
+            # for the key. Signing and sending is one step per key, so concurrent
+            # requests reach it in the order their nonces were issued. Signed once
+            # the budget allows the request, a request waiting on its budget never
+            # holds a nonce older than the ones sent meanwhile
+            with self.get_signing_lock(scope or ""):
+                signed = sign()
+                kwargs["headers"] = signed.headers
+                kwargs["data"] = signed.payload
+                response = self._send(method, url, endpoint, started_at, **kwargs)
+
+        metrics.increment(
+            HTTP_RESPONSES, endpoint=endpoint, status=str(response.status_code)
+        )
+        self._scheduler.record_response(
+            path,
+            response.status_code,
+            response.headers.get("Retry-After"),
+            scope=scope,
+        )
+        return response
+
+    def _send(
+        self, method: str, url: str, endpoint: str, started_at: float, **kwargs: Any
+    ) -> requests.Response:
+        metrics = get_metrics()
+        sent_at = time.perf_counter()
+        metrics.observe(HTTP_RATE_LIMIT_WAIT, sent_at - started_at, endpoint=endpoint)
+
+        try:
+            return self.get_session(url).request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            metrics.increment(HTTP_ERRORS, endpoint=endpoint)
+            raise
+        finally:
+            metrics.observe(
+                HTTP_REQUEST_DURATION, time.perf_counter() - sent_at, endpoint=endpoint
+            )
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self) -> List[TransportStats]:
+        stats: List[TransportStats] = []
+
+        with self._lock:
+            adapters = list(self._adapters.items())
+
+        for host, adapter in adapters:
+            total_requests = 0
+            total_connections = 0
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                total_requests += pool.num_requests
+                total_connections += pool.num_connections
+
+            stats.append(
+                TransportStats(
+                    host=host,
+                    requests=total_requests,
+                    connections=total_connections,
+                    reused=total_requests - total_connections,
+                )
+            )
+
+        return stats
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = dict()
+            self._adapters = dict()
+
+
+_transport: Optional[Transport] = None
+
+
+def get_transport() -> Transport:
+    global _transport
+
+    if _transport is None:
+        _transport = Transport()
+    return _transport
+
+
+def configure_transport(
+    pool_size: int, timeout: float, budgets: Optional[List[EndpointBudget]] = None
+) -> Transport:
+    global _transport
+
+    if _transport is not None:
+        _transport.close()
+    _transport = Transport(
+        pool_size=pool_size, timeout=timeout, scheduler=RequestScheduler(budgets)
+    )
+    return _transport
+
+
+__all__ = [
+    "Transport",
+    "TransportStats",
+    "get_transport",
+    "configure_transport",
+]
@@ -2,38 +2,442 @@ import os
 import sys
 import click
 import logging
-import pkg_resources
 
-from funding_bot.bot.runner import runner
+from typing import Optional, Tuple
+
+# The bot, boto3, sentry_sdk, requests and tabulate are imported by the commands that
+# use them, so `funding_bot --help` and the short commands start without loading them
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
+DISTRIBUTION_NAME = "funding_bot"
+# Where `funding_bot marketd` publishes the market data of the host
+MARKETD_SOCKET_PATH = "/tmp/funding_bot_marketd.sock"
+PUBLIC_API_URL = "https://api-pub.bitfinex.com/"
+
+
+def get_version() -> str:
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+
+        try:
+            return pkg_resources.get_distribution(DISTRIBUTION_NAME).version
+        except pkg_resources.DistributionNotFound:
+            return "unknown"
+
+    try:
+        return version(DISTRIBUTION_NAME)
+    except PackageNotFoundError:
+        return "unknown"
+
 
 @click.group()
 def cli():
     funding_bot = click.style("funding_bot", fg="cyan", bold=True)
-    version = pkg_resources.get_distribution("funding_bot").version
+    version = get_version()
     click.echo(funding_bot + " " + version)
     click.echo("Funding Bot that supports Bitfinex Margin Funding")
     click.echo("Currently supports USD, BTC, ETH")
 
 
 @click.command()
-def run():
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Stream market data over WebSocket instead of polling the REST API",
+)
+@click.option(
+    "--async",
+    "use_async",
+    is_flag=True,
+    help="Run every currency as its own concurrent pipeline",
+)
+@click.option(
+    "--accounts",
+    "multi_account",
+    is_flag=True,
+    help="Run every account of ACCOUNT_CONFIGURATIONS on one market data pipeline",
+)
+@click.option(
+    "--marketd",
+    type=click.Path(dir_okay=False),
+    help=f"Take market data from the `funding_bot marketd` socket, "
+    f"i.e. {MARKETD_SOCKET_PATH}",
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    help="Serve Prometheus metrics on this local port",
+)
+def run(
+    stream: bool,
+    use_async: bool,
+    multi_account: bool,
+    marketd: Optional[str],
+    metrics_port: Optional[int],
+):
+    if use_async and multi_account:
+        raise click.UsageError("--async and --accounts cannot be combined")
+    if stream and marketd:
+        raise click.UsageError("--stream and --marketd cannot be combined")
+
     logging.basicConfig(
         filename=f"{dir_path}/log.log",
         filemode="a",
         level=logging.INFO,
-        format="%(asctime)s %(levelname)-8s %(message)s",
+        # The account logging each line, when there are several
+        format="%(asctime)s %(levelname)-8s %(name)s %(message)s"
+        if multi_account
+        else "%(asctime)s %(levelname)-8s %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
     logger = logging.getLogger("FundingBot")
     logger.info("Start Funding Bot")
-    runner(logger)
+    if multi_account:
+        from funding_bot.bot.multi_runner import multi_account_runner
+
+        multi_account_runner(
+            logger, stream=stream, metrics_port=metrics_port, marketd=marketd
+        )
+    elif use_async:
+        from funding_bot.bot.async_runner import async_runner
+
+        async_runner(logger, stream=stream, metrics_port=metrics_port, marketd=marketd)
+    else:
+        from funding_bot.bot.runner import runner
+
+        runner(logger, stream=stream, metrics_port=metrics_port, marketd=marketd)
+
+
+@click.command(help="Collect market data once for every bot of the host")
+@click.option(
+    "--socket",
+    "path",
+    default=MARKETD_SOCKET_PATH,
+    show_default=True,
+    type=click.Path(dir_okay=False),
+    help="Unix socket the bots connect to",
+)
+@click.option(
+    "--currency",
+    "-c",
+    multiple=True,
+    help="Currency collected from start, others are added as bots subscribe",
+)
+@click.option("--public-api-url", default=PUBLIC_API_URL, show_default=True)
+@click.option(
+    "--metrics-port",
+    type=int,
+    help="Serve Prometheus metrics on this local port",
+)
+def marketd(
+    path: str,
+    currency: Tuple[str, ...],
+    public_api_url: str,
+    metrics_port: Optional[int],
+):
+    from funding_bot.bot.marketd import run_market_data_daemon
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    logger = logging.getLogger("FundingBotMarketData")
+    try:
+        run_market_data_daemon(
+            logger,
+            path,
+            public_api_url,
+            currencies=list(currency),
+            metrics_port=metrics_port,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command(help="Replay 1 minute funding candles through the lending strategy")
+@click.option(
+    "--candles",
+    "-c",
+    type=(str, click.Path(exists=True, dir_okay=False)),
+    multiple=True,
+    required=True,
+    help="Currency and its candle file (JSON or CSV), i.e. -c fUSD fusd.csv",
+)
+@click.option(
+    "--balance",
+    "-b",
+    type=(str, float),
+    multiple=True,
+    help="Currency and its starting balance, defaults to DEFAULT_VALUE",
+)
+@click.option(
+    "--minimum-rate",
+    default=0.0,
+    show_default=True,
+    help="Minimum lending rate in annual percent",
+)
+def backtest(
+    candles: Tuple[Tuple[str, str], ...],
+    balance: Tuple[Tuple[str, float], ...],
+    minimum_rate: float,
+):
+    import tabulate
+
+    from funding_bot.bot.account import DEFAULT_VALUE
+    from funding_bot.bot.backtest import load_candles, run_backtest
+
+    balances = dict(balance)
+    results = [
+        run_backtest(
+            currency,
+            load_candles(path),
+            balances.get(currency, DEFAULT_VALUE.get(currency, 1)),
+            minimum_rate,
+        )
+        for currency, path in candles
+    ]
+
+    click.echo(
+        tabulate.tabulate(
+            [
+                [
+                    result.currency,
+                    f"{round(result.minutes / 1440, 1)} days",
+                    result.offers_submitted,
+                    f"{round(result.fill_rate * 100, 2)}%",
+                    f"{round(result.weighted_average_rate, 4)}%",
+                    f"{round(result.idle_time * 100, 2)}%",
+                    round(result.interest, 6),
+                ]
+                for result in results
+            ],
+            headers=[
+                "Currency",
+                "Duration",
+                "Offers",
+                "Fill Rate",
+                "Average Rate",
+                "Idle Time",
+                "Interest",
+            ],
+        )
+    )
+
+
+@click.command(help="Time the per loop CPU paths of the bot")
+@click.option(
+    "--filter", "-k", "pattern", help="Only run benchmarks whose name contains it"
+)
+@click.option(
+    "--save",
+    type=click.Path(dir_okay=False),
+    help="Save the results as a baseline JSON file",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Baseline JSON file to flag regressions against",
+)
+@click.option(
+    "--threshold",
+    default=0.1,
+    show_default=True,
+    help="Slowdown over the baseline reported as a regression",
+)
+def bench(
+    pattern: Optional[str],
+    save: Optional[str],
+    compare: Optional[str],
+    threshold: float,
+):
+    import tabulate
+
+    from funding_bot.bench import (
+        STARTUP_BENCHMARK,
+        get_eager_imports,
+        load_baseline,
+        run_benchmarks,
+        save_baseline,
+    )
+
+    results = run_benchmarks(
+        logging.getLogger("FundingBot"),
+        pattern=pattern,
+        baseline=load_baseline(compare) if compare else None,
+    )
+
+    rows = []
+    for result in results:
+        change = result.get_change()
+        rows.append(
+            [
+                result.name,
+                result.iterations,
+                round(result.best * 1000000, 2),
+                round(result.median * 1000000, 2),
+                round(result.baseline * 1000000, 2) if result.baseline else "",
+                f"{round(change * 100, 1)}%" if change is not None else "",
+                "REGRESSION" if result.is_regression(threshold) else "",
+            ]
+        )
+    click.echo(
+        tabulate.tabulate(
+            rows,
+            headers=[
+                "Benchmark",
+                "Calls",
+                "Best (us)",
+                "Median (us)",
+                "Baseline (us)",
+                "Change",
+                "",
+            ],
+        )
+    )
+
+    if save:
+        save_baseline(save, results)
+        click.echo(f"Baseline saved to {save}")
+
+    failed = any(result.is_regression(threshold) for result in results)
+    if any(result.name == STARTUP_BENCHMARK for result in results):
+        eager_imports = get_eager_imports()
+        if eager_imports:
+            click.echo(f"Imported on CLI start: {', '.join(eager_imports)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+@click.group(help="Local stand-in servers for testing offline")
+def mock():
+    pass
+
+
+@click.command(name="stream", help="Mock Bitfinex public WebSocket feed")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True)
+@click.option(
+    "--interval", default=1.0, show_default=True, help="Seconds between updates"
+)
+def mock_stream(host: str, port: int, interval: float):
+    from funding_bot.mock.stream import MockMarketDataServer
+
+    server = MockMarketDataServer(host=host, port=port, interval=interval)
+    click.echo(f"Serving mock market data stream on {server.get_url()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@click.command(name="server", help="Mock Bitfinex REST API and Telegram Bot API")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8766, show_default=True)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Seconds added to every response"
+)
+@click.option(
+    "--error-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of the requests answered with an error",
+)
+def mock_server(host: str, port: int, latency: float, error_rate: float):
+    from funding_bot.mock.server import MockBitfinexServer
+
+    server = MockBitfinexServer(
+        host=host, port=port, latency=latency, error_rate=error_rate
+    )
+    click.echo(f"Serving mock Bitfinex and Telegram API on {server.get_url()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@click.command(name="harness", help="Measure the trading loop against the mock API")
+@click.option(
+    "--accounts", default=1, show_default=True, help="Accounts run side by side"
+)
+@click.option(
+    "--currencies", "-n", default=1, show_default=True, help="Funding currencies"
+)
+@click.option("--offers", default=0, show_default=True, help="Open offers per currency")
+@click.option("--loops", default=10, show_default=True)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Seconds added to every response"
+)
+@click.option(
+    "--error-rate",
+    default=0.0,
+    show_default=True,
+    help="Fraction of the requests answered with an error",
+)
+@click.option(
+    "--rate-limits",
+    is_flag=True,
+    help="Keep the Bitfinex rate limit budgets instead of lifting them",
+)
+def mock_harness(
+    accounts: int,
+    currencies: int,
+    offers: int,
+    loops: int,
+    latency: float,
+    error_rate: float,
+    rate_limits: bool,
+):
+    import tabulate
+
+    from funding_bot.mock.harness import run_harness
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_harness(
+        logging.getLogger("FundingBot"),
+        accounts=accounts,
+        currencies=currencies,
+        offers=offers,
+        loops=loops,
+        latency=latency,
+        error_rate=error_rate,
+        rate_limits=rate_limits,
+    )
+
+    click.echo(
+        tabulate.tabulate(
+            [
+                ["Accounts", report.accounts],
+                ["Currencies", report.currencies],
+                ["Open offers per currency", report.offers],
+                ["Loops", report.loops],
+                ["First loop", f"{round(report.first_loop_latency * 1000, 1)} ms"],
+                ["Loop p50", f"{round(report.loop_latency_p50 * 1000, 1)} ms"],
+                ["Loop p95", f"{round(report.loop_latency_p95 * 1000, 1)} ms"],
+                ["Loop max", f"{round(report.loop_latency_max * 1000, 1)} ms"],
+                ["Requests per loop", round(report.requests_per_loop, 1)],
+                ["CPU per loop", f"{round(report.cpu_per_loop * 1000, 1)} ms"],
+            ]
+        )
+    )
+
 
+mock.add_command(mock_stream)
+mock.add_command(mock_server)
+mock.add_command(mock_harness)
 
 cli.add_command(run)
+cli.add_command(marketd)
+cli.add_command(backtest)
+cli.add_command(bench)
+cli.add_command(mock)
 
 
 def main():
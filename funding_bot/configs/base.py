@@ -1,3 +1,5 @@
+import os
+
 from typing import Optional, List, Dict, TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -15,6 +17,11 @@ class Configuration(object):
         # Bitfinex API Secret Key
         raise NotImplementedError
 
+    @classmethod
+    def get_account_name(cls) -> str:
+        # Labels the account in the logs and metrics, `funding_bot run --accounts` runs several
+        return cls.__name__
+
     @classmethod
     def get_telegram_api_key(cls) -> Optional[str]:
         return None
@@ -23,10 +30,53 @@ class Configuration(object):
     def get_telegram_chat_id(cls) -> Optional[str]:
         return None
 
+    @classmethod
+    def get_telegram_coalesce_window(cls) -> float:
+        # Seconds to wait for more messages to merge into a single Telegram message
+        return 1.0
+
+    @classmethod
+    def get_telegram_rate_limit(cls) -> int:
+        # Telegram messages sent per minute at most
+        return 20
+
+    @classmethod
+    def get_notification_outbox_path(cls) -> Optional[str]:
+        # SQLite file keeping the Telegram messages that failed to send across restarts
+        # One file per account, None keeps them in memory only
+        return os.path.join(
+            os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+            f"outbox_{cls.get_account_name()}.db",
+        )
+
+    @classmethod
+    def get_notification_max_age(cls) -> float:
+        # Seconds after which a message that failed to send is dropped instead of retried
+        return 3600.0
+
     @classmethod
     def get_dynamodb_table_name(cls) -> Optional[str]:
         return None
 
+    @classmethod
+    def get_dynamodb_region(cls) -> str:
+        return "ap-southeast-2"
+
+    @classmethod
+    def get_balance_cache_path(cls) -> Optional[str]:
+        # Copy of the last balances read from DynamoDB, used when it cannot be reached
+        # One file per account, accounts run together never read each other's balances
+        return os.path.join(
+            os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+            f"balances_{cls.get_account_name()}.json",
+        )
+
+    @classmethod
+    def get_balance_file_path(cls) -> Optional[str]:
+        # Local stand-in for the DynamoDB table, a .json file or else a SQLite file
+        # Holds the initial balances and the current balances written back every hour
+        return None
+
     @classmethod
     def get_initial_balance(cls) -> Dict[str, float]:
         # Must be supplied unless dynamodb is setup to contain the initial balance info
@@ -44,9 +94,30 @@ class Configuration(object):
         api_key = cls.get_telegram_api_key()
 
         if chat_id and api_key:
-            return f"https://api.telegram.org/bot{api_key}/sendMessage?chat_id={chat_id}&text="
+            return f"{cls.get_telegram_url()}bot{api_key}/sendMessage?chat_id={chat_id}&text="
         return None
 
+    @classmethod
+    def get_telegram_url(cls) -> str:
+        # Telegram Bot API base URL, with a trailing slash
+        return "https://api.telegram.org/"
+
+    @classmethod
+    def get_api_url(cls) -> str:
+        # Bitfinex authenticated REST API base URL, with a trailing slash
+        # Point it and get_public_api_url at `funding_bot mock server` to run offline
+        return "https://api.bitfinex.com/"
+
+    @classmethod
+    def get_public_api_url(cls) -> str:
+        # Bitfinex public REST API base URL, with a trailing slash
+        return "https://api-pub.bitfinex.com/"
+
+    @classmethod
+    def get_minimum_funding_amount(cls) -> Dict[str, float]:
+        # Smallest offer amount per currency, added to or overriding MIN_FUNDING_AMOUNT
+        return {}
+
     @classmethod
     def get_minimum_lending_rate(cls) -> Dict[str, int]:
         # As an annual rate, that's the minimum rate for a day will equal this value / 365.
@@ -72,6 +143,66 @@ class Configuration(object):
     def get_sentry_dsn(cls) -> Optional[str]:
         return None
 
+    @classmethod
+    def get_trace_sample_rate(cls) -> float:
+        # Share of loop iterations traced, every stage of a traced loop is a span
+        # Exported to Sentry, or to get_trace_file_path when it is set
+        return 0.05
+
+    @classmethod
+    def get_trace_file_path(cls) -> Optional[str]:
+        # JSON lines file the sampled traces are appended to instead of Sentry, None to disable
+        return None
+
+    @classmethod
+    def get_http_pool_size(cls) -> int:
+        # Maximum number of keep-alive connections kept open per host
+        return 10
+
+    @classmethod
+    def get_http_timeout(cls) -> float:
+        # Seconds to wait on a connection or a response before giving up on a request
+        return 10.0
+
+    @classmethod
+    def get_rate_limits(cls) -> Dict[str, int]:
+        # Requests per minute allowed for each API path prefix, overrides the Bitfinex defaults
+        # i.e. {"v2/candles/": 30, "v2/auth/r/wallets": 90}
+        return {}
+
+    @classmethod
+    def get_json_codec(cls) -> Optional[str]:
+        # "json" or "orjson" (Requires `pip install -e .[fast]`), None for the fastest installed
+        return None
+
+    @classmethod
+    def get_snapshot_cache_enabled(cls) -> bool:
+        # Reuse the wallet, balance and offer snapshots within one loop, every loop
+        # fetches them again
+        return True
+
+    @classmethod
+    def get_metrics_port(cls) -> Optional[int]:
+        # Port of the Prometheus metrics endpoint, None to disable
+        # `funding_bot run --metrics-port` overrides it
+        return None
+
+    @classmethod
+    def get_metrics_host(cls) -> str:
+        # Interface the metrics endpoint listens on, local only by default
+        return "127.0.0.1"
+
+    @classmethod
+    def get_tick_store_path(cls) -> Optional[str]:
+        # SQLite file recording every rate and candle sample, None to disable
+        return None
+
+    @classmethod
+    def get_public_websocket_url(cls) -> str:
+        # Market data feed used by `funding_bot run --stream`
+        # Point it at `funding_bot mock stream` to run against the local stand-in server
+        return "wss://api-pub.bitfinex.com/ws/2"
+
 
 __all__ = [
     "Configuration",
@@ -66,6 +66,11 @@ class AccountConfiguration(Configuration):
         return None
 
 
+# Sub-accounts run side by side by `funding_bot run --accounts`, each with its own API key
+# and get_account_name, i.e. subclasses of AccountConfiguration overriding the keys
+# ACCOUNT_CONFIGURATIONS = [AccountConfiguration, SubAccountConfiguration]
+
+
 __all__ = [
     "AccountConfiguration",
 ]
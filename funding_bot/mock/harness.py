@@ -0,0 +1,277 @@
+import time
+import logging
+import multiprocessing
+import datetime as dt
+
+from concurrent.futures import ThreadPoolExecutor
+
+from funding_bot.configs.base import Configuration
+from funding_bot.bot.cache import get_snapshot_cache
+from funding_bot.bot.notifier import get_notifier
+from funding_bot.bot.transport import get_transport
+from funding_bot.bot.runner import RunnerContext, start_runner, run_tick
+from funding_bot.bot.multi_runner import run_account_tick, start_multi_account_runner
+from funding_bot.mock.server import MockAccount, MockBitfinexServer
+from funding_bot.mock.stream import MarketScript
+
+from typing import Any, Dict, List, NamedTuple, Optional, Type
+
+# Requests per minute high enough that the rate limit budgets never delay the harness
+UNLIMITED = 1000000000
+
+# Every authenticated request is checked against it by the mock server
+API_SECRET_KEY = "harness"
+
+OFFER_AMOUNT = 100.0
+OFFER_RATE = 0.0005
+MINIMUM_FUNDING_AMOUNT = 50.0
+
+
+class HarnessReport(NamedTuple):
+    accounts: int
+    currencies: int
+    offers: int
+    loops: int
+    loop_latency_p50: float
+    loop_latency_p95: float
+    loop_latency_max: float
+    requests_per_loop: float
+    cpu_per_loop: float
+    first_loop_latency: float
+
+
+def get_currencies(count: int) -> List[str]:
+    # Synthetic funding currencies, f001 to f100
+    return [f"f{index:03d}" for index in range(1, count + 1)]
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def build_configuration(
+    url: str,
+    currencies: List[str],
+    balance: float,
+    rate_limits: bool,
+    name: str = "harness",
+) -> Type[Configuration]:
+    class HarnessConfiguration(Configuration):
+        @classmethod
+        def get_account_name(cls) -> str:
+            return name
+
+        @classmethod
+        def get_api_key(cls) -> str:
+            return name
+
+        @classmethod
+        def get_api_secret_key(cls) -> str:
+            return API_SECRET_KEY
+
+        @classmethod
+        def get_telegram_api_key(cls) -> Optional[str]:
+            return "harness"
+
+        @classmethod
+        def get_telegram_chat_id(cls) -> Optional[str]:
+            return "1"
+
+        @classmethod
+        def get_telegram_url(cls) -> str:
+            return url
+
+        @classmethod
+        def get_notification_outbox_path(cls) -> Optional[str]:
+            return None
+
+        @classmethod
+        def get_api_url(cls) -> str:
+            return url
+
+        @classmethod
+        def get_public_api_url(cls) -> str:
+            return url
+
+        @classmethod
+        def get_initial_balance(cls) -> Dict[str, float]:
+            return {currency: balance for currency in currencies}
+
+        @classmethod
+        def get_minimum_funding_amount(cls) -> Dict[str, float]:
+            return {currency: MINIMUM_FUNDING_AMOUNT for currency in currencies}
+
+        @classmethod
+        def get_minimum_lending_rate(cls) -> Dict[str, int]:
+            return {}
+
+        @classmethod
+        def get_maximum_lending_amount(cls) -> Dict[str, int]:
+            return {}
+
+        @classmethod
+        def get_funding_currencies(cls) -> List[str]:
+            return list(currencies)
+
+        @classmethod
+        def get_rate_limits(cls) -> Dict[str, int]:
+            if rate_limits:
+                return {}
+            return {
+                "v2/tickers": UNLIMITED,
+                "v2/candles/": UNLIMITED,
+                "v2/auth/w/": UNLIMITED,
+                "v2/auth/": UNLIMITED,
+            }
+
+    return HarnessConfiguration
+
+
+def serve(
+    connection: Any,
+    currencies: List[str],
+    offers: int,
+    balance: float,
+    latency: float,
+    error_rate: float,
+):
+    # Runs in its own process, so the harness measures the CPU used by the bot only
+    script = MarketScript(seed=0)
+    account = MockAccount(
+        script, balances={currency: balance for currency in currencies}
+    )
+
+    now = int(time.time() * 1000)
+    open_offers: Dict[str, List[Any]] = {currency: [] for currency in currencies}
+    for currency in currencies:
+        for index in range(offers):
+            # Spread over the last two hours, so about half have expired
+            mts_created = now - int(index * 7200000 / max(1, offers))
+            offer = account.add_offer(
+                currency, OFFER_AMOUNT, OFFER_RATE, 2, mts_created=mts_created
+            )
+            open_offers[currency].append((offer.id, mts_created))
+
+    server = MockBitfinexServer(
+        latency=latency,
+        error_rate=error_rate,
+        script=script,
+        account=account,
+        api_secret_key=API_SECRET_KEY,
+    )
+    connection.send((server.get_url(), open_offers))
+    server.serve_forever()
+
+
+def seed_orders(context: RunnerContext, open_offers: Dict[str, List[Any]]):
+    # The open offers are tracked as if the runner had submitted them
+    for currency, offers in open_offers.items():
+        for id_, mts_created in offers:
+            context.orders.add(
+                currency,
+                str(id_),
+                str(OFFER_AMOUNT),
+                submitted_at=dt.datetime.fromtimestamp(mts_created / 1000),
+            )
+
+
+def get_request_count() -> int:
+    return sum(stats.requests for stats in get_transport().get_stats())
+
+
+def run_harness(
+    logger: logging.Logger,
+    accounts: int = 1,
+    currencies: int = 1,
+    offers: int = 0,
+    loops: int = 10,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limits: bool = False,
+) -> HarnessReport:
+    # Drives the runner loop against a MockBitfinexServer in a child process. Several
+    # accounts share the mock account and the market data, each tick runs them side
+    # by side like `funding_bot run --accounts`
+    names = get_currencies(currencies)
+    balance = (offers + 100) * OFFER_AMOUNT
+
+    parent_connection, child_connection = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=serve,
+        args=(child_connection, names, offers, balance, latency, error_rate),
+        daemon=True,
+    )
+    process.start()
+    executor = ThreadPoolExecutor(max_workers=accounts)
+
+    try:
+        url, open_offers = parent_connection.recv()
+        if accounts > 1:
+            multi_context = start_multi_account_runner(
+                logger,
+                configurations=[
+                    build_configuration(
+                        url, names, balance, rate_limits, name=f"harness-{index}"
+                    )
+                    for index in range(accounts)
+                ],
+            )
+            context = multi_context.accounts[0]
+
+            def tick():
+                multi_context.market_data.update_rates()
+                list(executor.map(run_account_tick, multi_context.accounts))
+
+        else:
+            context = start_runner(
+                logger,
+                configuration=build_configuration(url, names, balance, rate_limits),
+            )
+
+            def tick():
+                run_tick(context)
+
+        seed_orders(context, open_offers)
+        scheduler = get_transport().get_scheduler()
+
+        latencies: List[float] = []
+        cpu_times: List[float] = []
+        requests: List[int] = []
+        for _ in range(loops):
+            scheduler.start_tick()
+            get_snapshot_cache().start_tick()
+            request_count = get_request_count()
+            cpu_time = time.process_time()
+            started_at = time.perf_counter()
+
+            tick()
+
+            latencies.append(time.perf_counter() - started_at)
+            cpu_times.append(time.process_time() - cpu_time)
+            requests.append(get_request_count() - request_count)
+
+        get_notifier().close(timeout=10)
+    finally:
+        executor.shutdown()
+        process.terminate()
+        process.join()
+
+    return HarnessReport(
+        accounts=accounts,
+        currencies=currencies,
+        offers=offers,
+        loops=loops,
+        loop_latency_p50=get_percentile(latencies, 0.5),
+        loop_latency_p95=get_percentile(latencies, 0.95),
+        loop_latency_max=max(latencies),
+        requests_per_loop=sum(requests) / loops,
+        cpu_per_loop=sum(cpu_times) / loops,
+        first_loop_latency=latencies[0],
+    )
+
+
+__all__ = [
+    "HarnessReport",
+    "run_harness",
+]
@@ -0,0 +1,529 @@
+import hmac
+import json
+import time
+import random
+import hashlib
+import threading
+import socketserver
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from funding_bot.mock.stream import MarketScript
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+MINUTE = 60000
+# Rows returned by the history end points when no limit is given, and at most
+MAX_HISTORY_ROWS = 500
+MAX_CANDLE_ROWS = 10000
+# Funding wallet balance of the currencies without a configured one
+DEFAULT_BALANCE = 10000.0
+
+
+class MockOffer(NamedTuple):
+    id: int
+    currency: str
+    amount: float
+    rate: float
+    period: int
+    mts_created: int
+
+
+def get_timestamp() -> int:
+    return int(time.time() * 1000)
+
+
+def get_offer_row(offer: MockOffer, status: str, mts_updated: int) -> List[Any]:
+    # Funding offer in the Bitfinex REST layout
+    return [
+        offer.id,
+        offer.currency,
+        offer.mts_created,
+        mts_updated,
+        offer.amount,  # AMOUNT
+        offer.amount,  # AMOUNT_ORIG
+        "LIMIT",
+        None,
+        None,
+        0,  # FLAGS
+        status,
+        None,
+        None,
+        None,
+        offer.rate,
+        offer.period,
+        False,  # NOTIFY
+        0,  # HIDDEN
+        None,
+        False,  # RENEW
+        None,
+    ]
+
+
+def get_credit_row(offer: MockOffer, mts_updated: int) -> List[Any]:
+    # Funding credit in the Bitfinex REST layout
+    return [
+        offer.id,
+        offer.currency,
+        1,  # SIDE
+        offer.mts_created,
+        mts_updated,
+        offer.amount,
+        0,  # FLAGS
+        "ACTIVE",
+        "FIXED",
+        None,
+        None,
+        offer.rate,
+        offer.period,
+        mts_updated,  # MTS_OPENING
+        mts_updated,  # MTS_LAST_PAYOUT
+        None,
+        0,
+        None,
+        0,
+        None,
+        0,
+        "tBTCUSD",  # POSITION_PAIR
+    ]
+
+
+def get_notification(
+    notification_type: str, data: Any, status: str, text: str
+) -> List[Any]:
+    return [get_timestamp(), notification_type, None, None, data, None, status, text]
+
+
+class MockAccount(object):
+    # Funding wallets, offers and credits of one account. Offers fill once the market
+    # rate reaches their rate, or at random with fill_probability per offer a second
+    def __init__(
+        self,
+        script: MarketScript,
+        balances: Optional[Dict[str, float]] = None,
+        fill_probability: float = 0.01,
+        seed: int = 0,
+    ):
+        self._script = script
+        self._balances: Dict[str, float] = dict(balances or {})
+        self._fill_probability = fill_probability
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._offers: Dict[int, MockOffer] = dict()
+        self._credits: Dict[int, Tuple[MockOffer, int]] = dict()
+        self._history: List[Tuple[int, MockOffer, str]] = []
+        self._filled_at = get_timestamp()
+
+    def get_balance(self, currency: str) -> float:
+        return self._balances.setdefault(currency, DEFAULT_BALANCE)
+
+    def get_wallets(self) -> List[List[Any]]:
+        return [
+            ["funding", currency[1:], balance, 0, balance]
+            for currency, balance in list(self._balances.items())
+        ]
+
+    def add_offer(
+        self,
+        currency: str,
+        amount: float,
+        rate: float,
+        period: int,
+        mts_created: Optional[int] = None,
+    ) -> MockOffer:
+        with self._lock:
+            offer = MockOffer(
+                id=self._next_id,
+                currency=currency,
+                amount=amount,
+                rate=rate,
+                period=period,
+                mts_created=mts_created or get_timestamp(),
+            )
+            self._next_id += 1
+            self._offers[offer.id] = offer
+            return offer
+
+    def get_available(self, currency: str) -> float:
+        with self._lock:
+            self._fill_offers()
+            used = sum(
+                offer.amount
+                for offer in self._offers.values()
+                if offer.currency == currency
+            ) + sum(
+                offer.amount
+                for offer, _ in self._credits.values()
+                if offer.currency == currency
+            )
+            return max(0.0, self.get_balance(currency) - used)
+
+    def get_offers(self, currency: str) -> List[List[Any]]:
+        with self._lock:
+            self._fill_offers()
+            return [
+                get_offer_row(offer, "ACTIVE", offer.mts_created)
+                for offer in self._offers.values()
+                if offer.currency == currency
+            ]
+
+    def get_credits(self, currency: str) -> List[List[Any]]:
+        with self._lock:
+            self._fill_offers()
+            return [
+                get_credit_row(offer, mts_updated)
+                for offer, mts_updated in self._credits.values()
+                if offer.currency == currency
+            ]
+
+    def get_history(
+        self, currency: str, start: int, end: int, limit: int
+    ) -> List[List[Any]]:
+        # Closed offers updated between start and end, newest first
+        with self._lock:
+            self._fill_offers()
+            rows: List[List[Any]] = []
+            for mts_updated, offer, status in reversed(self._history):
+                if mts_updated < start:
+                    break
+                if mts_updated <= end and offer.currency == currency:
+                    rows.append(get_offer_row(offer, status, mts_updated))
+                    if len(rows) == limit:
+                        break
+            return rows
+
+    def cancel_offer(self, id_: int) -> Optional[MockOffer]:
+        with self._lock:
+            offer = self._offers.pop(id_, None)
+            if offer:
+                self._history.append((get_timestamp(), offer, "CANCELED"))
+            return offer
+
+    def cancel_all_offers(self, currency: str) -> int:
+        with self._lock:
+            ids = [
+                offer.id
+                for offer in self._offers.values()
+                if offer.currency == currency
+            ]
+            now = get_timestamp()
+            for id_ in ids:
+                self._history.append((now, self._offers.pop(id_), "CANCELED"))
+            return len(ids)
+
+    def _fill_offers(self):
+        now = get_timestamp()
+        seconds = (now - self._filled_at) / 1000
+        self._filled_at = now
+        if not self._offers or seconds <= 0:
+            return
+
+        probability = 1 - (1 - self._fill_probability) ** seconds
+        for offer in list(self._offers.values()):
+            if (
+                offer.rate <= self._script.get_rate(offer.currency)
+                or self._random.random() < probability
+            ):
+                del self._offers[offer.id]
+                self._credits[offer.id] = (offer, now)
+                self._history.append(
+                    (
+                        now,
+                        offer,
+                        f"EXECUTED at {round(offer.rate * 100, 4)}% ({offer.amount})",
+                    )
+                )
+
+
+class BitfinexHandler(BaseHTTPRequestHandler):
+    server: "MockBitfinexServer"
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, keep-alive clients would otherwise wait
+    # on delayed acknowledgements
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        parts = urlsplit(self.path)
+        path = parts.path.lstrip("/")
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.server.record_request(path)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        injected = self.server.inject_error()
+        if injected:
+            self._send(injected, {"error": "injected"})
+            return
+
+        rejected = self.server.verify_signature(
+            path,
+            self.headers.get("bfx-apikey"),
+            self.headers.get("bfx-nonce"),
+            self.headers.get("bfx-signature"),
+            body,
+        )
+        if rejected:
+            self._send(500, rejected)
+            return
+
+        try:
+            payload = json.loads(body) if body else {}
+            status, data = self.server.route(method, path, query, payload)
+        except (ValueError, KeyError, TypeError) as e:
+            status, data = 500, ["error", 10020, str(e)]
+        self._send(status, data)
+
+    def _send(self, status: int, data: Any):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class MockBitfinexServer(socketserver.ThreadingMixIn, HTTPServer):
+    # Offline stand-in for the Bitfinex REST end points the bot uses and for the
+    # Telegram sendMessage end point, with injected latency and errors. Market data
+    # comes from a MarketScript, the account from a MockAccount
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        script: Optional[MarketScript] = None,
+        account: Optional[MockAccount] = None,
+        seed: int = 0,
+        api_secret_key: Optional[str] = None,
+    ):
+        super().__init__((host, port), BitfinexHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.script = script or MarketScript(seed=seed)
+        self.account = account or MockAccount(self.script, seed=seed)
+        self.messages: List[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = dict()
+        self._thread: Optional[threading.Thread] = None
+        # Authenticated requests are only checked when the secret is known
+        self._api_secret_key = api_secret_key
+        self._last_nonces: Dict[str, int] = dict()
+
+    def get_url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}/"
+
+    def record_request(self, path: str):
+        key = "telegram" if path.startswith("bot") else "/".join(path.split("/")[:3])
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def get_request_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._requests)
+
+    def inject_error(self) -> Optional[int]:
+        with self._lock:
+            value = self._random.random()
+        if value < self.rate_limit_rate:
+            return 429
+        if value < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def verify_signature(
+        self,
+        path: str,
+        api_key: Optional[str],
+        nonce: Optional[str],
+        signature: Optional[str],
+        body: bytes,
+    ) -> Optional[List[Any]]:
+        # The error Bitfinex answers a badly signed request with, None when it is valid
+        if self._api_secret_key is None or not path.startswith("v2/auth/"):
+            return None
+        if not api_key or not nonce or not signature:
+            return ["error", 10100, "apikey: invalid"]
+
+        expected = hmac.new(
+            self._api_secret_key.encode("utf8"),
+            f"/api/{path}{nonce}".encode("utf8") + body,
+            hashlib.sha384,
+        ).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return ["error", 10100, "apikey: digest invalid"]
+
+        with self._lock:
+            # Nonces of an API key must keep increasing
+            if int(nonce) <= self._last_nonces.get(api_key, 0):
+                return ["error", 10114, "nonce: small"]
+            self._last_nonces[api_key] = int(nonce)
+        return None
+
+    def route(
+        self, method: str, path: str, query: Dict[str, str], body: Dict[str, Any]
+    ) -> Tuple[int, Any]:
+        parts = path.split("/")
+
+        if parts[0].startswith("bot") and parts[-1] == "sendMessage":
+            with self._lock:
+                self.messages.append(query.get("text", ""))
+            return 200, {"ok": True, "result": {}}
+
+        if parts[:2] == ["v2", "tickers"]:
+            symbols = [
+                symbol for symbol in query.get("symbols", "").split(",") if symbol
+            ]
+            rows = []
+            for symbol in symbols:
+                self.script.step(symbol)
+                rows.append([symbol] + self.script.get_ticker(symbol))
+            return 200, rows
+
+        if parts[:2] == ["v2", "candles"] and len(parts) == 4:
+            return 200, self._get_candles(parts[2], parts[3], query)
+
+        if method != "POST" or parts[:2] != ["v2", "auth"]:
+            return 404, ["error", 10020, "not found"]
+
+        end_point = "/".join(parts[2:])
+        account = self.account
+
+        if end_point == "r/wallets":
+            return 200, account.get_wallets()
+
+        if end_point == "calc/order/avail":
+            return 200, [-account.get_available(body["symbol"])]
+
+        if end_point.startswith("r/info/funding/"):
+            currency = parts[-1]
+            rate = self.script.get_rate(currency)
+            return 200, ["sym", currency, [rate, rate, 2, 2]]
+
+        if end_point.startswith("r/funding/credits/"):
+            return 200, account.get_credits(parts[-1])
+
+        if end_point.startswith("r/funding/offers/") and parts[-1] == "hist":
+            return (
+                200,
+                account.get_history(
+                    parts[-2],
+                    start=int(body.get("start", 0)),
+                    end=int(body.get("end", get_timestamp())),
+                    limit=min(
+                        int(body.get("limit", MAX_HISTORY_ROWS)), MAX_HISTORY_ROWS
+                    ),
+                ),
+            )
+
+        if end_point.startswith("r/funding/offers/"):
+            return 200, account.get_offers(parts[-1])
+
+        if end_point == "w/funding/offer/submit":
+            offer = account.add_offer(
+                body["symbol"],
+                float(body["amount"]),
+                float(body["rate"]),
+                int(body["period"]),
+            )
+            return (
+                200,
+                get_notification(
+                    "fon-req",
+                    get_offer_row(offer, "ACTIVE", offer.mts_created),
+                    "SUCCESS",
+                    f"Submitting funding offer of {offer.amount} {offer.currency[1:]} "
+                    f"at {round(offer.rate * 100, 4)}% for {offer.period} days.",
+                ),
+            )
+
+        if end_point == "w/funding/offer/cancel":
+            cancelled = account.cancel_offer(int(body["id"]))
+            if cancelled is None:
+                return 500, ["error", 10001, "offer not found"]
+            return (
+                200,
+                get_notification(
+                    "foc-req",
+                    get_offer_row(cancelled, "ACTIVE", get_timestamp()),
+                    "SUCCESS",
+                    f"Funding offer #{cancelled.id} cancelled.",
+                ),
+            )
+
+        if end_point == "w/funding/offer/cancel/all":
+            count = account.cancel_all_offers(f"f{body['currency']}")
+            return (
+                200,
+                get_notification(
+                    "foc_all-req",
+                    None,
+                    "SUCCESS",
+                    f"{count} funding offers cancelled.",
+                ),
+            )
+
+        return 404, ["error", 10020, "not found"]
+
+    def _get_candles(self, key: str, section: str, query: Dict[str, str]) -> Any:
+        # trade:{duration}m:{currency}:p{period}, one candle every duration minutes
+        _, timeframe, currency = key.split(":")[:3]
+        duration = int(timeframe[:-1])
+        if section == "last":
+            return self.script.get_candle(currency, duration)
+
+        step = duration * MINUTE
+        now = get_timestamp()
+        end = int(query.get("end", now))
+        start = int(query.get("start", end - 100 * step))
+        limit = min(int(query.get("limit", 100)), MAX_CANDLE_ROWS)
+
+        rate = self.script.get_rate(currency)
+        candles = [
+            [mts, rate * 0.99, rate, rate * 1.05, rate * 0.95, 1000.0]
+            for mts in range(start - start % step + step, end + 1, step)
+        ]
+        if query.get("sort") == "1":
+            return candles[:limit]
+        return list(reversed(candles))[:limit]
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="MockBitfinexServer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+__all__ = [
+    "MockAccount",
+    "MockBitfinexServer",
+    "MockOffer",
+]
@@ -0,0 +1,319 @@
+import json
+import time
+import base64
+import random
+import select
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+
+from typing import Any, Dict, List, Optional, Set
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class MarketScript(object):
+    # Scripted funding market, a seeded random walk around a daily rate per currency
+    def __init__(self, rates: Optional[Dict[str, float]] = None, seed: int = 0):
+        self._rates = dict(rates or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def get_rate(self, currency: str) -> float:
+        with self._lock:
+            return self._rates.setdefault(currency, 0.0003)
+
+    def step(self, currency: str) -> float:
+        with self._lock:
+            rate = self._rates.setdefault(currency, 0.0003)
+            rate = max(0.000001, rate * (1 + self._random.uniform(-0.02, 0.02)))
+            self._rates[currency] = rate
+            return rate
+
+    def get_ticker(self, currency: str) -> List[Any]:
+        # Funding ticker in the WebSocket layout (the REST layout prefixes the symbol)
+        rate = self.get_rate(currency)
+        return [
+            rate,  # FRR
+            rate * 0.98,  # BID
+            30,  # BID_PERIOD
+            100000.0,  # BID_SIZE
+            rate * 1.02,  # ASK
+            2,  # ASK_PERIOD
+            100000.0,  # ASK_SIZE
+            0.0,  # DAILY_CHANGE
+            0.0,  # DAILY_CHANGE_RELATIVE
+            rate,  # LAST_PRICE
+            1000000.0,  # VOLUME
+            rate * 1.1,  # HIGH
+            rate * 0.9,  # LOW
+            None,
+            None,
+            1000000.0,  # FRR_AMOUNT_AVAILABLE
+        ]
+
+    def get_candle(self, currency: str, duration: int) -> List[Any]:
+        rate = self.get_rate(currency)
+        period_start = int(time.time() // (duration * 60)) * duration * 60
+        return [
+            period_start * 1000,  # MTS
+            rate * 0.99,  # OPEN
+            rate,  # CLOSE
+            rate * 1.05,  # HIGH
+            rate * 0.95,  # LOW
+            1000.0,  # VOLUME
+        ]
+
+
+def encode_frame(payload: bytes, opcode: int = OPCODE_TEXT) -> bytes:
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+
+    return header + payload
+
+
+class MarketDataHandler(socketserver.BaseRequestHandler):
+    server: "MockMarketDataServer"
+
+    def setup(self):
+        self._buffer = b""
+        self._next_channel_id = 1
+        # chanId -> (currency, candle duration in minutes or None for the ticker)
+        self._channels: Dict[int, Any] = dict()
+
+    def handle(self):
+        if not self._handshake():
+            return
+
+        self.server.register(self.request)
+        try:
+            self._send_json({"event": "info", "version": 2})
+            self._serve()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.server.unregister(self.request)
+
+    def _handshake(self) -> bool:
+        while b"\r\n\r\n" not in self._buffer:
+            data = self.request.recv(4096)
+            if not data:
+                return False
+            self._buffer += data
+
+        request, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        key = headers.get("sec-websocket-key")
+        if not key:
+            self.request.sendall(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+        ).decode("ascii")
+        self.request.sendall(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode("ascii")
+        )
+        return True
+
+    def _serve(self):
+        next_update = time.monotonic() + self.server.interval
+        next_heartbeat = time.monotonic() + self.server.heartbeat_interval
+
+        while not self.server.is_closing():
+            timeout = max(0.0, min(next_update, next_heartbeat) - time.monotonic())
+            if self._buffer or select.select([self.request], [], [], timeout)[0]:
+                if not self._read_frame():
+                    return
+
+            now = time.monotonic()
+            if now >= next_update:
+                self._publish_updates()
+                next_update = now + self.server.interval
+            if now >= next_heartbeat:
+                for channel_id in self._channels:
+                    self._send_json([channel_id, "hb"])
+                next_heartbeat = now + self.server.heartbeat_interval
+
+    def _recv_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            data = self.request.recv(4096)
+            if not data:
+                raise ValueError("Connection closed")
+            self._buffer += data
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_frame(self) -> bool:
+        first, second = self._recv_exact(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+
+        if length == 126:
+            length = struct.unpack("!H", self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._recv_exact(8))[0]
+
+        mask = self._recv_exact(4) if second & 0x80 else b"\x00\x00\x00\x00"
+        payload = bytes(
+            byte ^ mask[index % 4]
+            for index, byte in enumerate(self._recv_exact(length))
+        )
+
+        if opcode == OPCODE_CLOSE:
+            self.request.sendall(encode_frame(payload[:2], OPCODE_CLOSE))
+            return False
+        elif opcode == OPCODE_PING:
+            self.request.sendall(encode_frame(payload, OPCODE_PONG))
+        elif opcode == OPCODE_TEXT:
+            self._handle_message(json.loads(payload.decode("utf8")))
+        return True
+
+    def _send_json(self, message: Any):
+        self.request.sendall(encode_frame(json.dumps(message).encode("utf8")))
+
+    def _handle_message(self, message: Dict[str, Any]):
+        if message.get("event") != "subscribe":
+            return
+
+        channel_id = self._next_channel_id
+        self._next_channel_id += 1
+        script = self.server.script
+
+        if message.get("channel") == "ticker":
+            currency = message["symbol"]
+            self._channels[channel_id] = (currency, None)
+            self._send_json(
+                {
+                    "event": "subscribed",
+                    "channel": "ticker",
+                    "chanId": channel_id,
+                    "symbol": currency,
+                    "currency": currency[1:],
+                }
+            )
+            self._send_json([channel_id, script.get_ticker(currency)])
+        elif message.get("channel") == "candles":
+            # Key format: trade:{duration}m:{currency}:p{period}
+            _, timeframe, currency, _ = message["key"].split(":")
+            duration = int(timeframe[:-1])
+            self._channels[channel_id] = (currency, duration)
+            self._send_json(
+                {
+                    "event": "subscribed",
+                    "channel": "candles",
+                    "chanId": channel_id,
+                    "key": message["key"],
+                }
+            )
+            self._send_json([channel_id, [script.get_candle(currency, duration)]])
+        else:
+            self._send_json(
+                {"event": "error", "msg": "channel: unknown", "code": 10300}
+            )
+
+    def _publish_updates(self):
+        script = self.server.script
+        updated: Set[str] = set()
+
+        for channel_id, (currency, duration) in self._channels.items():
+            if currency not in updated:
+                script.step(currency)
+                updated.add(currency)
+
+            if duration is None:
+                self._send_json([channel_id, script.get_ticker(currency)])
+            else:
+                self._send_json([channel_id, script.get_candle(currency, duration)])
+
+
+class MockMarketDataServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    # Offline stand-in for the Bitfinex public WebSocket feed, serving the ticker and
+    # candle channels from a MarketScript
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        interval: float = 1.0,
+        heartbeat_interval: float = 15.0,
+        script: Optional[MarketScript] = None,
+    ):
+        super().__init__((host, port), MarketDataHandler)
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.script = script or MarketScript()
+        self._connections: Set[socket.socket] = set()
+        self._connections_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get_url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    def register(self, connection: socket.socket):
+        with self._connections_lock:
+            self._connections.add(connection)
+
+    def unregister(self, connection: socket.socket):
+        with self._connections_lock:
+            self._connections.discard(connection)
+
+    def is_closing(self) -> bool:
+        return self._closing.is_set()
+
+    def drop_connections(self):
+        # Simulates a network drop so clients have to reconnect and resubscribe
+        with self._connections_lock:
+            connections = list(self._connections)
+
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="MockMarketDataServer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._closing.set()
+        self.drop_connections()
+        self.shutdown()
+        self.server_close()
+
+
+__all__ = [
+    "MarketScript",
+    "MockMarketDataServer",
+]
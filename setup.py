@@ -10,5 +10,10 @@ setup(
     packages=["funding_bot"],
     include_package_data=True,
     install_requires=["requests", "tabulate", "mypy", "boto3", "click", "sentry-sdk"],
+    extras_require={
+        "stream": ["websocket-client"],
+        "backtest": ["numpy"],
+        "fast": ["orjson"],
+    },
     entry_points={"console_scripts": ["funding_bot=funding_bot.cli:main"]},
 )
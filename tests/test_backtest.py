@@ -0,0 +1,45 @@
+import random
+import logging
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from funding_bot.bot.backtest import MINUTE, get_offer_rates
+from funding_bot.bot.tracker import Tracker
+
+# Not aligned to a 30 minutes boundary
+START_MINUTE = 26666667
+
+
+def get_candles(minutes: int, seed: int = 0) -> np.ndarray:
+    # 1 minute candles with a quarter of the minutes missing, as when nothing trades
+    generator = random.Random(seed)
+    rows = []
+    for minute in range(minutes):
+        if minute and generator.random() < 0.25:
+            continue
+        high = generator.uniform(0.0002, 0.0004)
+        rows.append(
+            [(START_MINUTE + minute) * MINUTE, high, high, high, high * 0.9, 1.0]
+        )
+    return np.array(rows, dtype=np.float64)
+
+
+@pytest.mark.parametrize("duration", [5, 30])
+def test_offer_rates_match_tracker(duration):
+    candles = get_candles(200)
+    rates = get_offer_rates(candles, duration)
+
+    # Every minute, with or without a trade, against a tracker warm started from the
+    # candles up to that minute
+    for minute in range(len(rates)):
+        mts = (START_MINUTE + minute) * MINUTE
+        history = candles[candles[:, 0] <= mts].tolist()
+        tracker = Tracker("fUSD", logging.getLogger("test"))
+        tracker.get_candle_history = lambda duration, period, start: history
+        assert tracker.warm_start()
+
+        assert rates[minute] == pytest.approx(
+            tracker.determine_offer_rate(period=duration)
+        )
@@ -0,0 +1,45 @@
+import logging
+import socket
+
+import pytest
+
+from funding_bot.bot.notifier import TelegramNotifier
+from funding_bot.bot.outbox import NotificationOutbox
+from funding_bot.bot.transport import configure_transport
+
+
+@pytest.fixture
+def chat():
+    # Accepts connections and never answers
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    configure_transport(pool_size=2, timeout=1.0, budgets=[])
+
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}/sendMessage?text="
+
+    listener.close()
+
+
+def test_close_keeps_unsent_messages_in_outbox(chat, tmp_path):
+    path = str(tmp_path / "outbox.db")
+    notifier = TelegramNotifier(
+        logging.getLogger("test"),
+        # The first message is in flight while the others are still queued
+        coalesce_window=0.0,
+        outbox=NotificationOutbox(path),
+    )
+    for index in range(3):
+        notifier.send(chat, f"message {index}")
+
+    assert not notifier.close(timeout=0.5)
+
+    outbox = NotificationOutbox(path, max_age=float("inf"))
+    try:
+        assert sorted(message.message for message in outbox.get_due(now=1e12)) == [
+            "message 0",
+            "message 1",
+            "message 2",
+        ]
+    finally:
+        outbox.close()
@@ -0,0 +1,34 @@
+import datetime as dt
+
+from email.utils import format_datetime
+
+import pytest
+
+from funding_bot.bot.ratelimit import RequestScheduler, parse_retry_after
+
+
+@pytest.mark.parametrize(
+    "retry_after, expected",
+    [
+        ("5", 5.0),
+        ("-3", 0.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+        ("soon", None),
+        ("nan", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_retry_after(retry_after, expected):
+    assert parse_retry_after(retry_after) == expected
+
+
+def test_parse_retry_after_date():
+    date = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=30)
+    assert 28 < parse_retry_after(format_datetime(date, usegmt=True)) <= 30
+
+
+def test_rate_limited_with_unparsable_retry_after():
+    scheduler = RequestScheduler()
+    scheduler.record_response("v2/tickers", 429, "Wed, 21 Oct 2026 07:28:00 GMT")
+    scheduler.record_response("v2/tickers", 429, "soon")
@@ -0,0 +1,40 @@
+import logging
+
+from funding_bot.bot.store import TickStore
+from funding_bot.bot.tracker import RateData
+
+RATE_DATA = RateData(
+    flash_return_rate=0.0002,
+    bid=0.0002,
+    bid_period=2,
+    ask=0.0003,
+    ask_period=30,
+    last=0.00025,
+    high=0.0004,
+    low=0.0001,
+)
+
+
+def test_writer_survives_bad_batch(tmp_path):
+    store = TickStore(
+        str(tmp_path / "ticks.db"), logging.getLogger("test"), batch_size=1
+    )
+    try:
+        # Cannot be bound to a SQLite parameter
+        store.record_rate("fUSD", RATE_DATA._replace(bid=object()), mts=1)
+        assert store.flush(timeout=5)
+
+        store.record_rate("fUSD", RATE_DATA, mts=2)
+        assert store.flush(timeout=5)
+        assert [sample.mts for sample in store.query_rates("fUSD", 0, 10)] == [2]
+    finally:
+        store.close()
+
+
+def test_flush_gives_up_without_writer(tmp_path):
+    store = TickStore(str(tmp_path / "ticks.db"), logging.getLogger("test"))
+    store.close()
+
+    store.record_rate("fUSD", RATE_DATA, mts=1)
+    assert not store.flush(timeout=0.1)
+    store.close(timeout=0.1)
@@ -0,0 +1,55 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from funding_bot.bot.endpoints import configure_endpoints, get_endpoints
+from funding_bot.bot.funding import Credentials, FundingBot
+from funding_bot.bot.transport import configure_transport
+from funding_bot.mock.server import MockBitfinexServer
+
+API_KEY = "test"
+API_SECRET_KEY = "test-secret"
+
+
+@pytest.fixture
+def server():
+    previous = get_endpoints()
+    # Latency widens the window between signing a request and the nonce check
+    server = MockBitfinexServer(latency=0.005, api_secret_key=API_SECRET_KEY)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    configure_endpoints(api_url=server.get_url(), public_api_url=server.get_url())
+    configure_transport(pool_size=8, timeout=5.0, budgets=[])
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    configure_endpoints(
+        api_url=previous.api_url, public_api_url=previous.public_api_url
+    )
+
+
+def test_concurrent_signed_requests_are_accepted(server, caplog):
+    credentials = Credentials(
+        api_key=API_KEY, api_secret_key=API_SECRET_KEY, telegram_api=None
+    )
+    logger = logging.getLogger("test")
+
+    def read_history(index: int):
+        # A body per request, so no response comes from the snapshot cache
+        return FundingBot.send_api_request(
+            credentials, "v2/auth/r/funding/offers/fUSD/hist", {"start": index}, logger
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(read_history, range(80)))
+
+    assert server.get_request_counts()["v2/auth/r"] == 80
+    assert [
+        record.message for record in caplog.records if "failed" in record.message
+    ] == []
+    assert all(result is not None for result in results)